@@ -0,0 +1,18 @@
+#########################################################
+# Helper modules for the automated pore analysis
+#
+# © 2019 Florian Kleiner
+#   Bauhaus-Universität Weimar
+#   Finger-Institut für Baustoffkunde
+#
+#########################################################
+
+# default pore size ranges in nm or nm², depending on parameter -p!
+defaultPoreSizeRangeArray = [ 0, 1, 2, 4, 8, 16, 31.5, 63, 125, 250, 500, 1000, 2000, 4000, 8000, 16000, 31500, 63000, 125000, 250000, 500000, 1000000, 2000000 ]
+
+def analyse_folder( path, config = None ):
+    # analyses a folder like start_pore_analysis.py and returns { directory: FolderResult }
+    # config: settings overriding pore_analysis.analysis.defaultConfig
+    # the analysis modules are only imported when called, so importing the package stays cheap
+    from pore_analysis import analysis
+    return analysis.analyseFolder( path, config )
@@ -0,0 +1,13 @@
+#########################################################
+# Headless command line of the pore analysis
+#
+# usage: python -m pore_analysis [options] <directory> [<directory> ...]
+#        (the options of start_pore_analysis.py, see -h)
+#
+#########################################################
+
+import sys
+
+from pore_analysis import cli
+
+cli.main( [ "python -m pore_analysis" ] + sys.argv[1:] )
@@ -0,0 +1,680 @@
+#########################################################
+# Pore analysis of a folder
+#
+# analyseFolder( path, config ) runs the whole analysis of
+# start_pore_analysis.py and returns the FolderResult of every
+# analysed folder. All settings are taken from config (missing
+# keys use defaultConfig), every call works on its own copy of
+# them, so folders can be analysed one after the other or from
+# several threads of a batch scheduler (one folder per thread,
+# the shared metadata caches and the trace are locked, a trace
+# is started once for the process). numpy, PIL and scipy are
+# only imported once images are analysed.
+#
+# from pore_analysis import analyse_folder
+# folderResults = analyse_folder( directory, { 'useNumpyEngine': True, 'runGnuPlot': False } )
+# folderResults[directory].getMeanPercents()
+#
+#########################################################
+
+import os
+import time
+
+from pore_analysis import defaultPoreSizeRangeArray
+from pore_analysis import manifest, metadata, trace, watch
+
+#### directory definitions
+outputDir_Pores = "/pores/"
+outputDir_ThresholdSweep = "/threshold_sweep/"
+outputDir_Preview = "/preview/"
+#suffix_Pores = "_pores_sqnm.csv"
+suffix_Pores = "_pores_sqpx.csv"
+# the macros and the Fiji worker script are next to start_pore_analysis.py
+home_dir = os.path.dirname( os.path.dirname( os.path.realpath( __file__ ) ) )
+
+# images stored by the ImageJ macros (bit flags of the last macro argument)
+storeCutImage = 1
+storeProcessedImage = 2
+maskStorageFlags = { 'compact': 8, 'tiff': 4, 'none': 0 } # zipped TIFF, TIFF
+
+# x axis of the plot for the pore descriptors of morphology.descriptorNames and the inscribed radius of granulometry
+binningVariableLabels = {
+    'equivalentDiameter': 'Äquivalentdurchmesser in nm',
+    'perimeter': 'Porenumfang in nm',
+    'feretMax': 'maximaler Feret-Durchmesser in nm',
+    'feretMin': 'minimaler Feret-Durchmesser in nm',
+    'aspectRatio': 'Seitenverhältnis',
+    'centroidX': 'Schwerpunkt x in nm',
+    'centroidY': 'Schwerpunkt y in nm',
+    'inscribedRadius': 'Radius des größten einbeschriebenen Kreises in nm'
+}
+
+defaultConfig = {
+    'runImageJ': True, # False: only read existing ImageJ results (-i)
+    'useNumpyEngine': False, # segment the images in-process instead of ImageJ (-n)
+    'runGnuPlot': True,
+    'printGnuPlotSums': False,
+    'openPlot': False, # open the PDF of gnuplot using the default viewer
+    'showDebuggingOutput': False,
+    'calculatePoreDiameter': False,
+    'doSpeckleCleaning': 1,
+    'doRemoveBorderPercent': 0,
+    'outputType': 0, # standard output type (y-axis value) is area-%
+    'thresholdLimit': 140,
+    'infoBarHeight': 63, # replaced by the height found in the metadata
+    'poreSizeRangeArray': defaultPoreSizeRangeArray, # in nm or nm², depending on calculatePoreDiameter!
+    'binningVariable': 'area', # pore descriptor binned against poreSizeRangeArray (see morphology.descriptorNames and granulometry.binningVariable, in-process engine)
+    'jobs': 1, # number of worker processes
+    'fijiWorkers': 0, # number of persistent Fiji processes analysing single images (0: one Fiji per image)
+    'thresholdSweep': [], # threshold limits evaluated instead of thresholdLimit
+    'previewFactor': 0, # >1: quick-look of images downsampled by this factor using the in-process engine
+    'previewMaxError': 1.0, # Area-%, images with a larger estimated error in a resolved size range are analysed at full resolution
+    'backgroundShrink': 1, # 1: exact background of the in-process engine, >1: estimated on an image shrunk by this factor, 0: automatic
+    'memoryLimit': 0, # MB per worker process, larger images are segmented in tiles by the in-process engine (0: no limit)
+    'maskStorage': None, # pore masks: 'compact' (bit-packed / zipped TIFF of ImageJ), 'tiff' (uncompressed) or 'none', None: see getDefaultMaskStorage()
+    'keepIntermediates': False, # store cut/*-cut.tif and processed/*-processed.tif of ImageJ
+    # line length analysis of the in-process engine (outputType 3)
+    'minLineLength': 3, # px
+    'ignoreBorderLines': True,
+    'processHorizontalLines': True,
+    'processVerticalLines': False,
+    'watchFolder': False, # analyse new images while the microscope writes them, until Ctrl+C is pressed
+    'pollInterval': 2.0 # s
+}
+
+def createConfig( config = None ):
+    # copy of defaultConfig updated by config, including the state of a single run (scale of the ImageJ macro)
+    config = config or {}
+    unknownKeys = sorted( set( config ) - set( defaultConfig ) )
+    if ( len( unknownKeys ) > 0 ):
+        raise ValueError( "unknown setting(s): " + ', '.join( unknownKeys ) )
+    settings = dict( defaultConfig )
+    settings.update( config )
+    settings['poreSizeRangeArray'] = list( settings['poreSizeRangeArray'] )
+    settings['thresholdSweep'] = list( settings['thresholdSweep'] )
+    if ( len( settings['thresholdSweep'] ) > 0 ):
+        if ( settings['outputType'] == 3 ):
+            print( 'line length output is not supported by the threshold sweep, using area-% instead!' )
+            settings['outputType'] = 0
+        settings['useNumpyEngine'] = True
+    if ( settings['previewFactor'] > 1 ):
+        if ( len( settings['thresholdSweep'] ) > 0 or settings['watchFolder'] ):
+            print( 'the preview is not supported by the threshold sweep and the watch mode, using full resolution instead!' )
+            settings['previewFactor'] = 0
+        else:
+            if ( settings['outputType'] == 3 ):
+                print( 'line length output is not supported by the preview, using area-% instead!' )
+                settings['outputType'] = 0
+            settings['useNumpyEngine'] = True
+    if ( settings['binningVariable'] != 'area' ):
+        from pore_analysis import granulometry, morphology
+        if ( settings['binningVariable'] not in morphology.descriptorNames and settings['binningVariable'] != granulometry.binningVariable ):
+            print( 'unknown binning variable ' + str( settings['binningVariable'] ) + ', using area instead!' )
+            settings['binningVariable'] = 'area'
+        else:
+            # the descriptors and inscribed radii are measured on the pore mask of the in-process engine
+            if ( settings['outputType'] == 3 ):
+                print( 'line length output is not supported by the binning variable, using area-% instead!' )
+                settings['outputType'] = 0
+            if ( settings['calculatePoreDiameter'] ):
+                print( 'the pore diameter is replaced by the binning variable ' + settings['binningVariable'] + '!' )
+                settings['calculatePoreDiameter'] = False
+            if ( settings['previewFactor'] > 1 ):
+                print( 'the preview only bins the pore area, using full resolution instead!' )
+                settings['previewFactor'] = 0
+            settings['useNumpyEngine'] = True
+    if ( settings['maskStorage'] is None ):
+        settings['maskStorage'] = getDefaultMaskStorage( settings['useNumpyEngine'] )
+    elif ( settings['maskStorage'] not in maskStorageFlags ):
+        print( 'unknown mask storage ' + str( settings['maskStorage'] ) + ', using ' + getDefaultMaskStorage( settings['useNumpyEngine'] ) + ' instead!' )
+        settings['maskStorage'] = getDefaultMaskStorage( settings['useNumpyEngine'] )
+    # reset outputType to 2 (particle count)!
+    if ( settings['calculatePoreDiameter'] ):
+        settings['outputType'] = 2
+    if ( settings['outputType'] not in ( 0, 1, 2, 3 ) ):
+        settings['outputType'] = 0
+    if ( settings['memoryLimit'] > 0 and settings['useNumpyEngine'] ):
+        # only the pore areas are segmented in tiles, and the tiles leave no mask
+        if ( settings['outputType'] == 3 or settings['binningVariable'] != 'area' or len( settings['thresholdSweep'] ) > 0 ):
+            print( 'line lengths, pore descriptors, inscribed radii and threshold sweeps need the whole image, the memory limit does not apply to them!' )
+        if ( settings['maskStorage'] != 'none' ):
+            if ( config.get( 'maskStorage' ) is not None ):
+                print( 'the masks of images segmented in tiles can not be stored, using mask storage none instead!' )
+            settings['maskStorage'] = 'none'
+    settings['metricScale'] = 0
+    settings['pixelScale'] = 0
+    settings['pipeline'] = 'single' # image enhancements of pore_analysis_single_file.ijm, see getScaleFolderConfig()
+    return settings
+
+def getDefaultMaskStorage( useNumpyEngine ):
+    # ImageJ keeps writing pores/*-masked.tif, which the Line_Length_Counter plugin reads
+    return 'compact' if useNumpyEngine else 'tiff'
+
+def isImageFile( filename ):
+    return ( filename.endswith(".jpg") or filename.endswith(".JPG") or filename.endswith(".tif") or filename.endswith(".TIF") )
+
+def getImageJOptions( config ):
+    return "|" + str(config['thresholdLimit']) + "|" + str(config['infoBarHeight']) + "|" + str(config['metricScale']) + "|" + str(config['pixelScale']) + "|" + str(config['doSpeckleCleaning'])
+
+def getImageJStoreFlags( config ):
+    # images the macros store besides the particle tables
+    storeFlags = maskStorageFlags[config['maskStorage']]
+    if ( config['keepIntermediates'] ):
+        storeFlags += storeCutImage + storeProcessedImage
+    return storeFlags
+
+def getImageJArgument( directory, file, config ):
+    # macro argument of pore_analysis_single_file.ijm
+    return directory + "/" + file + getImageJOptions( config ) + "|" + str(config['doRemoveBorderPercent']) + "|" + str( getImageJStoreFlags( config ) ) + "|" + config['pipeline']
+
+def getImageJCommand( directory, file, config ):
+    if ( file == "" ) :
+        command = "ImageJ-win64.exe -macro \"" + home_dir +"\pore_analysis.ijm\" \"" + directory + "/" + getImageJOptions( config ) + "|" + str( getImageJStoreFlags( config ) ) + "\""
+    else:
+        command = "ImageJ-win64.exe -macro \"" + home_dir +"\pore_analysis_single_file.ijm\" \"" + getImageJArgument( directory, file, config ) + "\""
+    return command
+
+def getFijiWorkerCommand():
+    return "ImageJ-win64.exe --headless --console --run \"" + home_dir + "\\pore_analysis_worker.py\" \"macroPath='" + home_dir + "\\pore_analysis_single_file.ijm'\""
+
+def runFijiWorkers( tasks, config ):
+    # the single image macros of the tasks are run by persistent Fiji processes instead of one Fiji per image
+    imageJTasks = [ task for task in tasks if task['command'] is not None ]
+    if ( config['fijiWorkers'] < 1 or len( imageJTasks ) == 0 ):
+        return
+    from pore_analysis import fiji
+    fiji.runJobs( getFijiWorkerCommand(), [ task['macroArgument'] for task in imageJTasks ], [ task['filename'] for task in imageJTasks ], config['fijiWorkers'], config['showDebuggingOutput'] )
+    for task in imageJTasks:
+        task['command'] = None
+
+def getTaskOptions( config ):
+    # everything a worker process needs to know to analyse a single image
+    return {
+        'thresholdLimit': config['thresholdLimit'],
+        'infoBarHeight': config['infoBarHeight'],
+        'doSpeckleCleaning': config['doSpeckleCleaning'],
+        'doRemoveBorderPercent': config['doRemoveBorderPercent'],
+        'useNumpyEngine': config['useNumpyEngine'],
+        'outputType': config['outputType'],
+        'calculatePoreDiameter': config['calculatePoreDiameter'],
+        'poreSizeRangeArray': config['poreSizeRangeArray'],
+        'binningVariable': config['binningVariable'],
+        'showDebuggingOutput': config['showDebuggingOutput'],
+        'minLineLength': config['minLineLength'],
+        'ignoreBorderLines': config['ignoreBorderLines'],
+        'processHorizontalLines': config['processHorizontalLines'],
+        'processVerticalLines': config['processVerticalLines'],
+        'memoryLimit': config['memoryLimit'],
+        'backgroundShrink': config['backgroundShrink'],
+        'maskStorage': config['maskStorage'],
+        'previewFactor': config['previewFactor'],
+        'pipeline': config['pipeline'],
+        'trace': trace.getSettings()
+    }
+
+def getPixelSizeFromMetaData( directory, filename, config ):
+    pixelSize = metadata.getPixelSize( metadata.getImageHeader( directory, filename ) )
+    if ( pixelSize > 0 ):
+        config['pixelScale'] = 1
+        config['metricScale'] = pixelSize
+        print( " detected image scale: " + str( pixelSize ) + " nm / px" )
+    return pixelSize
+
+def getInfoBarHeightFromMetaData( directory, filename, config ):
+    header = metadata.getImageHeader( directory, filename )
+    contentHeight = metadata.getContentHeight( header )
+    if ( contentHeight > 0 ):
+        config['infoBarHeight'] = int( header['height'] - contentHeight )
+        print( " detected info bar height: " + str( config['infoBarHeight'] ) + " px" )
+    else:
+        print( " info bar height not detected" )
+    return config['infoBarHeight']
+
+def scaleInMetaData( directory, config ):
+    with trace.stage( 'metadata', directory=directory ):
+        result = False
+        for file in os.listdir(directory):
+            filename = os.fsdecode(file)
+            if ( isImageFile( filename ) ):
+                if getPixelSizeFromMetaData( directory, filename, config ) > 0:
+                    getInfoBarHeightFromMetaData( directory, filename, config )
+                    result = True
+                    break
+        metadata.saveMetaDataCaches()
+        return result
+
+def matchSubdirName( subDir, config ):
+    metricScaleArray = [ 400, 500, 2000 ] #nm
+    pixelScaleArray = [ 275, 170, 345 ] # px
+    result = False
+    for i in range(len(metricScaleArray)):
+        if subDir == ( str( metricScaleArray[i] ) + "nm" ):
+            result = True
+            config['metricScale'] = metricScaleArray[i]
+            config['pixelScale'] = pixelScaleArray[i]
+    return result
+
+def getSegmentationParameters( pixelSize, config ):
+    # parameters which change the outputs of the segmentation of an image
+    parameters = {
+        'thresholdLimit': config['thresholdLimit'],
+        'infoBarHeight': config['infoBarHeight'],
+        'scale': pixelSize,
+        'doSpeckleCleaning': config['doSpeckleCleaning'],
+        'doRemoveBorderPercent': config['doRemoveBorderPercent']
+    }
+    # only stored if used, so manifests of an exact background stay valid
+    if ( config['useNumpyEngine'] and config['backgroundShrink'] != 1 ):
+        parameters['backgroundShrink'] = config['backgroundShrink']
+    if ( config['maskStorage'] != getDefaultMaskStorage( config['useNumpyEngine'] ) ):
+        parameters['maskStorage'] = config['maskStorage']
+    if ( config['keepIntermediates'] and not config['useNumpyEngine'] ):
+        parameters['keepIntermediates'] = True
+    if ( config['pipeline'] != 'single' ):
+        parameters['pipeline'] = config['pipeline']
+    return parameters
+
+def getScaleFolderConfig( config ):
+    # scale folders are analysed by pore_analysis.ijm, images segmented one by one (ImageJ or in-process) use its
+    # image enhancements too, so all results of a folder are comparable (pore_analysis.ijm keeps the border)
+    folderConfig = dict( config )
+    folderConfig['pipeline'] = 'folder'
+    folderConfig['doRemoveBorderPercent'] = 0
+    return folderConfig
+
+def createImageTasks( directory, config, forcedScale = None, runImageJPerImage = False, readyFiles = None ):
+    # returns the tasks and the manifest of the folder (None if nothing will be segmented)
+    # readyFiles: only these images are analysed, the other ones are still being written (watch mode)
+    from pore_analysis import parallel
+    with trace.stage( 'image list', directory=directory ):
+        forcedScale = forcedScale or 1
+        engine = 'numpy' if config['useNumpyEngine'] else ( 'imagej' if runImageJPerImage else None )
+        imageManifest = manifest.Manifest( directory ) if engine is not None else None
+        if ( engine == 'numpy' and not os.path.isdir( directory + outputDir_Pores ) ):
+            os.mkdir( directory + outputDir_Pores )
+        tasks = []
+        imageFiles = []
+        for file in os.listdir(directory):
+            filename = os.fsdecode(file)
+            if ( isImageFile( filename ) ):
+                imageFiles.append( filename )
+                if ( readyFiles is not None and filename not in readyFiles ):
+                    continue
+                csv_filename = os.path.splitext(filename)[0]
+                if ( engine is None and not os.path.exists( directory + outputDir_Pores +csv_filename + suffix_Pores ) ):
+                    print(csv_filename + suffix_Pores + " not found!")
+                    continue
+                pixelSize = getPixelSizeFromMetaData( directory, filename, config )
+                if pixelSize == 0:
+                    pixelSize = forcedScale
+                    if forcedScale == 1:
+                        print( "Skalierung vermutlich fehlerhaft!" )
+                command = None
+                upToDate = False
+                imageSize = None
+                parameters = getSegmentationParameters( pixelSize, config )
+                if ( engine is not None ):
+                    # only changed images or images analysed using other parameters are segmented again
+                    upToDate = imageManifest.isUpToDate( filename, parameters, engine )
+                    if ( upToDate ):
+                        print( " " + filename + " is unchanged, using previous results" )
+                        imageSize = imageManifest.images[filename]['imageSize']
+                    else:
+                        imageManifest.invalidate( filename, engine )
+                        if ( engine == 'imagej' ):
+                            print( " Analysing " + filename + ";" )
+                            command = getImageJCommand( directory, filename, config )
+                task = parallel.createImageTask( directory, filename, pixelSize, getTaskOptions( config ), command, upToDate, imageSize )
+                task['engine'] = engine
+                task['segmentationParameters'] = parameters
+                task['macroArgument'] = getImageJArgument( directory, filename, config ) if command is not None else None
+                tasks.append( task )
+            elif ( config['showDebuggingOutput'] ) :
+                print( "------" )
+                print(filename + " is no Jpg / Tiff! Skipping!")
+        metadata.saveMetaDataCaches()
+        if ( imageManifest is not None ):
+            imageManifest.removeMissingImages( imageFiles )
+            imageManifest.save()
+        return tasks, imageManifest
+
+def updateManifest( imageManifest, tasks, imageResults ):
+    # records the segmented images of this run
+    if ( imageManifest is None ):
+        return
+    for task, imageResult in zip( tasks, imageResults ):
+        if ( not task['upToDate'] and imageResult is not None ):
+            imageManifest.update( task['filename'], task['segmentationParameters'], task['engine'], ( imageResult.width, imageResult.height ) )
+    imageManifest.save()
+
+def processData( imageResult, config ):
+    # pore analysis
+    poreSizeRangeArray = config['poreSizeRangeArray']
+    imageArea = imageResult.imageArea
+    poreSizeArray = imageResult.poreSizeArray
+    poreSizePercentArray = imageResult.poreSizePercentArray
+    poreCountArray = imageResult.poreCountArray
+    print( " image area: " + str( imageResult.width * imageResult.height ) + " px² | " + str( imageArea ) + " nm²" )
+    print ( " processed elements: " + str( imageResult.processedElements ) )
+    fullAreaPoresSum = 0
+    binningVariable = config['binningVariable']
+    from pore_analysis import granulometry
+    binPixels = ( binningVariable == granulometry.binningVariable )
+    if ( binningVariable != 'area' and not binPixels ):
+        from pore_analysis import morphology
+        binningUnit = morphology.descriptorUnits[morphology.getDescriptorIndex( binningVariable )]
+    for i in range(len(poreSizeRangeArray)):
+        debugMessage = '  - ' + str( poreSizeRangeArray[i] ) + ' nm: ' + str( poreCountArray[i] ) + ( ' px (' if binPixels else 'x (' ) + str( round( poreSizePercentArray[i], 2 ) ) + ' Area-%, '
+        if ( binningVariable != 'area' and not binPixels ):
+            debugMessage += 'Σ ' + binningVariable + ' ' + str( round( poreSizeArray[i], 2 ) ) + ( ' ' + binningUnit if binningUnit != '' else '' ) + ')'
+        elif ( config['calculatePoreDiameter'] ):
+            debugMessage += 'Ø' + str( round( poreSizeArray[i], 2 ) ) + ' nm)'
+        else:
+            debugMessage += str( round( poreSizeArray[i], 2 ) ) + ' nm²)'
+        print( debugMessage )
+        # calculating summed up area for terminal output (the inscribed radii sum up the area of their pore pixels)
+        if ( binningVariable != 'area' and not binPixels ):
+            # the size sums hold the binning variable, the area-% still the pore area
+            fullAreaPoresSum += poreSizePercentArray[i] * imageArea / 100
+        elif config['calculatePoreDiameter']:
+            fullAreaPoresSum += poreSizeArray[i] * poreSizeArray[i]
+        else:
+            fullAreaPoresSum += poreSizeArray[i]
+    print( " summed up pore area: " + str( round( fullAreaPoresSum/imageArea*100, 2 ) ) + ' Area-%, ' + str( round( fullAreaPoresSum, 2) ) + ' nm²' )
+
+def processLineData( imageResult, config ):
+    # pore analysis
+    poreSizeRangeArray = config['poreSizeRangeArray']
+    lineCountArray = imageResult.poreCountArray
+    print( " image area: " + str( imageResult.width * imageResult.height ) + " px² | " + str( imageResult.imageArea ) + " nm²" )
+    print ( " processed elements: " + str( imageResult.processedElements ) )
+    for i in range(len(poreSizeRangeArray)):
+        debugMessage = '  - ' + str( poreSizeRangeArray[i] ) + ' nm: ' + str( lineCountArray[i] ) + 'x '
+        print( debugMessage )
+
+def processImageJResults( directory, tasks, imageResults, config, outputDirectory = None ):
+    # merges the image results (in task order), writes the result tables
+    # returns the FolderResult (None if there are no results) and the gnuplot plot command
+    from pore_analysis import granulometry, results
+    with trace.stage( 'result tables', directory=directory ):
+        outputDirectory = outputDirectory or directory
+        poreSizeRangeArray = config['poreSizeRangeArray']
+        outputType = config['outputType']
+        folderResult = None
+        gnuplotBefehl = 'plot '
+        gnuplotPlotID = 1
+        if config['useNumpyEngine'] or os.path.isdir(directory + outputDir_Pores):
+            imageFiles = []
+            foundResults = []
+            for task, imageResult in zip( tasks, imageResults ):
+                if ( imageResult is None ):
+                    print(task['baseName'] + suffix_Pores + " not found!")
+                    continue
+                print("------")
+                print(task['filename'])
+                imageFiles.append( task['filename'] )
+                foundResults.append( imageResult )
+                gnuplotPlotID += 1
+                if ( outputType < 3 ):
+                    processData( imageResult, config )
+                    gnuplotBefehl += "'mr_result.csv' using 1:" + str( gnuplotPlotID ) + " title '" + imageResult.filename.replace('_', '\_') + "' with linespoints, "
+                elif ( outputType == 3 ):
+                    processLineData( imageResult, config )
+                    gnuplotBefehl += "'mr_line_result.csv' using 1:" + str( gnuplotPlotID ) + " title '" + imageResult.filename.replace('_', '\_') + "' with linespoints, "
+            folderResult = results.FolderResult( directory, poreSizeRangeArray, foundResults )
+            results.writeResultTables( folderResult, imageFiles, outputDirectory, outputType, config['calculatePoreDiameter'] )
+            if ( outputType < 3 ):
+                poreCountSumArray = folderResult.getCountSums()
+                meanPercents = folderResult.getMeanPercents()
+                # the inscribed radii count pore pixels instead of pores
+                countUnit = ' px (' if ( config['binningVariable'] == granulometry.binningVariable ) else 'x ('
+                print( "Sum for folder " + directory )
+                for i in range(len(poreSizeRangeArray)):
+                    print( '  - ' + str( poreSizeRangeArray[i] ) + ' nm: ' + str( poreCountSumArray[i] ) + countUnit + str( round( meanPercents[i], 5) ) + ' Area-%)')
+            else:
+                print( 'Line processing done?!' )
+
+            if ( config['printGnuPlotSums'] ):
+                gnuplotPlotID += 1
+                if ( outputType < 3 ):
+                    gnuplotBefehl += "'mr_result.csv' using 1:" + str( gnuplotPlotID ) + " title 'fullSum' with linespoints linewidth 3"
+
+        else:
+            print("Folder '" + outputDir_Pores + "' does not exist! Run ImageJ Macro first!")
+        return folderResult, gnuplotBefehl
+
+def analyseTaskFolders( folders, config ):
+    # folders: ( plot name, directory, tasks, manifest ), returns { directory: FolderResult }
+    from pore_analysis import parallel
+    allTasks = [ task for folder in folders for task in folder[2] ]
+    runFijiWorkers( allTasks, config )
+    imageResults = parallel.analyseTasks( allTasks, config['jobs'] )
+    folderResults = {}
+    position = 0
+    for plotName, directory, tasks, imageManifest in folders:
+        taskResults = imageResults[position:position+len( tasks )]
+        position += len( tasks )
+        updateManifest( imageManifest, tasks, taskResults )
+        folderResult, gnuplotBefehl = processImageJResults( directory, tasks, taskResults, config )
+        if ( folderResult is not None ):
+            folderResults[directory] = folderResult
+        if ( config['runGnuPlot'] ):
+            createGnuplotPlot( directory, plotName, gnuplotBefehl, config )
+    return folderResults
+
+def watchWorkingDirectory( directory, config ):
+    # analyses the folder again whenever the microscope finished writing new images, until Ctrl+C is pressed
+    # only new images are segmented, all other ones are binned from the particle store
+    runImageJPerImage = config['runImageJ'] and not config['useNumpyEngine']
+    watcher = watch.FolderWatcher( directory, config['pollInterval'] )
+    scaleDetected = False
+    folderResults = {}
+    print( "watching " + directory + " for new images, stop using Ctrl+C..." )
+    try:
+        while True:
+            newFiles, removedImages = watcher.poll()
+            if ( len( newFiles ) > 0 or removedImages ):
+                print( "======" )
+                print( time.strftime( "%H:%M:%S" ) + ": " + str( len( newFiles ) ) + " new image(s): " + ", ".join( newFiles ) )
+                if ( not scaleDetected ):
+                    # the info bar height is detected using the first image with scale metadata
+                    for filename in newFiles:
+                        if ( getPixelSizeFromMetaData( directory, filename, config ) > 0 ):
+                            getInfoBarHeightFromMetaData( directory, filename, config )
+                            scaleDetected = True
+                            break
+                tasks, imageManifest = createImageTasks( directory, config, None, runImageJPerImage, watcher.readyFiles )
+                folderResults = analyseTaskFolders( [ ( 'Plot', directory, tasks, imageManifest ) ], config )
+                print( time.strftime( "%H:%M:%S" ) + ": " + str( len( watcher.readyFiles ) ) + " image(s) analysed, waiting for new images..." )
+            time.sleep( config['pollInterval'] )
+    except KeyboardInterrupt:
+        print( "stopped watching " + directory )
+    return folderResults
+
+def runThresholdSweep( directory, config, forcedScale = None ):
+    # the preprocessed image of every file is calculated once and evaluated for all thresholds
+    # returns { threshold_sweep/<threshold> directory: FolderResult }
+    from pore_analysis import parallel
+    forcedScale = forcedScale or 1
+    thresholdSweep = config['thresholdSweep']
+    tasks = []
+    for file in os.listdir(directory):
+        filename = os.fsdecode(file)
+        if ( isImageFile( filename ) ):
+            pixelSize = getPixelSizeFromMetaData( directory, filename, config )
+            if pixelSize == 0:
+                pixelSize = forcedScale
+                if forcedScale == 1:
+                    print( "Skalierung vermutlich fehlerhaft!" )
+            task = parallel.createImageTask( directory, filename, pixelSize, getTaskOptions( config ) )
+            task['thresholds'] = thresholdSweep
+            tasks.append( task )
+    metadata.saveMetaDataCaches()
+    sweepResults = parallel.runTasks( parallel.analyseThresholdSweepTask, tasks, config['jobs'] )
+    folderResults = {}
+    for i in range(len(thresholdSweep)):
+        print( "======" )
+        print( "threshold limit " + str( thresholdSweep[i] ) )
+        outputDirectory = directory + outputDir_ThresholdSweep + str( thresholdSweep[i] )
+        os.makedirs( outputDirectory, exist_ok=True )
+        folderResult, gnuplotBefehl = processImageJResults( directory, tasks, [ imageResults[i] for imageResults in sweepResults ], config, outputDirectory )
+        if ( folderResult is not None ):
+            folderResults[outputDirectory] = folderResult
+    return folderResults
+
+def runPreview( directory, config, forcedScale = None, plotName = 'Plot' ):
+    # segments downsampled copies of all images, images with a too large estimated error are analysed at full resolution
+    # the results and the estimated errors are written to preview/, returns { preview directory: FolderResult }
+    from pore_analysis import parallel, preview
+    import numpy as np
+    forcedScale = forcedScale or 1
+    previewFactor = int( config['previewFactor'] )
+    poreSizeRangeArray = config['poreSizeRangeArray']
+    tasks = []
+    for file in os.listdir(directory):
+        filename = os.fsdecode(file)
+        if ( isImageFile( filename ) ):
+            pixelSize = getPixelSizeFromMetaData( directory, filename, config )
+            if pixelSize == 0:
+                pixelSize = forcedScale
+                if forcedScale == 1:
+                    print( "Skalierung vermutlich fehlerhaft!" )
+            tasks.append( parallel.createImageTask( directory, filename, pixelSize, getTaskOptions( config ) ) )
+    metadata.saveMetaDataCaches()
+    imageResults = parallel.runTasks( parallel.analysePreviewTask, tasks, config['jobs'] )
+    imageErrors = []
+    promotedFiles = []
+    for task, imageResult in zip( tasks, imageResults ):
+        relativeErrors = preview.getRelativeErrors( poreSizeRangeArray, imageResult.pixelSize, config['calculatePoreDiameter'] )
+        imageErrors.append( preview.getBucketErrors( imageResult, relativeErrors ) )
+        if ( preview.needsFullResolution( imageErrors[-1], config['previewMaxError'] ) ):
+            promotedFiles.append( task['filename'] )
+    print( "======" )
+    if ( len( promotedFiles ) > 0 ):
+        # analysed like a normal run, so the next full run reuses them
+        print( "analysing " + str( len( promotedFiles ) ) + " image(s) at full resolution (estimated error above " + str( config['previewMaxError'] ) + " Area-%): " + ", ".join( promotedFiles ) )
+        fullTasks, imageManifest = createImageTasks( directory, config, forcedScale, False, set( promotedFiles ) )
+        fullResults = parallel.analyseTasks( fullTasks, config['jobs'] )
+        updateManifest( imageManifest, fullTasks, fullResults )
+        fullResults = { task['filename']: imageResult for task, imageResult in zip( fullTasks, fullResults ) }
+        for i, task in enumerate( tasks ):
+            if ( fullResults.get( task['filename'] ) is not None ):
+                imageResults[i] = fullResults[task['filename']]
+                imageErrors[i] = np.zeros( len( poreSizeRangeArray ) )
+    outputDirectory = directory + outputDir_Preview
+    os.makedirs( outputDirectory, exist_ok=True )
+    folderResult, gnuplotBefehl = processImageJResults( directory, tasks, imageResults, config, outputDirectory )
+    meanErrors = preview.writeErrorTable( [ task['filename'] for task in tasks ], imageErrors, poreSizeRangeArray, outputDirectory )
+    meanPercents = folderResult.getMeanPercents()
+    previewPixelSize = max( [ task['pixelSize'] * previewFactor for task in tasks ], default=0 )
+    smallestSize = preview.getSmallestResolvedSize( poreSizeRangeArray, previewPixelSize, config['calculatePoreDiameter'] )
+    print( "Preview of folder " + directory + " (downsampled by " + str( previewFactor ) + ", up to " + str( round( previewPixelSize, 3 ) ) + " nm / px)" )
+    if ( smallestSize is None ):
+        print( " no size range is resolved, use a smaller preview factor" )
+    else:
+        print( " size ranges above " + str( smallestSize ) + " nm are resolved, smaller ones need a full resolution run" )
+    for i in range(len(poreSizeRangeArray)):
+        if ( np.isfinite( meanErrors[i] ) ):
+            print( '  - ' + str( poreSizeRangeArray[i] ) + ' nm: ' + str( round( meanPercents[i], 5 ) ) + ' ± ' + str( round( meanErrors[i], 5 ) ) + ' Area-%' )
+        else:
+            print( '  - ' + str( poreSizeRangeArray[i] ) + ' nm: not resolved' )
+    if ( config['runGnuPlot'] ):
+        createGnuplotPlot( outputDirectory, plotName, gnuplotBefehl, config )
+    return { outputDirectory: folderResult }
+
+def createGnuplotPlot( directory, filename, gnuplotBefehl, config ):
+    print( "creating gnuplot plot" )
+    if os.path.exists( directory + '/mr_result.csv' ):
+        gp_file = open( directory + '/' + filename + '.gp', 'w')
+        gp_file.write( 'set logscale x' + "\n" )
+        gp_file.write( 'set datafile separator ","' + "\n" )
+        gp_file.write( 'set terminal pdf size 29.7cm,21cm' + "\n" )
+        gp_file.write( 'set output "' + directory + '/' + filename + '.pdf"' + "\n" )
+        gp_file.write( 'cd "' + directory + '"' + "\n" )
+
+        if ( config['binningVariable'] != 'area' ):
+            gp_file.write( 'set xlabel "' + binningVariableLabels[config['binningVariable']] + '"' + "\n" )
+        elif config['calculatePoreDiameter'] :
+            gp_file.write( 'set xlabel "Porendurchmesser in nm"' + "\n" )
+        else:
+            gp_file.write( 'set xlabel "Porengröße in nm²"' + "\n" )
+
+        if ( config['outputType'] == 0 ):
+            gp_file.write( 'set ylabel "Fläche in % der Gesamtbildfläche"' + "\n" )
+            gp_file.write( 'set key left top' + "\n" )
+        elif ( config['outputType'] == 1 ):
+            gp_file.write( 'set ylabel "Gesamtfläche in nm²"' + "\n" )
+            gp_file.write( 'set key left top' + "\n" )
+        elif ( config['outputType'] == 2 ):
+            gp_file.write( 'set ylabel "Partikelanzahl"' + "\n" )
+            gp_file.write( 'set key right top' + "\n" )
+
+
+        poreSizeRangeStr = ','.join(str(e) for e in config['poreSizeRangeArray'])
+        gp_file.write( 'set xtics (' + poreSizeRangeStr + ') rotate by 45 right' + "\n" )
+
+        gp_file.write( gnuplotBefehl + "\n" )
+        gp_file.close()
+        with trace.stage( 'gnuplot', directory=directory ):
+            os.system('gnuplot "' + directory + '/' + filename + '.gp"')
+        pdfPath = directory + '/' + filename + '.pdf'
+        if ( os.path.exists( pdfPath ) ) :
+            if ( config['openPlot'] ):
+                print( "opening '" + pdfPath + "'" )
+                import subprocess
+                subprocess.Popen( pdfPath ,shell=True)
+        else:
+            print( "Error creating '" + pdfPath + "'!" )
+    print( "done" )
+
+def analyseFolder( path, config = None ):
+    # analyses the images in path, or in its scale folders (eg: 400nm) if the images have no scale metadata
+    # returns { directory of the result tables: FolderResult }
+    config = createConfig( config )
+    runImageJPerImage = config['runImageJ'] and not config['useNumpyEngine']
+    if ( config['watchFolder'] ):
+        return watchWorkingDirectory( path, config )
+    if scaleInMetaData( path, config ) :
+        # use metaData in files to determine scale
+        print( "Tiffs with scale metadata found!" )
+        if ( len( config['thresholdSweep'] ) > 0 ):
+            return runThresholdSweep( path, config )
+        if ( config['previewFactor'] > 1 ):
+            return runPreview( path, config )
+        tasks, imageManifest = createImageTasks( path, config, None, runImageJPerImage and os.path.isdir( path ) )
+        return analyseTaskFolders( [ ( 'Plot', path, tasks, imageManifest ) ], config )
+    # search for formatted folders (eg: 400nm) to determine scale
+    from pore_analysis import parallel
+    folderResults = {}
+    folders = []
+    folderCommands = []
+    for subDir in os.listdir(path):
+        print( "Formatted folder for scaling found." )
+        directory = path + "/" + subDir
+        if os.path.isdir( directory ) and matchSubdirName( subDir, config ) :
+            folderScale = config['metricScale']/config['pixelScale'] #nm/px
+            print( "Selected scale:  " + str( config['metricScale'] ) + " nm / " + str( config['pixelScale'] ) + " px = " + str( folderScale ) + " nm / px" )
+            if ( config['doRemoveBorderPercent'] > 0 ):
+                print( "the border is not removed in scale folders (pore_analysis.ijm)!" )
+            folderConfig = getScaleFolderConfig( config )
+            if ( len( config['thresholdSweep'] ) > 0 ):
+                folderResults.update( runThresholdSweep( directory, folderConfig, folderScale ) )
+                continue
+            if ( config['previewFactor'] > 1 ):
+                folderResults.update( runPreview( directory, folderConfig, folderScale, subDir ) )
+                continue
+            tasks, imageManifest = createImageTasks( directory, folderConfig, folderScale, runImageJPerImage )
+            if ( len( tasks ) > 1 and all( task['command'] is not None for task in tasks ) ):
+                # no previous results can be used, so a single ImageJ instance processes the whole folder
+                folderCommands.append( getImageJCommand( directory, "", folderConfig ) )
+                for task in tasks:
+                    task['command'] = None
+            folders.append( ( subDir, directory, tasks, imageManifest ) )
+        else:
+            print( "------" )
+            print("'" + directory + "' is no valid directory!")
+    # the folder macros and afterwards all images of all folders are processed concurrently
+    if ( len( folderCommands ) > 0 ):
+        parallel.runTasks( parallel.runImageJMacro, folderCommands, config['jobs'] )
+    folderResults.update( analyseTaskFolders( folders, config ) )
+    return folderResults
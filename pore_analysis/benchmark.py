@@ -0,0 +1,695 @@
+#########################################################
+# Benchmarks of the pore analysis
+#
+# usage: python -m pore_analysis.benchmark binning [-n <particleCount>] [-p]
+#        python -m pore_analysis.benchmark lines [-n <maskSize>]
+#        python -m pore_analysis.benchmark background [-n <imageWidth>]
+#        python -m pore_analysis.benchmark store [-n <particleCount>] [-p]
+#        python -m pore_analysis.benchmark tables [-n <imageCount>] [-p]
+#        python -m pore_analysis.benchmark pipeline [-n <imageCount>] [-w <imageWidth>] [-j <jobs>] [-r <resultFile>]
+#        python -m pore_analysis.benchmark preview [-n <imageCount>] [-w <imageWidth>] [-j <jobs>]
+#        python -m pore_analysis.benchmark masks [-n <imageWidth>]
+#        python -m pore_analysis.benchmark morphology [-n <maskWidth>]
+#        python -m pore_analysis.benchmark granulometry [-n <maskWidth>]
+#        python -m pore_analysis.benchmark startup [-n <runs>]
+#
+# the pipeline benchmark runs the in-process engine on synthetic
+# images with a known pore size distribution and appends its
+# throughput, stage latencies and per bucket errors to resultFile
+# (one JSON line per run) to compare runs across commits, the
+# preview benchmark compares the run time and the size distribution
+# of the quick-look preview to the full resolution run
+#
+#########################################################
+
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys, getopt
+import tempfile
+import time
+import numpy as np
+
+from pore_analysis import defaultPoreSizeRangeArray
+from pore_analysis import analysis
+from pore_analysis import granulometry
+from pore_analysis import lines
+from pore_analysis import masks
+from pore_analysis import metadata
+from pore_analysis import morphology
+from pore_analysis import parallel
+from pore_analysis import particles
+from pore_analysis import preview
+from pore_analysis import results
+from pore_analysis import segmentation
+from pore_analysis import synthetic
+from pore_analysis import trace
+
+defaultResultFile = "benchmark_pipeline.jsonl"
+
+def binPoreAreasReference( poreAreas, imageArea, poreSizeRangeArray, calculatePoreDiameter = False ):
+    # the comparison loop processData() used before the binning was vectorized
+    poreSizeArray = [ float( 0 ) for val in poreSizeRangeArray ]
+    poreSizePercentArray = [ float( 0 ) for val in poreSizeRangeArray ]
+    poreCountArray = [ 0 for val in poreSizeRangeArray ]
+    for area in poreAreas:
+        poreSize = math.sqrt( area ) if ( calculatePoreDiameter ) else area
+        for i in range(len(poreSizeRangeArray)):
+            if ( i > 0 ):
+                if (len(poreSizeRangeArray)-1 == i and poreSizeRangeArray[i] < poreSize ):
+                    poreSizeArray[i]  += poreSize
+                    poreSizePercentArray[i] += area/imageArea*100
+                    poreCountArray[i] += 1
+                elif ( poreSizeRangeArray[i-1] < poreSize and poreSizeRangeArray[i] > poreSize ):
+                    poreSizeArray[i]  += poreSize
+                    poreSizePercentArray[i] += area/imageArea*100
+                    poreCountArray[i] += 1
+    return poreCountArray, poreSizeArray, poreSizePercentArray
+
+def createPoreAreas( particleCount, seed = 0 ):
+    # log-normally distributed areas in nm² with some values exactly on the range limits
+    rng = np.random.default_rng( seed )
+    poreAreas = np.round( rng.lognormal( 7, 2.5, particleCount ) )
+    poreAreas[::97] = rng.choice( defaultPoreSizeRangeArray, len( poreAreas[::97] ) )
+    return poreAreas
+
+def benchmarkBinning( particleCount = 100000, calculatePoreDiameter = False, poreSizeRangeArray = None ):
+    poreSizeRangeArray = poreSizeRangeArray or defaultPoreSizeRangeArray
+    imageSize = ( 6144, 4096 )
+    pixelSize = 2.0
+    imageArea = imageSize[0] * pixelSize * imageSize[1] * pixelSize
+    poreAreas = createPoreAreas( particleCount )
+    poreAreaList = poreAreas.tolist()
+
+    startTime = time.perf_counter()
+    poreCountArray, poreSizeArray, poreSizePercentArray = binPoreAreasReference( poreAreaList, imageArea, poreSizeRangeArray, calculatePoreDiameter )
+    loopTime = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    imageResult = results.binPoreAreas( 'benchmark', pixelSize, poreAreas, imageSize, poreSizeRangeArray, calculatePoreDiameter )
+    vectorTime = time.perf_counter() - startTime
+
+    print( "binning " + str( particleCount ) + " particles into " + str( len( poreSizeRangeArray ) ) + " size ranges" + ( " (pore diameter)" if calculatePoreDiameter else "" ) )
+    print( " comparison loop: " + str( round( loopTime*1000, 2 ) ) + " ms" )
+    print( " vectorized:      " + str( round( vectorTime*1000, 2 ) ) + " ms (" + str( round( loopTime/vectorTime, 1 ) ) + "x faster)" )
+    identical = ( poreCountArray == imageResult.poreCountArray
+        and np.allclose( poreSizeArray, imageResult.poreSizeArray, rtol=1e-9 )
+        and np.allclose( poreSizePercentArray, imageResult.poreSizePercentArray, rtol=1e-9 ) )
+    print( " results identical: " + str( identical ) )
+    return loopTime, vectorTime, identical
+
+def measureLinesReference( mask ):
+    # pixel loop over the rows like the Line_Length_Counter plugin, returns the horizontal lines
+    height, width = mask.shape
+    horizontalLines = []
+    for y in range( height ):
+        row = mask[y].tolist()
+        x = 0
+        while ( x < width ):
+            if ( row[x] ):
+                start = x
+                while ( x < width and row[x] ):
+                    x += 1
+                border = int( start == 0 ) + int( x == width )
+                horizontalLines.append( ( x-start, lines.horizontalLine, lines.fullLine if x-start == width else border ) )
+            else:
+                x += 1
+    return horizontalLines
+
+def createMask( width, height, seed = 0 ):
+    # thresholded noise with pores of a few pixels up to some hundred pixels
+    rng = np.random.default_rng( seed )
+    from scipy import ndimage
+    noise = ndimage.gaussian_filter( rng.random( ( height, width ), dtype=np.float32 ), 3 )
+    return noise < np.percentile( noise, 30 )
+
+def benchmarkLines( width = 6144, height = 4096, referenceRows = 256 ):
+    mask = createMask( width, height )
+    referenceRows = min( referenceRows, height )
+
+    startTime = time.perf_counter()
+    imageLines = lines.measureLines( mask )
+    lineLengths = lines.selectLineLengths( imageLines, 2.0, processVertical=True )
+    imageResult = results.binLineLengths( 'benchmark', 2.0, lineLengths, ( width, height ), defaultPoreSizeRangeArray )
+    vectorTime = time.perf_counter() - startTime
+
+    # the pixel loop is only run on the first rows and extrapolated
+    startTime = time.perf_counter()
+    referenceLines = measureLinesReference( mask[:referenceRows] )
+    loopTime = ( time.perf_counter() - startTime ) * 2 * height / referenceRows
+
+    print( "measuring horizontal and vertical lines of a " + str( width ) + "x" + str( height ) + " px mask (" + str( len( imageLines ) ) + " lines)" )
+    print( " pixel loop:      ~" + str( round( loopTime, 2 ) ) + " s (extrapolated from " + str( referenceRows ) + " rows)" )
+    print( " vectorized:      " + str( round( vectorTime*1000, 2 ) ) + " ms (" + str( round( loopTime/vectorTime, 1 ) ) + "x faster)" )
+    identical = ( np.array( referenceLines, dtype=np.int32 ).reshape( -1, 3 ).tolist() == lines.measureLines( mask[:referenceRows] )[:len( referenceLines )].tolist() )
+    print( " results identical: " + str( identical ) )
+    return loopTime, vectorTime, identical
+
+def createImage( width, height, seed = 0 ):
+    # light 8-bit image with dark pores, noise and a shading gradient like a SEM image
+    rng = np.random.default_rng( seed )
+    from scipy import ndimage
+    noise = ndimage.gaussian_filter( rng.random( ( height, width ), dtype=np.float32 ), 3 )
+    image = np.where( noise < np.percentile( noise, 30 ), 60, 170 ) + rng.normal( 0, 10, ( height, width ) )
+    image += np.linspace( -40, 40, width )[np.newaxis, :]
+    return np.clip( image, 0, 255 ).astype( np.uint8 )
+
+def benchmarkBackground( width = 2048, height = 1365, radii = ( 30, 100, 300, 600 ), backgroundShrinks = ( 1, 2, 4, 8 ) ):
+    image = createImage( width, height )
+    print( "subtracting the background of a " + str( width ) + "x" + str( height ) + " px image" )
+    for radius in radii:
+        exact = None
+        for backgroundShrink in backgroundShrinks:
+            startTime = time.perf_counter()
+            result = segmentation.subtractBackground( image, radius, True, backgroundShrink )
+            duration = time.perf_counter() - startTime
+            if ( exact is None ):
+                exact = result.astype( np.int16 )
+            deviation = np.abs( result - exact )
+            print( " radius " + str( radius ) + ", shrink " + str( backgroundShrink ) + ": " + str( round( duration*1000, 1 ) ) + " ms, deviation mean " + str( round( float( deviation.mean() ), 3 ) ) + " / max " + str( int( deviation.max() ) ) + " grey values" )
+
+def benchmarkStore( particleCount = 2000000, imageCount = 200, calculatePoreDiameter = False ):
+    # re-binning a folder from the ImageJ result tables compared to the particle store
+    imageSize = ( 6144, 4096 )
+    pixelSize = 2.0
+    directory = tempfile.mkdtemp()
+    try:
+        os.makedirs( directory + results.outputDir_Pores )
+        poreAreas = np.array_split( createPoreAreas( particleCount ), imageCount )
+        tasks = []
+        measurements = {}
+        for i, imagePoreAreas in enumerate( poreAreas ):
+            baseName = 'image_' + str( i )
+            csvPath = directory + results.outputDir_Pores + baseName + results.suffix_Pores
+            np.savetxt( csvPath, np.column_stack( ( np.arange( 1, len( imagePoreAreas )+1 ), imagePoreAreas ) ), fmt=( '%d', '%.17g' ), delimiter=',', header=' ,Area', comments='' )
+            tasks.append( { 'filename': baseName + '.tif', 'pixelSize': pixelSize, 'outputType': 0, 'calculatePoreDiameter': calculatePoreDiameter, 'poreSizeRangeArray': defaultPoreSizeRangeArray, 'binningVariable': 'area', 'showDebuggingOutput': False } )
+            measurements[baseName + '.tif'] = { 'filename': baseName + '.tif', 'engine': 'imagej', 'imageSize': imageSize, 'areas': imagePoreAreas, 'lines': None, 'sources': particles.getSourceStats( [ csvPath ] ) }
+        store = particles.ParticleStore( directory )
+        startTime = time.perf_counter()
+        store.update( [ task['filename'] for task in tasks ], measurements )
+        writeTime = time.perf_counter() - startTime
+
+        startTime = time.perf_counter()
+        csvResults = []
+        for task in tasks:
+            baseName = os.path.splitext( task['filename'] )[0]
+            imagePoreAreas = np.loadtxt( directory + results.outputDir_Pores + baseName + results.suffix_Pores, delimiter=',', skiprows=1, usecols=1, ndmin=1, dtype=np.float64 )
+            csvResults.append( results.binPoreAreas( baseName, pixelSize, imagePoreAreas, imageSize, defaultPoreSizeRangeArray, calculatePoreDiameter ) )
+        csvTime = time.perf_counter() - startTime
+
+        startTime = time.perf_counter()
+        store = particles.ParticleStore( directory )
+        storeResults = store.binImages( tasks )
+        storeTime = time.perf_counter() - startTime
+        store.release()
+
+        print( "re-binning " + str( particleCount ) + " particles of " + str( imageCount ) + " images" + ( " (pore diameter)" if calculatePoreDiameter else "" ) )
+        print( " writing the store:     " + str( round( writeTime*1000, 1 ) ) + " ms (" + str( round( os.path.getsize( store.path )/1024/1024, 1 ) ) + " MB)" )
+        print( " parsing result tables: " + str( round( csvTime*1000, 1 ) ) + " ms" )
+        print( " particle store:        " + str( round( storeTime*1000, 1 ) ) + " ms (" + str( round( csvTime/storeTime, 1 ) ) + "x faster)" )
+        identical = all( a.poreCountArray == b.poreCountArray and a.poreSizeArray == b.poreSizeArray and a.poreSizePercentArray == b.poreSizePercentArray and a.processedElements == b.processedElements for a, b in zip( csvResults, storeResults ) )
+        print( " results identical: " + str( identical ) )
+        return csvTime, storeTime, identical
+    finally:
+        shutil.rmtree( directory )
+
+def writeResultTablesReference( imageResults, imageFiles, outputDirectory, poreSizeRangeArray, calculatePoreDiameter = False ):
+    # the string concatenation processImageJResults() used before the aggregation was array based (area-% output)
+    resulCSVTable = [ "#bucket", "#scale [nm/px]" ] + [ str( val ) for val in poreSizeRangeArray ]
+    poreCountSumArray = [ 0 for val in poreSizeRangeArray ]
+    poreSizeSumPercentArray = [ 0 for val in poreSizeRangeArray ]
+    csvFile = open( outputDirectory + '/results.csv', 'w' )
+    csvFile.write( "name" + "".join( ", " + str( val ) for val in poreSizeRangeArray ) + "\n" )
+    resultLine = ""
+    for imageFile, imageResult in zip( imageFiles, imageResults ):
+        resultLine = ""
+        resulCSVTable[0] += "," + imageResult.filename
+        resulCSVTable[1] += "," + str( round( imageResult.pixelSize, 3 ) )
+        for i in range( len( poreSizeRangeArray ) ):
+            resulCSVTable[i+2] += "," + str( round( imageResult.poreSizePercentArray[i], 2 ) )
+            resultLine += "," + str( round( imageResult.poreSizePercentArray[i], 2 ) )
+            poreCountSumArray[i] += imageResult.poreCountArray[i]
+            poreSizeSumPercentArray[i] += imageResult.poreSizePercentArray[i]
+        csvFile.write( imageFile + resultLine + "\n" )
+    resulCSVTable[0] += ",fullSum"
+    resulCSVTable[1] += ",-"
+    sumPercent = 0
+    for i in range( len( poreSizeRangeArray ) ):
+        sumAreaPercent = poreSizeSumPercentArray[i]/len( imageResults )
+        sumPercent += sumAreaPercent
+        if ( calculatePoreDiameter ):
+            resultLine += "," + str( poreCountSumArray[i] )
+            resulCSVTable[i+2] += "," + str( poreCountSumArray[i] )
+        else:
+            resultLine += "," + str( poreCountSumArray[i] ) + "," + str( round( sumAreaPercent, 5) )
+            resulCSVTable[i+2] += "," + str( round( sumAreaPercent, 5) )
+            resulCSVTable[i+2] += "," + str( round( sumPercent, 5) )
+    csvFile.write( 'Summe' + resultLine + "\n" )
+    csvFile.close()
+    with open( outputDirectory + '/mr_result.csv', 'w' ) as csvFile:
+        for line in resulCSVTable:
+            csvFile.write( line + "\n" )
+
+def benchmarkResultTables( imageCount = 5000, calculatePoreDiameter = False ):
+    poreSizeRangeArray = defaultPoreSizeRangeArray
+    imageSize = ( 6144, 4096 )
+    poreAreas = np.array_split( createPoreAreas( imageCount * 200 ), imageCount )
+    imageResults = [ results.binPoreAreas( 'image_' + str( i ), 2.0, poreAreas[i], imageSize, poreSizeRangeArray, calculatePoreDiameter ) for i in range( imageCount ) ]
+    imageFiles = [ imageResult.filename + '.tif' for imageResult in imageResults ]
+    referenceDirectory = tempfile.mkdtemp()
+    directory = tempfile.mkdtemp()
+    try:
+        startTime = time.perf_counter()
+        writeResultTablesReference( imageResults, imageFiles, referenceDirectory, poreSizeRangeArray, calculatePoreDiameter )
+        stringTime = time.perf_counter() - startTime
+
+        startTime = time.perf_counter()
+        folderResult = results.FolderResult( directory, poreSizeRangeArray, imageResults )
+        aggregationTime = time.perf_counter() - startTime
+        results.writeResultTables( folderResult, imageFiles, directory, 0, calculatePoreDiameter )
+        arrayTime = time.perf_counter() - startTime
+
+        print( "writing the result tables of " + str( imageCount ) + " images" + ( " (pore diameter)" if calculatePoreDiameter else "" ) )
+        print( " string concatenation: " + str( round( stringTime*1000, 1 ) ) + " ms" )
+        print( " array aggregation:    " + str( round( arrayTime*1000, 1 ) ) + " ms (" + str( round( stringTime/arrayTime, 1 ) ) + "x faster)" )
+        print( "  stacking the images: " + str( round( aggregationTime*1000, 1 ) ) + " ms, formatting and writing: " + str( round( ( arrayTime - aggregationTime )*1000, 1 ) ) + " ms" )
+        identical = True
+        for tableName in ( '/results.csv', '/mr_result.csv' ):
+            with open( referenceDirectory + tableName ) as referenceFile, open( directory + tableName ) as tableFile:
+                identical = identical and ( referenceFile.read() == tableFile.read() )
+        print( " tables identical: " + str( identical ) )
+        return stringTime, arrayTime, identical
+    finally:
+        shutil.rmtree( referenceDirectory )
+        shutil.rmtree( directory )
+
+def getPipelineOptions():
+    # default settings of start_pore_analysis.py -n
+    return analysis.getTaskOptions( analysis.createConfig( { 'useNumpyEngine': True, 'infoBarHeight': synthetic.infoBarHeight } ) )
+
+def runPipeline( directory, jobs = 1 ):
+    # metadata, segmentation, particle store, binning and result tables of a folder like start_pore_analysis.py -n
+    imageFiles = sorted( filename for filename in os.listdir( directory ) if filename.endswith( ( '.jpg', '.JPG', '.tif', '.TIF' ) ) )
+    with trace.stage( 'metadata', directory=directory ):
+        pixelSizes = [ metadata.getPixelSize( metadata.getImageHeader( directory, filename ) ) for filename in imageFiles ]
+    os.makedirs( directory + results.outputDir_Pores, exist_ok=True )
+    options = getPipelineOptions()
+    tasks = [ parallel.createImageTask( directory, filename, pixelSize, options ) for filename, pixelSize in zip( imageFiles, pixelSizes ) ]
+    imageResults = parallel.analyseTasks( tasks, jobs )
+    with trace.stage( 'result tables', directory=directory ):
+        folderResult = results.FolderResult( directory, defaultPoreSizeRangeArray, [ imageResult for imageResult in imageResults if imageResult is not None ] )
+        results.writeResultTables( folderResult, imageFiles, directory )
+    return folderResult
+
+def getGroundTruthResult( folderResult, groundTruth ):
+    # the true pore areas binned like the results of the pipeline
+    poreAreas = { os.path.splitext( filename )[0]: imagePoreAreas for filename, imagePoreAreas in groundTruth.items() }
+    imageResults = [ results.binPoreAreas( filename, pixelSize, poreAreas[filename], tuple( imageSize.tolist() ), folderResult.poreSizeRangeArray ) for filename, pixelSize, imageSize in zip( folderResult.filenames, folderResult.pixelSizes, folderResult.imageSizes ) ]
+    return results.FolderResult( folderResult.directory, folderResult.poreSizeRangeArray, imageResults )
+
+def getBucketErrors( folderResult, truthResult ):
+    # pore count (all images) and mean area-% of every size range found by the pipeline and drawn into the images
+    counts = folderResult.getCountSums()
+    truthCounts = truthResult.getCountSums()
+    percents = folderResult.getMeanPercents()
+    truthPercents = truthResult.getMeanPercents()
+    poreSizeRangeArray = folderResult.poreSizeRangeArray
+    buckets = []
+    for i in range( 1, len( poreSizeRangeArray ) ):
+        # the last size range also holds the pores above its limit
+        sizeRange = str( poreSizeRangeArray[i-1] ) + '-' + str( poreSizeRangeArray[i] ) if i < len( poreSizeRangeArray )-1 else '> ' + str( poreSizeRangeArray[i-1] )
+        buckets.append( { 'sizeRange': sizeRange, 'count': int( counts[i] ), 'truthCount': int( truthCounts[i] ), 'percent': float( percents[i] ), 'truthPercent': float( truthPercents[i] ) } )
+    return buckets
+
+def getCommit():
+    # git commit of the package ('+' if it has uncommitted changes), None outside of a git checkout
+    packageDirectory = os.path.dirname( os.path.abspath( __file__ ) )
+    try:
+        commit = subprocess.check_output( [ 'git', 'rev-parse', '--short', 'HEAD' ], cwd=packageDirectory, stderr=subprocess.DEVNULL ).decode().strip()
+        changes = subprocess.check_output( [ 'git', 'status', '--porcelain', '--untracked-files=no' ], cwd=packageDirectory, stderr=subprocess.DEVNULL ).decode().strip()
+    except ( OSError, subprocess.CalledProcessError ):
+        return None
+    return commit + ( '+' if changes != '' else '' )
+
+def readPreviousRun( resultFile, host, parameters ):
+    # last run in resultFile on the same host using the same parameters, None if there is none
+    previousRun = None
+    if ( not os.path.exists( resultFile ) ):
+        return None
+    for event in trace.readEvents( resultFile ):
+        if ( event.get( 'host' ) == host and event.get( 'parameters' ) == parameters ):
+            previousRun = event
+    return previousRun
+
+def formatChange( previousValue, value, digits = 1, unit = '' ):
+    change = " (" + ( '+' if value >= previousValue else '' ) + str( round( ( value/previousValue-1 )*100, 1 ) ) + " %)" if previousValue != 0 else ""
+    return str( round( previousValue, digits ) ) + unit + " -> " + str( round( value, digits ) ) + unit + change
+
+def printPipelineComparison( previousRun, run ):
+    print( " compared to " + str( previousRun['commit'] ) + " (" + previousRun['date'] + "):" )
+    print( "  images/s:          " + formatChange( previousRun['imagesPerSecond'], run['imagesPerSecond'], 2 ) )
+    print( "  MB/s:              " + formatChange( previousRun['megabytesPerSecond'], run['megabytesPerSecond'], 2 ) )
+    for name, stage in run['stages'].items():
+        if ( name in previousRun['stages'] ):
+            print( '  {:<18} {}'.format( name + ':', formatChange( previousRun['stages'][name]['mean'], stage['mean'], 1, ' ms' ) ) )
+    print( "  area-% error:      " + formatChange( previousRun['percentError'], run['percentError'], 3 ) )
+    print( "  pore count error:  " + formatChange( previousRun['countError'], run['countError'], 3 ) )
+
+def benchmarkPipeline( imageCount = 8, width = 2048, jobs = 1, resultFile = defaultResultFile, seed = 0, pixelSize = 2.0 ):
+    # runs the pipeline on synthetic images with a known ground truth and appends the run to resultFile
+    height = width*2//3
+    directory = tempfile.mkdtemp()
+    try:
+        startTime = time.perf_counter()
+        groundTruth = synthetic.createImageSet( directory, imageCount, width, height, pixelSize, seed )
+        generationTime = time.perf_counter() - startTime
+        inputBytes = sum( os.path.getsize( directory + '/' + filename ) for filename in groundTruth )
+
+        tracePath = directory + '/trace.jsonl'
+        trace.start( tracePath )
+        startTime = time.perf_counter()
+        folderResult = runPipeline( directory, jobs )
+        duration = time.perf_counter() - startTime
+        trace.stop()
+        summary = trace.getSummary( trace.readEvents( tracePath ) )
+
+        buckets = getBucketErrors( folderResult, getGroundTruthResult( folderResult, groundTruth ) )
+        truthCount = sum( bucket['truthCount'] for bucket in buckets )
+        run = {
+            'date': time.strftime( '%Y-%m-%d %H:%M:%S' ),
+            'commit': getCommit(),
+            'host': platform.node(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpus': os.cpu_count(),
+            'parameters': { 'images': imageCount, 'width': width, 'height': height, 'pixelSize': pixelSize, 'jobs': jobs, 'seed': seed },
+            'duration': duration,
+            'imagesPerSecond': imageCount/duration,
+            'megabytesPerSecond': inputBytes/1024/1024/duration,
+            'stages': { name: { 'count': entry['count'], 'total': entry['duration'], 'mean': entry['duration']/entry['count']*1000 } for name, entry in summary.items() },
+            'porosity': float( sum( bucket['percent'] for bucket in buckets ) ),
+            'truthPorosity': float( sum( bucket['truthPercent'] for bucket in buckets ) ),
+            'percentError': float( sum( abs( bucket['percent'] - bucket['truthPercent'] ) for bucket in buckets ) ),
+            'countError': float( sum( abs( bucket['count'] - bucket['truthCount'] ) for bucket in buckets )/truthCount ) if truthCount > 0 else 0.0,
+            'buckets': buckets
+        }
+
+        print( "analysing " + str( imageCount ) + " synthetic " + str( width ) + "x" + str( height ) + " px images (" + str( truthCount ) + " pores, " + str( jobs ) + " job(s))" )
+        print( " generating the images: " + str( round( generationTime, 2 ) ) + " s (not included)" )
+        print( " pipeline:              " + str( round( duration, 2 ) ) + " s, " + str( round( run['imagesPerSecond'], 2 ) ) + " images/s, " + str( round( run['megabytesPerSecond'], 2 ) ) + " MB/s" )
+        print( '{:<22} {:>6} {:>10} {:>10}'.format( ' stage', 'count', 'total [s]', 'mean [ms]' ) )
+        for name, stage in run['stages'].items():
+            print( '{:<22} {:>6} {:>10.3f} {:>10.1f}'.format( ' ' + name[:21], stage['count'], stage['total'], stage['mean'] ) )
+        print( '{:<22} {:>8} {:>8} {:>10} {:>10} {:>10}'.format( ' size range [nm²]', 'pores', 'true', 'area-%', 'true', 'error' ) )
+        for bucket in buckets:
+            if ( bucket['count'] > 0 or bucket['truthCount'] > 0 ):
+                print( '{:<22} {:>8} {:>8} {:>10.3f} {:>10.3f} {:>+10.3f}'.format( ' ' + bucket['sizeRange'], bucket['count'], bucket['truthCount'], bucket['percent'], bucket['truthPercent'], bucket['percent'] - bucket['truthPercent'] ) )
+        print( " porosity: " + str( round( run['porosity'], 3 ) ) + " Area-% (true " + str( round( run['truthPorosity'], 3 ) ) + "), summed area-% error " + str( round( run['percentError'], 3 ) ) + ", pore count error " + str( round( run['countError']*100, 1 ) ) + " %" )
+
+        previousRun = readPreviousRun( resultFile, run['host'], run['parameters'] )
+        if ( previousRun is not None ):
+            printPipelineComparison( previousRun, run )
+        with open( resultFile, 'a' ) as resultFileHandle:
+            resultFileHandle.write( json.dumps( run ) + '\n' )
+        print( " appended to " + resultFile )
+        return run
+    finally:
+        trace.stop()
+        shutil.rmtree( directory )
+
+def benchmarkPreview( imageCount = 8, width = 2048, jobs = 1, previewFactors = ( 2, 4, 8 ), seed = 0, pixelSize = 2.0 ):
+    # run time of the preview compared to the full resolution pipeline and the deviation of every resolved size range
+    # compared to the estimated error (both mean area-% of all images)
+    height = width*2//3
+    directory = tempfile.mkdtemp()
+    try:
+        synthetic.createImageSet( directory, imageCount, width, height, pixelSize, seed )
+        print( "analysing " + str( imageCount ) + " synthetic " + str( width ) + "x" + str( height ) + " px images (" + str( jobs ) + " job(s))" )
+        startTime = time.perf_counter()
+        folderResult = runPipeline( directory, jobs )
+        fullTime = time.perf_counter() - startTime
+        fullPercents = folderResult.getMeanPercents()
+        print( " full resolution: " + str( round( fullTime, 2 ) ) + " s" )
+        options = getPipelineOptions()
+        imageFiles = [ filename + '.tif' for filename in folderResult.filenames ]
+        poreSizeRangeArray = options['poreSizeRangeArray']
+        durations = {}
+        for previewFactor in previewFactors:
+            options['previewFactor'] = previewFactor
+            tasks = [ parallel.createImageTask( directory, filename, pixelSize, options ) for filename in imageFiles ]
+            startTime = time.perf_counter()
+            imageResults = parallel.runTasks( parallel.analysePreviewTask, tasks, jobs )
+            durations[previewFactor] = time.perf_counter() - startTime
+            previewResult = results.FolderResult( directory, poreSizeRangeArray, imageResults )
+            relativeErrors = preview.getRelativeErrors( poreSizeRangeArray, pixelSize*previewFactor )
+            estimatedErrors = np.mean( [ preview.getBucketErrors( imageResult, relativeErrors ) for imageResult in imageResults ], axis=0 )
+            previewPercents = previewResult.getMeanPercents()
+            print( " preview downsampled by " + str( previewFactor ) + ": " + str( round( durations[previewFactor], 2 ) ) + " s (" + str( round( durations[previewFactor]/fullTime*100, 1 ) ) + " % of the full run)" )
+            print( '{:<22} {:>10} {:>10} {:>10} {:>10}'.format( '  size range [nm²]', 'area-%', 'full', 'deviation', 'estimated' ) )
+            for i in range( 1, len( poreSizeRangeArray ) ):
+                if ( np.isfinite( estimatedErrors[i] ) and ( previewPercents[i] > 0 or fullPercents[i] > 0 ) ):
+                    sizeRange = str( poreSizeRangeArray[i-1] ) + '-' + str( poreSizeRangeArray[i] )
+                    print( '{:<22} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}'.format( '  ' + sizeRange, previewPercents[i], fullPercents[i], abs( previewPercents[i] - fullPercents[i] ), estimatedErrors[i] ) )
+            unresolved = [ i for i in range( 1, len( poreSizeRangeArray ) ) if not np.isfinite( estimatedErrors[i] ) and fullPercents[i] > 0 ]
+            print( "  not resolved: " + str( round( float( sum( fullPercents[i] for i in unresolved ) ), 3 ) ) + " Area-% in " + str( len( unresolved ) ) + " size range(s)" )
+        return fullTime, durations
+    finally:
+        shutil.rmtree( directory )
+
+def benchmarkMasks( width = 2048, height = 1365, repeats = 5 ):
+    # bytes written per image by the macros (cut, processed and masked TIFF) compared to the compact storage
+    # and the time to encode / decode the compact mask, in total and for a range of rows
+    import zipfile
+    from PIL import Image
+    image, poreAreas = synthetic.createImage( width, height + synthetic.infoBarHeight )
+    content = image[:height]
+    mask = segmentation.createPoreMask( segmentation.preprocessImage( content ), 140, 1 )
+    directory = tempfile.mkdtemp()
+    try:
+        Image.fromarray( content ).save( directory + '/cut.tif' )
+        Image.fromarray( content ).save( directory + '/processed.tif' )
+        Image.fromarray( mask.astype( np.uint8 ) * 255 ).save( directory + '/masked.tif' )
+        with zipfile.ZipFile( directory + '/masked.zip', 'w', zipfile.ZIP_DEFLATED ) as zipFile:
+            zipFile.write( directory + '/masked.tif', 'masked.tif' )
+        np.save( directory + '/pores.npy', segmentation.analyseParticles( mask, 1.0 ) )
+        encodeTimes = []
+        for i in range( repeats ):
+            startTime = time.perf_counter()
+            masks.writeMask( directory + '/mask.pmask', mask )
+            encodeTimes.append( time.perf_counter() - startTime )
+        decodeTimes = []
+        rowTimes = []
+        for i in range( repeats ):
+            startTime = time.perf_counter()
+            decoded = masks.readMask( directory + '/mask.pmask' )
+            decodeTimes.append( time.perf_counter() - startTime )
+            startTime = time.perf_counter()
+            rows = masks.readMask( directory + '/mask.pmask', height//2, height//2 + 100 )
+            rowTimes.append( time.perf_counter() - startTime )
+        identical = bool( np.array_equal( decoded, mask ) and np.array_equal( rows, mask[height//2:height//2 + 100] ) )
+        tableSize = os.path.getsize( directory + '/pores.npy' )
+        macroBytes = os.path.getsize( directory + '/cut.tif' ) + os.path.getsize( directory + '/processed.tif' ) + os.path.getsize( directory + '/masked.tif' ) + tableSize
+        imageJBytes = os.path.getsize( directory + '/masked.zip' ) + tableSize
+        compactBytes = os.path.getsize( directory + '/mask.pmask' ) + tableSize
+        print( "storing a " + str( width ) + "x" + str( height ) + " px mask (" + str( round( float( mask.mean() )*100, 1 ) ) + " Area-% pores), particle table " + str( tableSize ) + " bytes" )
+        print( '{:<46} {:>12} {:>8}'.format( ' bytes written per image', 'bytes', 'ratio' ) )
+        print( '{:<46} {:>12} {:>8}'.format( ' cut, processed and masked TIFF (former)', macroBytes, '1.0' ) )
+        print( '{:<46} {:>12} {:>8.1f}'.format( ' zipped masked TIFF (ImageJ, compact)', imageJBytes, macroBytes/imageJBytes ) )
+        print( '{:<46} {:>12} {:>8.1f}'.format( ' bit-packed mask (in-process engine, compact)', compactBytes, macroBytes/compactBytes ) )
+        print( " bit-packed mask: encoding " + str( round( min( encodeTimes )*1000, 1 ) ) + " ms, decoding " + str( round( min( decodeTimes )*1000, 1 ) ) + " ms, 100 rows " + str( round( min( rowTimes )*1000, 2 ) ) + " ms, identical: " + str( identical ) )
+        return macroBytes, imageJBytes, compactBytes
+    finally:
+        shutil.rmtree( directory )
+
+def measureDescriptorsReference( labels, particleCount ):
+    # loop over the particles measuring every one on its bounding box, the Feret diameters exactly
+    # on the convex hull of its pixel squares (the smallest width is found along a hull edge)
+    from scipy import ndimage, spatial
+    descriptors = np.zeros( ( particleCount, len( morphology.descriptorNames ) ) )
+    squareCorners = np.array( [ ( -0.5, -0.5 ), ( 0.5, -0.5 ), ( -0.5, 0.5 ), ( 0.5, 0.5 ) ] )
+    for i, ( rows, columns ) in enumerate( ndimage.find_objects( labels, particleCount ) ):
+        particle = np.pad( labels[rows, columns] == i+1, 1 )
+        y, x = np.nonzero( particle )
+        x = x - 1.0 + columns.start
+        y = y - 1.0 + rows.start
+        area = len( x )
+        centroidX = x.mean()
+        centroidY = y.mean()
+        xx = ( ( x - centroidX )**2 ).mean() + 1/12
+        yy = ( ( y - centroidY )**2 ).mean() + 1/12
+        xy = ( ( x - centroidX )*( y - centroidY ) ).mean()
+        spread = math.sqrt( ( ( xx - yy )/2 )**2 + xy*xy )
+        aspectRatio = math.sqrt( ( ( xx + yy )/2 + spread ) / max( ( xx + yy )/2 - spread, 1e-12 ) )
+        # pixel edges and convex corners of the outline
+        inside = particle[1:-1, 1:-1]
+        outside = ~particle
+        height, width = particle.shape
+        edges = 0
+        corners = 0
+        for dy, dx in ( ( -1, 0 ), ( 1, 0 ), ( 0, -1 ), ( 0, 1 ) ):
+            edges += int( ( inside & outside[1+dy:height-1+dy, 1+dx:width-1+dx] ).sum() )
+        for dy in ( -1, 1 ):
+            for dx in ( -1, 1 ):
+                corners += int( ( inside & outside[1+dy:height-1+dy, 1:-1] & outside[1:-1, 1+dx:width-1+dx] & outside[1+dy:height-1+dy, 1+dx:width-1+dx] ).sum() )
+        points = ( np.column_stack( ( x, y ) )[:, None, :] + squareCorners[None, :, :] ).reshape( -1, 2 )
+        hull = points[spatial.ConvexHull( points ).vertices]
+        feretMax = math.sqrt( max( ( ( hull[:, None, :] - hull[None, :, :] )**2 ).sum( axis=2 ).max(), 0 ) )
+        hullEdges = np.roll( hull, -1, axis=0 ) - hull
+        normals = np.column_stack( ( -hullEdges[:, 1], hullEdges[:, 0] ) ) / np.hypot( hullEdges[:, 0], hullEdges[:, 1] )[:, None]
+        projections = hull @ normals.T
+        feretMin = ( projections.max( axis=0 ) - projections.min( axis=0 ) ).min()
+        descriptors[i] = ( area, 2*math.sqrt( area/math.pi ), edges - corners*( 2 - math.sqrt( 2 ) ), feretMax, feretMin, aspectRatio, centroidX + 0.5, centroidY + 0.5 )
+    return descriptors
+
+def benchmarkMorphology( width = 6144, height = 4096, referenceParticles = 2000 ):
+    # vectorized descriptors of all pores of a mask compared to a loop over the particles (run on the first particles and extrapolated)
+    mask = createMask( width, height )
+    startTime = time.perf_counter()
+    labels, particleCount = segmentation.labelParticles( mask )
+    labelTime = time.perf_counter() - startTime
+    startTime = time.perf_counter()
+    descriptors = morphology.measureDescriptors( labels, particleCount )
+    vectorTime = time.perf_counter() - startTime
+
+    referenceParticles = min( referenceParticles, particleCount )
+    startTime = time.perf_counter()
+    referenceDescriptors = measureDescriptorsReference( np.where( labels <= referenceParticles, labels, 0 ), referenceParticles )
+    loopTime = ( time.perf_counter() - startTime ) * particleCount / max( referenceParticles, 1 )
+
+    print( "measuring the descriptors of " + str( particleCount ) + " pores of a " + str( width ) + "x" + str( height ) + " px mask" )
+    print( " labeling:        " + str( round( labelTime, 2 ) ) + " s" )
+    print( " particle loop:   ~" + str( round( loopTime, 2 ) ) + " s (extrapolated from " + str( referenceParticles ) + " particles)" )
+    print( " vectorized:      " + str( round( vectorTime, 2 ) ) + " s (" + str( round( loopTime/vectorTime, 1 ) ) + "x faster, " + str( int( particleCount/vectorTime ) ) + " pores/s)" )
+    # the moments are summed in a different order
+    identical = bool( np.allclose( descriptors[:referenceParticles], referenceDescriptors, rtol=1e-6, atol=1e-9 ) )
+    print( " results identical: " + str( identical ) )
+    return loopTime, vectorTime, identical
+
+def measureSquaredRadiiReference( mask ):
+    # squared inscribed radius of every pixel by openings with all disks in ascending size, the pixels kept by the
+    # opening with the disk |offset|² < r get r, erosion and dilation are FFT convolutions with the disk
+    from scipy import signal
+    mask = np.asarray( mask, dtype=bool )
+    height, width = mask.shape
+    squaredRadii = np.zeros( ( height, width ), dtype=np.int32 )
+    squaredRadius = 1
+    while True:
+        reach = int( math.ceil( math.sqrt( squaredRadius ) ) )
+        dy, dx = np.mgrid[-reach:reach+1, -reach:reach+1]
+        squaredLengths = dy*dy + dx*dx
+        disk = ( squaredLengths < squaredRadius ).astype( np.float64 )
+        # outside of the image is solid
+        padded = np.pad( mask, reach )
+        eroded = ( signal.fftconvolve( ~padded, disk, mode='same' ) < 0.5 ) & padded
+        if ( not eroded.any() ):
+            return squaredRadii
+        opened = signal.fftconvolve( eroded, disk, mode='same' )[reach:reach+height, reach:reach+width] > 0.5
+        squaredRadii[opened] = squaredRadius
+        # the next larger disk
+        squaredRadius = int( squaredLengths[squaredLengths > squaredRadius].min() )
+
+def benchmarkGranulometry( width = 6144, height = 4096, referenceWidth = 768 ):
+    # inscribed radii of all pore pixels of a synthetic mask compared to repeated openings (run on a region and extrapolated)
+    mask = synthetic.drawPores( height, width, np.random.default_rng( 0 ) )[0]
+    startTime = time.perf_counter()
+    distribution = granulometry.measureMask( mask )
+    fastTime = time.perf_counter() - startTime
+
+    region = mask[:referenceWidth*2//3, :referenceWidth]
+    startTime = time.perf_counter()
+    squaredRadii = granulometry.measureSquaredRadii( region )
+    regionTime = time.perf_counter() - startTime
+    startTime = time.perf_counter()
+    referenceSquaredRadii = measureSquaredRadiiReference( region )
+    referenceTime = time.perf_counter() - startTime
+    openingTime = referenceTime * mask.size / region.size
+
+    print( "inscribed radii of " + str( int( mask.sum() ) ) + " pore pixels of a " + str( width ) + "x" + str( height ) + " px mask (" + str( len( distribution ) ) + " radii up to " + str( round( float( granulometry.getRadii( distribution[-1:] )[0] ), 1 ) if len( distribution ) > 0 else 0 ) + " px)" )
+    print( " openings:        ~" + str( round( openingTime, 2 ) ) + " s (extrapolated from " + str( region.shape[1] ) + "x" + str( region.shape[0] ) + " px, " + str( round( referenceTime, 2 ) ) + " s)" )
+    print( " distance ridge:  " + str( round( fastTime, 2 ) ) + " s (" + str( round( openingTime/fastTime, 1 ) ) + "x faster, " + str( round( regionTime, 3 ) ) + " s on the region)" )
+    identical = bool( np.array_equal( squaredRadii, referenceSquaredRadii ) )
+    print( " results identical: " + str( identical ) )
+    return openingTime, fastTime, identical
+
+# start-up of the command line and the library in a new interpreter, the heavy modules are only imported by the analysis
+packageParent = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+startupCommands = (
+    ( 'python', [ '-c', 'pass' ] ),
+    ( 'import pore_analysis', [ '-c', 'import pore_analysis' ] ),
+    ( 'import pore_analysis.analysis', [ '-c', 'import pore_analysis.analysis' ] ),
+    ( 'python -m pore_analysis -h', [ '-m', 'pore_analysis', '-h' ] ),
+    ( 'start_pore_analysis.py -h', [ os.path.join( packageParent, 'start_pore_analysis.py' ), '-h' ] ),
+    ( 'numpy, PIL and tkinter', [ '-c', 'import numpy, PIL.Image, tkinter' ] ) # imported by start_pore_analysis.py before the options were parsed
+)
+heavyModules = ( 'numpy', 'scipy', 'PIL', 'tkinter', 'concurrent.futures' )
+
+def benchmarkStartup( runs = 10 ):
+    environment = dict( os.environ )
+    environment['PYTHONPATH'] = packageParent + ( os.pathsep + environment['PYTHONPATH'] if environment.get( 'PYTHONPATH' ) else '' )
+    print( "start-up time of a new interpreter (median of " + str( runs ) + " runs)" )
+    durations = {}
+    for name, arguments in startupCommands:
+        runDurations = []
+        for i in range( runs ):
+            startTime = time.perf_counter()
+            subprocess.run( [ sys.executable ] + arguments, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=environment )
+            runDurations.append( time.perf_counter() - startTime )
+        durations[name] = float( np.median( runDurations ) )
+        print( ' {:<32} {:>8.1f} ms'.format( name, durations[name]*1000 ) + ( ' (+' + str( round( ( durations[name] - durations['python'] )*1000, 1 ) ) + ' ms)' if name != 'python' else '' ) )
+    loadedModules = subprocess.check_output( [ sys.executable, '-c', 'import sys, pore_analysis.cli; print( " ".join( name for name in ' + repr( heavyModules ) + ' if name in sys.modules ) )' ], env=environment ).decode().strip()
+    print( " heavy modules loaded by the command line: " + ( loadedModules if loadedModules != '' else 'none' ) )
+    return durations
+
+if __name__ == '__main__':
+    usage = "python -m pore_analysis.benchmark binning [-n <particleCount>] [-p]\n       python -m pore_analysis.benchmark lines [-n <maskSize>]\n       python -m pore_analysis.benchmark background [-n <imageWidth>]\n       python -m pore_analysis.benchmark store [-n <particleCount>] [-p]\n       python -m pore_analysis.benchmark tables [-n <imageCount>] [-p]\n       python -m pore_analysis.benchmark pipeline [-n <imageCount>] [-w <imageWidth>] [-j <jobs>] [-r <resultFile>]\n       python -m pore_analysis.benchmark preview [-n <imageCount>] [-w <imageWidth>] [-j <jobs>]\n       python -m pore_analysis.benchmark masks [-n <imageWidth>]\n       python -m pore_analysis.benchmark morphology [-n <maskWidth>]\n       python -m pore_analysis.benchmark granulometry [-n <maskWidth>]\n       python -m pore_analysis.benchmark startup [-n <runs>]"
+    try:
+        opts, args = getopt.gnu_getopt( sys.argv[1:], "n:pw:j:r:" )
+    except getopt.GetoptError:
+        print( usage )
+        sys.exit( 2 )
+    if ( len( args ) != 1 or args[0] not in ( 'binning', 'lines', 'background', 'store', 'tables', 'pipeline', 'preview', 'masks', 'morphology', 'granulometry', 'startup' ) ):
+        print( usage )
+        sys.exit( 2 )
+    count = None
+    calculatePoreDiameter = False
+    width = None
+    jobs = 1
+    resultFile = defaultResultFile
+    for opt, arg in opts:
+        if opt == '-n': count = int( arg )
+        elif opt == '-p': calculatePoreDiameter = True
+        elif opt == '-w': width = int( arg )
+        elif opt == '-j': jobs = max( 1, int( arg ) )
+        elif opt == '-r': resultFile = arg
+    if ( args[0] == 'binning' ):
+        benchmarkBinning( count or 100000, calculatePoreDiameter )
+    elif ( args[0] == 'lines' ):
+        # -n sets the width, the height is 2/3 of it like a 6144x4096 image
+        width = count or 6144
+        benchmarkLines( width, width*2//3 )
+    elif ( args[0] == 'background' ):
+        width = count or 2048
+        benchmarkBackground( width, width*2//3 )
+    elif ( args[0] == 'store' ):
+        benchmarkStore( count or 2000000, calculatePoreDiameter=calculatePoreDiameter )
+    elif ( args[0] == 'tables' ):
+        benchmarkResultTables( count or 5000, calculatePoreDiameter )
+    elif ( args[0] == 'pipeline' ):
+        benchmarkPipeline( count or 8, width or 2048, jobs, resultFile )
+    elif ( args[0] == 'preview' ):
+        benchmarkPreview( count or 8, width or 2048, jobs )
+    elif ( args[0] == 'masks' ):
+        width = count or 2048
+        benchmarkMasks( width, width*2//3 )
+    elif ( args[0] == 'morphology' ):
+        width = count or 6144
+        benchmarkMorphology( width, width*2//3 )
+    elif ( args[0] == 'granulometry' ):
+        width = count or 6144
+        benchmarkGranulometry( width, width*2//3 )
+    elif ( args[0] == 'startup' ):
+        benchmarkStartup( count or 10 )
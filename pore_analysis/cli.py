@@ -0,0 +1,245 @@
+#########################################################
+# Command line of the pore analysis
+#
+# Parses the options of start_pore_analysis.py into a config of
+# pore_analysis.analysis and analyses the given directories.
+# Without a directory argument start_pore_analysis.py asks for
+# it using a dialog, python -m pore_analysis never needs a display.
+# Only the standard library is imported before the analysis starts.
+#
+# usage: python -m pore_analysis [options] <directory> [<directory> ...]
+#        python start_pore_analysis.py [options] [<directory> ...]
+#
+#########################################################
+
+import sys, getopt
+
+from pore_analysis import analysis, trace
+
+options = "[-h] [-i] [-n] [-g] [-s] [-c] [-p] [-o <outputType>] [--bin-by <descriptor>] [-t <thresholdLimit>] [-b <removeBorderInPercent>] [-j <jobs>] [-w <fijiWorkers>] [--threshold-sweep <start:stop:step>] [--preview <factor>] [--preview-max-error <Area-%>] [--memory-limit <MB>] [--mask-storage <compact|tiff|none>] [--keep-intermediates] [--background-shrink <factor>] [--min-line-length <px>] [--keep-border-lines] [--line-directions <h|v|hv>] [--watch] [--poll-interval <s>] [--trace <file>] [--profile <stages>] [-d]"
+
+def printBanner():
+    print("#########################################################")
+    print("# Automated Pore Analysis for SEM images for CSH-phases #")
+    print("#                                                       #")
+    print("# © 2019 Florian Kleiner                                #")
+    print("#   Bauhaus-Universität Weimar                          #")
+    print("#   Finger-Institut für Baustoffkunde                   #")
+    print("#                                                       #")
+    print("#########################################################")
+    print()
+
+def printHelp( usage ):
+    defaultConfig = analysis.defaultConfig
+    print( 'usage: ' + usage )
+    print( '-h,                  : show this help' )
+    print( '-i, --noImageJ       : skip ImageJ processing' )
+    print( '-n, --numpyEngine    : segment the images in-process using numpy instead of ImageJ' )
+    print( '-g, --noGnuPlot      : skip GnuPlot processing' )
+    print( '-s, --printSumPlot   : printing sums in GnuPlot' )
+    print( '-o, --setOutputType  : set output type (0: area [%], 1: area [nm²], 2: particle count [-], 3: line length [nm])' )
+    print( '                       Not changeable while using -p! Will be set to 2 automatically.' )
+    print( '--min-line-length    : line lengths of the in-process engine have to be longer than N px [' + str( defaultConfig['minLineLength'] ) + ']' )
+    print( '--keep-border-lines  : count lines touching the image border (in-process engine)' )
+    print( '--line-directions    : measure horizontal (h), vertical (v) or both (hv) lines (in-process engine) [h]' )
+    print( '-c                   : do not clean the image using erode/dilate' )
+    print( '-p, --calcPoreDia    : calculate using mean pore diameter instead of pore area' )
+    print( '                       Resets parameter -o to 2 (particle count).' )
+    print( '--bin-by             : bin the pores by area (default), equivalentDiameter, perimeter, feretMax, feretMin, aspectRatio,' )
+    print( '                       centroidX or centroidY (in nm) instead of their area using the in-process engine,' )
+    print( '                       inscribedRadius bins the pore pixels by the radius of the largest disk covering them (in nm)' )
+    print( '-t                   : set threshold limit [' + str( defaultConfig['thresholdLimit'] ) +  '] (0-255) ' )
+    print( '-b                   : remove Border in % [' + str( defaultConfig['doRemoveBorderPercent'] ) +  ' %] (0-45)' )
+    print( '-j, --jobs           : analyse images and scale folders using N worker processes [' + str( defaultConfig['jobs'] ) + ']' )
+    print( '-w, --fiji-workers   : analyse single images using N persistent headless Fiji processes [' + str( defaultConfig['fijiWorkers'] ) + ']' )
+    print( '                       0 starts a new Fiji for every image.' )
+    print( '--threshold-sweep    : evaluate the threshold limits start:stop:step (including stop) using the in-process engine' )
+    print( '                       Results are written to threshold_sweep/<threshold>/ of every folder.' )
+    print( '--preview            : quick-look of images downsampled by N using the in-process engine, written to preview/ of every folder' )
+    print( '                       Only size ranges the reduced resolution can resolve are reported, with an estimated error.' )
+    print( '--preview-max-error  : analyse images whose estimated preview error exceeds N Area-% in a size range at full resolution [' + str( defaultConfig['previewMaxError'] ) + ']' )
+    print( '--memory-limit       : segment images needing more than N MB in overlapping tiles (in-process engine, per worker process)' )
+    print( '--mask-storage       : store the pore masks compact (bit-packed, ImageJ: zipped TIFF), as TIFF or not at all [tiff, -n: compact]' )
+    print( '--keep-intermediates : store the cut and processed images of ImageJ (cut/, processed/)' )
+    print( '--background-shrink  : estimate the background of the in-process engine on an image shrunk by N [' + str( defaultConfig['backgroundShrink'] ) + ']' )
+    print( '                       1: exact, 2-8: faster but approximated, 0: depending on the radius like ImageJ' )
+    print( '--watch              : keep watching the folder and analyse new images as soon as they are completely written' )
+    print( '                       The results and the plot are updated after every new image. Stop using Ctrl+C.' )
+    print( '--poll-interval      : check the watched folder every N seconds, images have to be unchanged for this time [' + str( defaultConfig['pollInterval'] ) + ']' )
+    print( '--trace              : write the run time, CPU time, bytes read and peak memory of every stage and image to a JSON lines file' )
+    print( '                       and print a summary at the end' )
+    print( '--profile            : sample the Python stacks of the given stages (comma separated, e.g. preprocessing,binning or all)' )
+    print( '                       while tracing, the stacks are written next to the trace as *.folded' )
+    print( '-d                   : show debug output' )
+    print( '' )
+
+def processArguments( argv ):
+    # returns the config, the trace file, the profiled stages and the directories given as arguments
+    usage = argv[0] + " " + options + " [<directory> ...]"
+    config = {}
+    tracePath = ""
+    profileStages = []
+    try:
+        opts, args = getopt.gnu_getopt(argv[1:],"hingscpo:t:b:j:w:d",["noImageJ","numpyEngine","noGnuPlot","printSumPlot","setOutputType=","calcPoreDia","bin-by=","jobs=","fiji-workers=","threshold-sweep=","preview=","preview-max-error=","memory-limit=","mask-storage=","keep-intermediates","background-shrink=","min-line-length=","keep-border-lines","line-directions=","watch","poll-interval=","trace=","profile="])
+    except getopt.GetoptError:
+        print( usage )
+        sys.exit( 2 )
+    for opt, arg in opts:
+        if opt == '-h':
+            printHelp( usage )
+            sys.exit()
+        elif opt in ("-i", "--noImageJ"):
+            print( 'deactivating ImageJ processing!' )
+            config['runImageJ'] = False
+        elif opt in ("-n", "--numpyEngine"):
+            print( 'using the in-process numpy engine instead of ImageJ!' )
+            config['useNumpyEngine'] = True
+        elif opt in ("-g", "--noGnuPlot"):
+            print( 'deactivating GnuPlot processing!' )
+            config['runGnuPlot'] = False
+        elif opt in ("-s", "--printSumPlot"):
+            print( 'printing sums in GnuPlot' )
+            config['printGnuPlotSums'] = True
+        elif opt in ("-o", "--setOutputType"):
+            config['outputType'] = int( arg )
+        elif opt == "-c":
+            print( 'disable image cleanup using erode/delate' )
+            config['doSpeckleCleaning'] = 0
+        elif opt in ("-p", "--calcPoreDia"):
+            print( 'calculating pore diameter' )
+            config['calculatePoreDiameter'] = True
+        elif opt == "--bin-by":
+            config['binningVariable'] = arg
+            print( 'binning the pores by ' + arg )
+        elif opt == "-t":
+            if ( int( arg ) < 256 and int( arg ) > -1 ):
+                config['thresholdLimit'] = int( arg )
+                print( 'set threshold limit to ' + str( config['thresholdLimit'] ) )
+        elif opt == "-b":
+            if ( int( arg ) < 45 and int( arg ) > -1 ):
+                config['doRemoveBorderPercent'] = int( arg )
+                print( 'removing ' + str( config['doRemoveBorderPercent'] ) + ' % of the image border' )
+        elif opt == "--min-line-length":
+            config['minLineLength'] = int( arg )
+        elif opt == "--keep-border-lines":
+            config['ignoreBorderLines'] = False
+        elif opt == "--line-directions":
+            config['processHorizontalLines'] = 'h' in arg
+            config['processVerticalLines'] = 'v' in arg
+        elif opt == "--threshold-sweep":
+            try:
+                sweepRange = [ int( value ) for value in arg.split( ':' ) ]
+            except ValueError:
+                sweepRange = []
+            if ( len( sweepRange ) not in ( 2, 3 ) ):
+                print( '--threshold-sweep expects integer limits start:stop or start:stop:step!' )
+                print( usage )
+                sys.exit( 2 )
+            if ( len( sweepRange ) == 2 ):
+                sweepRange.append( 1 )
+            config['thresholdSweep'] = [ value for value in range( sweepRange[0], sweepRange[1]+1, max( 1, sweepRange[2] ) ) if value > -1 and value < 256 ]
+            print( 'evaluating the threshold limits ' + ', '.join( str( value ) for value in config['thresholdSweep'] ) )
+        elif opt == "--preview":
+            if ( int( arg ) > 1 ):
+                config['previewFactor'] = int( arg )
+                print( 'previewing images downsampled by ' + str( config['previewFactor'] ) )
+        elif opt == "--preview-max-error":
+            if ( float( arg ) >= 0 ):
+                config['previewMaxError'] = float( arg )
+        elif opt == "--background-shrink":
+            if ( int( arg ) > -1 ):
+                config['backgroundShrink'] = int( arg )
+                print( 'estimating the background on a ' + ( 'shrunk image' if config['backgroundShrink'] != 1 else 'full size image' ) )
+        elif opt == "--mask-storage":
+            config['maskStorage'] = arg
+            print( 'storing the pore masks: ' + arg )
+        elif opt == "--keep-intermediates":
+            print( 'storing the cut and processed images' )
+            config['keepIntermediates'] = True
+        elif opt == "--memory-limit":
+            if ( int( arg ) > -1 ):
+                config['memoryLimit'] = int( arg )
+                print( 'segmenting images needing more than ' + str( config['memoryLimit'] ) + ' MB in tiles' )
+        elif opt in ("-w", "--fiji-workers"):
+            if ( int( arg ) > -1 ):
+                config['fijiWorkers'] = int( arg )
+        elif opt == "--watch":
+            print( 'watching the folder for new images' )
+            config['watchFolder'] = True
+        elif opt == "--poll-interval":
+            if ( float( arg ) > 0 ):
+                config['pollInterval'] = float( arg )
+        elif opt == "--trace":
+            tracePath = arg
+        elif opt == "--profile":
+            profileStages = [ name.strip() for name in arg.split( ',' ) if name.strip() != '' ]
+        elif opt in ("-j", "--jobs"):
+            if ( int( arg ) > 0 ):
+                config['jobs'] = int( arg )
+        elif opt == "-d":
+            print( 'show debugging output' )
+            config['showDebuggingOutput'] = True
+    if ( config.get( 'memoryLimit', 0 ) > 0 ):
+        # the halo of the tiles depends on the radii of the background subtraction, the minimum of the single image pipeline
+        # is checked here, images of scale folders (radii depending on the image width) are checked one by one
+        from pore_analysis import tiles
+        minimumMemoryLimit = tiles.getMinimumMemoryLimit( config.get( 'backgroundShrink', analysis.defaultConfig['backgroundShrink'] ) )
+        if ( config['memoryLimit'] < minimumMemoryLimit ):
+            print( 'the tiled segmentation needs a memory limit of at least ' + str( minimumMemoryLimit ) + ' MB!' )
+            print( usage )
+            sys.exit( 2 )
+        if ( config.get( 'useNumpyEngine', False ) and config.get( 'maskStorage', 'none' ) != 'none' ):
+            print( 'the masks of images segmented in tiles can not be stored, use --mask-storage none with --memory-limit!' )
+            print( usage )
+            sys.exit( 2 )
+    if ( len( profileStages ) > 0 and tracePath == "" ):
+        tracePath = "pore_analysis_trace.jsonl"
+    if ( tracePath != "" ):
+        print( 'writing a trace to ' + tracePath + ( ', profiling ' + ', '.join( profileStages ) if len( profileStages ) > 0 else '' ) )
+    return config, tracePath, profileStages, args
+
+def main( argv, selectDirectory = None ):
+    # selectDirectory: function asking for the working directory if none is given as an argument
+    printBanner()
+    config, tracePath, profileStages, directories = processArguments( argv )
+    outputType = config.get( 'outputType', analysis.defaultConfig['outputType'] )
+    config = analysis.createConfig( config )
+    print( '' )
+    if ( config['showDebuggingOutput'] ) : print( "I am living in '" + analysis.home_dir + "'" )
+
+    if ( config['outputType'] == 0 and outputType not in ( 0, 1, 2, 3 ) ):
+        print( 'Output type is undefined! Resetting to area-%' )
+    elif ( config['outputType'] == 0 ):
+        print( 'Output type is set to area-%' )
+    elif ( config['outputType'] == 1 ):
+        print( 'Output type is set to px²' )
+    elif ( config['outputType'] == 2 ):
+        print( 'Output type is set to particle count' )
+    elif ( config['outputType'] == 3 ):
+        print( 'Output type is set to line count' )
+    if ( config['jobs'] > 1 ) : print( 'Using ' + str( config['jobs'] ) + ' worker processes' )
+
+    if ( len( directories ) == 0 ):
+        if ( selectDirectory is None ):
+            print( "usage: " + argv[0] + " " + options + " <directory> [<directory> ...]" )
+            sys.exit( 2 )
+        # the plot is opened when the folder was selected interactively
+        directories = [ selectDirectory() ]
+        config['openPlot'] = True
+        if ( not directories[0] ):
+            print( "no working directory selected" )
+            sys.exit( 1 )
+    if ( tracePath != "" ):
+        trace.start( tracePath, profileStages )
+
+    for workingDirectory in directories:
+        if ( config['showDebuggingOutput'] ) : print( "Selected working directory: " + workingDirectory )
+        with trace.stage( 'run', directory=workingDirectory ):
+            analysis.analyseFolder( workingDirectory, { key: config[key] for key in analysis.defaultConfig } )
+
+    if ( tracePath != "" ):
+        trace.stop()
+        trace.printSummary( tracePath )
+
+    print("-------")
+    print("DONE!")
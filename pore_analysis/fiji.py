@@ -0,0 +1,108 @@
+#########################################################
+# Persistent Fiji workers
+#
+# Starting Fiji for every image takes longer than analysing it.
+# A worker keeps one headless Fiji running (pore_analysis_worker.py)
+# and passes the macro arguments of one image after the other to
+# it through a pipe. Fiji reports the result of every image, so a
+# failed image does not stop the other ones.
+#
+#########################################################
+
+import collections
+import queue
+import subprocess
+import threading
+
+from pore_analysis import trace
+
+jobMarker = "PORE_ANALYSIS_JOB"
+logLength = 20 # Fiji output lines kept to report errors
+
+class FijiWorker:
+    def __init__( self, command, showDebuggingOutput = False ):
+        self.command = command
+        self.showDebuggingOutput = showDebuggingOutput
+        self.log = collections.deque( maxlen=logLength )
+        if ( showDebuggingOutput ) : print( command )
+        self.process = subprocess.Popen( command, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, bufsize=1 )
+
+    def isRunning( self ):
+        return ( self.process.poll() is None )
+
+    def getLog( self ):
+        return ' / '.join( line for line in self.log if line.strip() != '' )
+
+    def runJob( self, jobId, argument ):
+        # returns ( success, message ) after Fiji finished the job
+        try:
+            self.process.stdin.write( jobId + '\t' + argument + '\n' )
+            self.process.stdin.flush()
+        except OSError:
+            self.process.wait()
+            self.log.extend( self.process.stdout.read().splitlines() )
+            return False, "Fiji is not running (code " + str( self.process.poll() ) + "): " + self.getLog()
+        for line in self.process.stdout:
+            line = line.rstrip( '\r\n' )
+            if ( line.startswith( jobMarker + '\t' ) ):
+                fields = line.split( '\t', 3 )
+                if ( len( fields ) > 2 and fields[1] == jobId ):
+                    message = fields[3] if len( fields ) > 3 else ''
+                    if ( fields[2] != 'OK' and message == '' ):
+                        message = self.getLog()
+                    self.log.clear()
+                    return ( fields[2] == 'OK' ), message
+            else:
+                self.log.append( line )
+                if ( self.showDebuggingOutput ) : print( '  Fiji: ' + line )
+        self.process.wait()
+        return False, "Fiji exited (code " + str( self.process.returncode ) + "): " + self.getLog()
+
+    def close( self ):
+        # the worker quits at the end of its input
+        try:
+            self.process.stdin.close()
+            self.process.wait( timeout=60 )
+        except ( OSError, subprocess.TimeoutExpired ):
+            self.process.kill()
+
+def runJobs( command, arguments, names, workerCount = 1, showDebuggingOutput = False ):
+    # runs every macro argument on one of workerCount Fiji processes, returns ( success, message ) in the order of the arguments
+    jobs = queue.Queue()
+    for index, argument in enumerate( arguments ):
+        jobs.put( ( index, argument ) )
+    statuses = [ ( False, "not processed" ) for argument in arguments ]
+    printLock = threading.Lock()
+
+    def work():
+        worker = None
+        try:
+            while True:
+                try:
+                    index, argument = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                if ( worker is None or not worker.isRunning() ):
+                    # a crashed Fiji is replaced for the remaining images
+                    if ( worker is not None ):
+                        worker.close()
+                    worker = FijiWorker( command, showDebuggingOutput )
+                with trace.stage( 'fiji job', image=names[index] ) as stage:
+                    statuses[index] = worker.runJob( str( index ), argument )
+                    stage['success'] = statuses[index][0]
+                with printLock:
+                    if ( statuses[index][0] ):
+                        print( "  " + names[index] + ": done" )
+                    else:
+                        print( "  " + names[index] + ": failed - " + statuses[index][1] )
+        finally:
+            if ( worker is not None ):
+                worker.close()
+
+    print( "starting " + str( min( workerCount, len( arguments ) ) ) + " Fiji worker(s) for " + str( len( arguments ) ) + " image(s)..." )
+    threads = [ threading.Thread( target=work ) for i in range( min( workerCount, len( arguments ) ) ) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
@@ -0,0 +1,133 @@
+#########################################################
+# Continuous pore size distribution of the pore pixels
+#
+# The inscribed radius of a pore pixel is the radius of the
+# largest disk inside the pores that covers the pixel, so a
+# narrow channel of a large pore network keeps its width instead
+# of being counted with the area of the whole network. It is the
+# radius of the largest morphological opening the pixel survives.
+#
+# The squared Euclidean distance of every pixel to the solid
+# (scipy's linear-time distance transform, outside of the image
+# is solid) is the squared radius of the largest disk around the
+# pixel. Disks inside the disk of a neighbour (the look-up table
+# of every neighbour direction is exact on the pixel grid) are
+# dropped, the remaining disks are propagated to their pixels in
+# one pass per radius: every disk only paints the part not covered
+# by a neighbouring disk at least as large, so the pixels are
+# painted about twice instead of once per covering disk.
+#
+# distribution: rows of squared radius (px²) and pixel count of
+# every radius found in the mask
+#
+#########################################################
+
+import numpy as np
+
+binningVariable = 'inscribedRadius' # binned against poreSizeRangeArray in nm
+binningUnit = 'nm'
+paintBatchPixels = 1 << 22 # pixels painted at once, limits the memory of the propagation
+
+# neighbour directions (dy, dx), the first four come before the pixel in row order
+neighbourDirections = ( ( -1, -1 ), ( -1, 0 ), ( -1, 1 ), ( 0, -1 ), ( 0, 1 ), ( 1, -1 ), ( 1, 0 ), ( 1, 1 ) )
+
+def getSquaredDistances( mask ):
+    # squared distance of every pixel of the mask padded by 1 px of solid to the nearest solid pixel (0 on the solid)
+    from scipy import ndimage
+    distances = ndimage.distance_transform_edt( np.pad( np.asarray( mask, dtype=bool ), 1 ) )
+    np.square( distances, out=distances )
+    return np.rint( distances ).astype( np.int32 )
+
+def getDiskOffsets( maximumSquaredRadius ):
+    # offsets (dy, dx) of the disk of maximumSquaredRadius sorted by their squared length and the number of offsets
+    # within every squared radius, the disk of squared radius r holds the first counts[r] offsets (|offset|² < r)
+    reach = int( np.ceil( np.sqrt( maximumSquaredRadius ) ) )
+    dy, dx = np.mgrid[-reach:reach+1, -reach:reach+1]
+    squaredLengths = ( dy*dy + dx*dx ).ravel()
+    order = np.argsort( squaredLengths, kind='stable' )
+    squaredLengths = squaredLengths[order]
+    counts = np.searchsorted( squaredLengths, np.arange( maximumSquaredRadius + 1 ) )
+    return dy.ravel()[order], dx.ravel()[order], counts
+
+def getContainingRadii( offsetY, offsetX, counts, dy, dx ):
+    # smallest squared radius a disk at the neighbour ( dy, dx ) needs to contain the disk of every squared radius
+    farthest = np.maximum.accumulate( ( offsetY - dy )**2 + ( offsetX - dx )**2 )
+    return np.concatenate( ( [ 0 ], farthest ) )[counts] + 1
+
+def getDiskCenters( squaredDistances, offsetY, offsetX, counts ):
+    # flat positions of the pixels whose disk is not inside the disk of a neighbour (maximal disks)
+    width = squaredDistances.shape[1]
+    flatDistances = squaredDistances.ravel()
+    positions = np.flatnonzero( flatDistances )
+    values = flatDistances[positions]
+    isCenter = np.ones( len( positions ), dtype=bool )
+    for dy, dx in neighbourDirections:
+        containingRadii = getContainingRadii( offsetY, offsetX, counts, dy, dx ).astype( np.int32 )
+        isCenter &= flatDistances[positions + dy*width + dx] < containingRadii[values]
+    return positions[isCenter], values[isCenter]
+
+def getCoveringNeighbours( centers, values, shape ):
+    # neighbouring center of every center whose disk is at least as large (equal disks only before the center in row
+    # order, so no center depends on itself) and index of its direction, -1 if there is none
+    width = shape[1]
+    flatValues = np.zeros( shape[0]*width, dtype=np.int32 )
+    flatValues[centers] = values
+    neighbourValues = np.zeros( len( centers ), dtype=np.int32 )
+    directions = np.full( len( centers ), -1, dtype=np.int64 )
+    for i, ( dy, dx ) in enumerate( neighbourDirections ):
+        candidates = flatValues[centers + dy*width + dx]
+        better = ( ( candidates > values ) | ( ( candidates == values ) & ( i < 4 ) ) ) & ( candidates > neighbourValues )
+        neighbourValues[better] = candidates[better]
+        directions[better] = i
+    return neighbourValues, directions
+
+def measureSquaredRadii( mask ):
+    # squared inscribed radius (px²) of every pixel of the mask, 0 on the solid
+    squaredDistances = getSquaredDistances( mask )
+    height, width = squaredDistances.shape
+    squaredRadii = np.zeros( height*width, dtype=np.int32 )
+    maximumSquaredRadius = int( squaredDistances.max() )
+    if ( maximumSquaredRadius > 0 ):
+        offsetY, offsetX, counts = getDiskOffsets( maximumSquaredRadius )
+        centers, values = getDiskCenters( squaredDistances, offsetY, offsetX, counts )
+        neighbourValues, directions = getCoveringNeighbours( centers, values, ( height, width ) )
+        # one group per disk, covering disk and direction, ascending disks, so larger disks paint over smaller ones
+        keys = ( values.astype( np.int64 )*( maximumSquaredRadius + 1 ) + neighbourValues )*( len( neighbourDirections ) + 1 ) + directions + 1
+        order = np.argsort( keys, kind='stable' )
+        keys = keys[order]
+        centers = centers[order]
+        starts = np.flatnonzero( np.concatenate( ( [ True ], keys[1:] != keys[:-1] ) ) )
+        ends = np.concatenate( ( starts[1:], [ len( keys ) ] ) )
+        flatOffsets = offsetY*width + offsetX
+        for start, end in zip( starts.tolist(), ends.tolist() ):
+            key = int( keys[start] )
+            direction = key % ( len( neighbourDirections ) + 1 ) - 1
+            neighbourValue = key // ( len( neighbourDirections ) + 1 ) % ( maximumSquaredRadius + 1 )
+            value = key // ( len( neighbourDirections ) + 1 ) // ( maximumSquaredRadius + 1 )
+            diskSize = counts[value]
+            offsets = flatOffsets[:diskSize]
+            if ( direction >= 0 ):
+                # the part of the disk outside of the covering disk, the rest is painted by the covering disk
+                dy, dx = neighbourDirections[direction]
+                offsets = offsets[( offsetY[:diskSize] - dy )**2 + ( offsetX[:diskSize] - dx )**2 >= neighbourValue]
+            if ( len( offsets ) == 0 ):
+                continue
+            batchCenters = max( 1, paintBatchPixels // len( offsets ) )
+            for first in range( start, end, batchCenters ):
+                squaredRadii[( centers[first:min( first + batchCenters, end ), None] + offsets[None, :] ).ravel()] = value
+    return squaredRadii.reshape( height, width )[1:-1, 1:-1]
+
+def getDistribution( squaredRadii ):
+    # squared radius and pixel count of every inscribed radius of an image of squared radii
+    pixelCounts = np.bincount( squaredRadii.ravel() )
+    pixelCounts[0] = 0
+    values = np.flatnonzero( pixelCounts )
+    return np.column_stack( ( values, pixelCounts[values] ) ).astype( np.int64 )
+
+def measureMask( mask ):
+    # distribution of the inscribed radii of the pore pixels of a mask
+    return getDistribution( measureSquaredRadii( mask ) )
+
+def getRadii( distribution, scale = 1 ):
+    # inscribed radius of every row of a distribution, in nm if scale is the pixel size
+    return np.sqrt( np.asarray( distribution[:, 0], dtype=np.float64 ) ) * scale
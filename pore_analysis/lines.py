@@ -0,0 +1,72 @@
+#########################################################
+# Line length (chord length) analysis
+#
+# Replacement of the Line_Length_Counter plugin: all horizontal
+# and vertical runs of pore (void) pixels of a mask are found
+# at once using a run-length encoding of the rows / columns.
+#
+#########################################################
+
+import numpy as np
+
+# border flags of a line
+insideLine = 0
+borderLine = 1 # touches the image border on one side
+fullLine = 2 # spans the whole row / column
+
+horizontalLine = 0
+verticalLine = 1
+
+def getRunLengths( mask ):
+    # returns the lengths and border flags of all void runs within the rows of the mask
+    height, width = mask.shape
+    # a separating column after every row, so the rows can be processed as one flat array
+    padded = np.zeros( ( height, width+1 ), dtype=np.int8 )
+    padded[:, :width] = mask
+    flat = padded.ravel()
+    edges = np.flatnonzero( flat[1:] != flat[:-1] ) + 1
+    if ( flat[0] ):
+        edges = np.concatenate( ( [0], edges ) )
+    starts = edges[0::2] # every run starts and ends within its row
+    lengths = edges[1::2] - starts
+    startX = starts % ( width+1 )
+    border = ( startX == 0 ).astype( np.int32 ) + ( startX + lengths == width )
+    border[lengths == width] = fullLine
+    return lengths, np.minimum( border, fullLine )
+
+def transposeMask( mask, tileSize = 256 ):
+    # blockwise transposition, much faster than copying mask.T at once for large masks
+    height, width = mask.shape
+    transposed = np.empty( ( width, height ), dtype=mask.dtype )
+    for y in range( 0, height, tileSize ):
+        for x in range( 0, width, tileSize ):
+            transposed[x:x+tileSize, y:y+tileSize] = mask[y:y+tileSize, x:x+tileSize].T
+    return transposed
+
+def measureLines( mask ):
+    # returns an array with one row per line: length [px], direction, border flag
+    horizontalLengths, horizontalBorder = getRunLengths( mask )
+    verticalLengths, verticalBorder = getRunLengths( transposeMask( mask ) )
+    lines = np.empty( ( len( horizontalLengths ) + len( verticalLengths ), 3 ), dtype=np.int32 )
+    lines[:len( horizontalLengths ), 0] = horizontalLengths
+    lines[:len( horizontalLengths ), 1] = horizontalLine
+    lines[:len( horizontalLengths ), 2] = horizontalBorder
+    lines[len( horizontalLengths ):, 0] = verticalLengths
+    lines[len( horizontalLengths ):, 1] = verticalLine
+    lines[len( horizontalLengths ):, 2] = verticalBorder
+    return lines
+
+def getLineSelection( lines, minLength = 3, ignoreBorder = True, processHorizontal = True, processVertical = False ):
+    # returns a mask of all lines longer than minLength [px], like the plugin lines spanning the whole image are dropped
+    selected = ( lines[:, 0] > minLength ) & ( lines[:, 2] != fullLine )
+    if ( ignoreBorder ):
+        selected &= lines[:, 2] == insideLine
+    if ( not processHorizontal ):
+        selected &= lines[:, 1] != horizontalLine
+    if ( not processVertical ):
+        selected &= lines[:, 1] != verticalLine
+    return selected
+
+def selectLineLengths( lines, pixelSize, minLength = 3, ignoreBorder = True, processHorizontal = True, processVertical = False ):
+    # returns the lengths [nm] of the selected lines
+    return lines[getLineSelection( lines, minLength, ignoreBorder, processHorizontal, processVertical ), 0] * float( pixelSize )
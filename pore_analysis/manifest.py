@@ -0,0 +1,119 @@
+#########################################################
+# Manifest of the segmented images of a folder
+#
+# pores/manifest.json records the content hash of every image
+# together with the segmentation parameters used to create its
+# outputs. Images whose hash and parameters did not change since
+# the last run do not have to be segmented again.
+#
+#########################################################
+
+import hashlib
+import json
+import os
+
+manifestFileName = "manifest.json"
+manifestVersion = 1
+
+# outputs of the ImageJ macros and the in-process engine, relative to the image folder
+imageJOutputs = ( "/pores/{0}_pores_sqpx.csv", "/pores/{0}_pores_sqnm.csv", "/pores/{0}_size.txt", "/pores/{0}-masked.tif", "/pores/{0}-masked.zip", "/cut/{0}-cut.tif", "/processed/{0}-processed.tif" )
+numpyOutputs = ( "/pores/{0}_pores.npy", "/pores/{0}_lines.npy", "/pores/{0}_morphology.npy", "/pores/{0}_granulometry.npy", "/pores/{0}-mask.pmask", "/pores/{0}-masked.tif" )
+
+def getContentHash( path ):
+    contentHash = hashlib.blake2b( digest_size=20 )
+    with open( path, 'rb' ) as file:
+        for block in iter( lambda: file.read( 1 << 20 ), b'' ):
+            contentHash.update( block )
+    return contentHash.hexdigest()
+
+def getOutputFiles( directory, baseName, engine ):
+    outputs = numpyOutputs if engine == 'numpy' else imageJOutputs
+    return [ directory + output.format( baseName ) for output in outputs ]
+
+class Manifest:
+    def __init__( self, directory ):
+        self.directory = directory
+        self.path = directory + "/pores/" + manifestFileName
+        self.images = {}
+        self.changed = False
+        try:
+            with open( self.path, 'r' ) as manifestFile:
+                content = json.load( manifestFile )
+            if ( content.get( 'version' ) == manifestVersion ):
+                self.images = content['images']
+        except ( OSError, ValueError, KeyError ):
+            pass
+        self.knownHashes = { filename: ( entry['size'], entry['mtime'], entry['hash'] ) for filename, entry in self.images.items() }
+
+    def getContentHash( self, filename ):
+        # the hash is only recalculated if the size or modification time of the image changed
+        stat = os.stat( self.directory + '/' + filename )
+        knownHash = self.knownHashes.get( filename )
+        if ( knownHash is not None and knownHash[0] == stat.st_size and knownHash[1] == stat.st_mtime_ns ):
+            return knownHash[2]
+        contentHash = getContentHash( self.directory + '/' + filename )
+        self.knownHashes[filename] = ( stat.st_size, stat.st_mtime_ns, contentHash )
+        return contentHash
+
+    def isUpToDate( self, filename, parameters, engine ):
+        # parameters: thresholdLimit, infoBarHeight, scale, doSpeckleCleaning, doRemoveBorderPercent
+        entry = self.images.get( filename )
+        if ( entry is None or entry['engine'] != engine or entry['parameters'] != parameters ):
+            return False
+        if ( entry['hash'] != self.getContentHash( filename ) ):
+            return False
+        size, mtime, contentHash = self.knownHashes[filename]
+        if ( entry['size'] != size or entry['mtime'] != mtime ):
+            # same content with a new time stamp (e.g. copied), avoids hashing the image again next time
+            entry['size'] = size
+            entry['mtime'] = mtime
+            self.changed = True
+        baseName = os.path.splitext( filename )[0]
+        requiredOutput = getOutputFiles( self.directory, baseName, engine )[0]
+        return os.path.exists( requiredOutput )
+
+    def invalidate( self, filename, engine = None ):
+        # removes the outputs the next segmentation using engine (default: the engine of the manifest entry) writes again
+        # outputs of the ImageJ macros are only removed if the manifest recorded them, results of earlier runs are kept
+        entry = self.images.get( filename )
+        recordedEngine = entry['engine'] if entry is not None else None
+        engine = engine or recordedEngine
+        if ( engine is not None ):
+            baseName = os.path.splitext( filename )[0]
+            imageJFiles = set( getOutputFiles( self.directory, baseName, 'imagej' ) )
+            for output in getOutputFiles( self.directory, baseName, engine ):
+                if ( output in imageJFiles and recordedEngine is None ):
+                    continue
+                if os.path.exists( output ):
+                    os.remove( output )
+        if ( self.images.pop( filename, None ) is not None ):
+            self.changed = True
+
+    def update( self, filename, parameters, engine, imageSize = None ):
+        self.getContentHash( filename ) # refreshes the known hash
+        size, mtime, contentHash = self.knownHashes[filename]
+        self.images[filename] = {
+            'hash': contentHash,
+            'size': size,
+            'mtime': mtime,
+            'engine': engine,
+            'parameters': parameters,
+            'imageSize': imageSize
+        }
+        self.changed = True
+
+    def removeMissingImages( self, filenames ):
+        # invalidates the outputs of images which were deleted or renamed
+        for filename in list( self.images.keys() ):
+            if ( filename not in filenames ):
+                print( " removing outputs of the missing image " + filename )
+                self.invalidate( filename )
+
+    def save( self ):
+        if ( not self.changed or not os.path.isdir( self.directory + "/pores/" ) ):
+            return
+        temporaryPath = self.path + '.tmp'
+        with open( temporaryPath, 'w' ) as manifestFile:
+            json.dump( { 'version': manifestVersion, 'images': self.images }, manifestFile, indent=1 )
+        os.replace( temporaryPath, self.path )
+        self.changed = False
@@ -0,0 +1,75 @@
+#########################################################
+# Compact storage of binary pore masks
+#
+# pores/<image>-mask.pmask keeps the pore mask of the in-process
+# engine bit-packed (8 pixels per byte) in blocks of rowsPerBlock
+# rows, every block compressed on its own. A JSON header holds the
+# image size and the position of every block, so a range of rows
+# is decoded without reading the rest of the file and the size is
+# known without decoding anything. A mask usually takes less than
+# 1/20 of an uncompressed 8-bit TIFF.
+#
+# file layout: magic, header length (uint64), JSON header,
+#              compressed blocks
+#
+#########################################################
+
+import json
+import struct
+import zlib
+import numpy as np
+
+suffix_Mask = "-mask.pmask"
+maskMagic = b'POREMASK'
+maskVersion = 1
+rowsPerBlock = 64
+compressionLevel = 1 # higher levels hardly shrink bit-packed masks, but take much longer
+
+def writeMask( path, mask, blockRows = rowsPerBlock ):
+    # returns the number of bytes written
+    mask = np.asarray( mask, dtype=bool )
+    height, width = mask.shape
+    blocks = [ zlib.compress( np.packbits( mask[row:row+blockRows], axis=1 ).tobytes(), compressionLevel ) for row in range( 0, height, blockRows ) ]
+    offsets = np.concatenate( ( [ 0 ], np.cumsum( [ len( block ) for block in blocks ], dtype=np.int64 ) ) ).tolist()
+    header = json.dumps( { 'version': maskVersion, 'width': width, 'height': height, 'rowsPerBlock': blockRows, 'offsets': offsets } ).encode( 'utf-8' )
+    with open( path, 'wb' ) as maskFile:
+        maskFile.write( struct.pack( '<8sQ', maskMagic, len( header ) ) )
+        maskFile.write( header )
+        for block in blocks:
+            maskFile.write( block )
+    return 16 + len( header ) + offsets[-1]
+
+def readHeader( maskFile ):
+    # header of an open mask file and the offset of the first block
+    magic, headerLength = struct.unpack( '<8sQ', maskFile.read( 16 ) )
+    if ( magic != maskMagic ):
+        raise ValueError( "no pore mask file" )
+    header = json.loads( maskFile.read( headerLength ).decode( 'utf-8' ) )
+    if ( header.get( 'version' ) != maskVersion ):
+        raise ValueError( "unsupported pore mask version" )
+    return header, 16 + headerLength
+
+def readMaskSize( path ):
+    # ( width, height ) of the mask, the blocks are not read
+    with open( path, 'rb' ) as maskFile:
+        header, dataOffset = readHeader( maskFile )
+    return header['width'], header['height']
+
+def readMask( path, startRow = 0, stopRow = None ):
+    # boolean mask of the rows startRow to stopRow (excluding), only the blocks of these rows are read
+    with open( path, 'rb' ) as maskFile:
+        header, dataOffset = readHeader( maskFile )
+        width = header['width']
+        height = header['height']
+        blockRows = header['rowsPerBlock']
+        offsets = header['offsets']
+        stopRow = height if stopRow is None else min( stopRow, height )
+        startRow = max( 0, min( startRow, stopRow ) )
+        firstBlock = startRow // blockRows
+        lastBlock = -( -stopRow // blockRows )
+        maskFile.seek( dataOffset + offsets[firstBlock] )
+        data = maskFile.read( offsets[lastBlock] - offsets[firstBlock] )
+    packedRows = [ zlib.decompress( data[offsets[i]-offsets[firstBlock]:offsets[i+1]-offsets[firstBlock]] ) for i in range( firstBlock, lastBlock ) ]
+    packed = np.frombuffer( b''.join( packedRows ), dtype=np.uint8 ).reshape( -1, -( -width // 8 ) )
+    rows = np.unpackbits( packed, axis=1, count=width ).view( bool )
+    return rows[startRow - firstBlock*blockRows:stopRow - firstBlock*blockRows]
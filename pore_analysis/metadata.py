@@ -0,0 +1,232 @@
+#########################################################
+# SEM metadata parser
+#
+# Reads the FEI / Thermo Fisher metadata block (an ini-like text
+# with sections like [Scan] and [Image]) directly from its TIFF tag
+# with a few small reads instead of scanning the whole file.
+# Parsed headers are cached per directory in pores/ next to the
+# manifest, keyed by file name, size and modification time.
+#
+#########################################################
+
+import json
+import mmap
+import os
+import struct
+import threading
+
+# TIFF tags written by FEI / Thermo Fisher microscopes
+feiMetaDataTags = ( 34682, 34680 ) # FEI_HELIOS, FEI_SFEG
+imageWidthTag = 256
+imageLengthTag = 257
+stripOffsetsTag = 273
+stripByteCountsTag = 279
+cacheFileName = "metadata.json" # within pores/ of the image directory
+cacheVersion = 1
+
+def parseMetaDataText( text ):
+    # returns { section: { key: value } }
+    sections = {}
+    section = sections.setdefault( '', {} )
+    for line in text.splitlines():
+        line = line.strip().strip( '\x00' )
+        if ( line.startswith( '[' ) and line.endswith( ']' ) ):
+            section = sections.setdefault( line[1:-1], {} )
+        elif ( '=' in line ):
+            key, value = line.split( '=', 1 )
+            section[key.strip()] = value.strip()
+    return sections
+
+def readTiffTags( file ):
+    # returns the entries of the first IFD as { tag: ( type, count, valueOrOffset bytes ) } and the byte order
+    header = file.read( 8 )
+    if ( header[:2] == b'II' ):
+        byteOrder = '<'
+    elif ( header[:2] == b'MM' ):
+        byteOrder = '>'
+    else:
+        return None, None
+    magic, ifdOffset = struct.unpack( byteOrder + 'HI', header[2:8] )
+    if ( magic != 42 ): # BigTIFF and other formats are handled by the fallback
+        return None, None
+    file.seek( ifdOffset )
+    entryCount = struct.unpack( byteOrder + 'H', file.read( 2 ) )[0]
+    entries = file.read( 12 * entryCount )
+    tags = {}
+    for i in range( entryCount ):
+        tag, fieldType, count = struct.unpack( byteOrder + 'HHI', entries[i*12:i*12+8] )
+        tags[tag] = ( fieldType, count, entries[i*12+8:i*12+12] )
+    return tags, byteOrder
+
+def getTagNumber( tags, byteOrder, tag ):
+    fieldType, count, value = tags[tag]
+    if ( fieldType == 3 ): # SHORT
+        return struct.unpack( byteOrder + 'H', value[:2] )[0]
+    return struct.unpack( byteOrder + 'I', value )[0]
+
+def getTagValues( file, tags, byteOrder, tag ):
+    # returns all values of a SHORT or LONG tag, e.g. the strip offsets
+    fieldType, count, value = tags[tag]
+    format = byteOrder + str( count ) + ( 'H' if fieldType == 3 else 'I' )
+    size = struct.calcsize( format )
+    if ( size > 4 ):
+        file.seek( struct.unpack( byteOrder + 'I', value )[0] )
+        value = file.read( size )
+    return struct.unpack( format, value[:size] )
+
+def readTiffHeader( path ):
+    # returns the image size and the metadata sections or None if this is no (readable) TIFF
+    with open( path, 'rb' ) as file:
+        tags, byteOrder = readTiffTags( file )
+        if ( tags is None or imageWidthTag not in tags or imageLengthTag not in tags ):
+            return None
+        header = {
+            'width': getTagNumber( tags, byteOrder, imageWidthTag ),
+            'height': getTagNumber( tags, byteOrder, imageLengthTag ),
+            'metadata': {}
+        }
+        for tag in feiMetaDataTags:
+            if ( tag in tags ):
+                fieldType, count, value = tags[tag]
+                if ( count > 4 ):
+                    file.seek( struct.unpack( byteOrder + 'I', value )[0] )
+                    value = file.read( count )
+                header['metadata'] = parseMetaDataText( value[:count].decode( 'latin-1' ) )
+                break
+    return header
+
+def isImageComplete( path ):
+    # False while the image is still being written: the TIFF directory or a strip lies beyond the end of the file
+    try:
+        with open( path, 'rb' ) as file:
+            tags, byteOrder = readTiffTags( file )
+            if ( tags is None ):
+                # other formats (and BigTIFF) are complete if PIL can decode them
+                from PIL import Image
+                file.seek( 0 )
+                with Image.open( file ) as im:
+                    im.load()
+                return True
+            if ( imageWidthTag not in tags or imageLengthTag not in tags ):
+                return False
+            if ( stripOffsetsTag not in tags or stripByteCountsTag not in tags ):
+                return True
+            stripOffsets = getTagValues( file, tags, byteOrder, stripOffsetsTag )
+            stripByteCounts = getTagValues( file, tags, byteOrder, stripByteCountsTag )
+            return max( offset + count for offset, count in zip( stripOffsets, stripByteCounts ) ) <= os.fstat( file.fileno() ).st_size
+    except ( OSError, ValueError, struct.error ):
+        return False
+
+def scanMetaData( path ):
+    # fallback for files without the FEI tag: search the keywords in the whole file
+    sections = {}
+    with open( path, 'rb', 0 ) as file:
+        if ( os.fstat( file.fileno() ).st_size == 0 ):
+            return sections
+        with mmap.mmap( file.fileno(), 0, access=mmap.ACCESS_READ ) as s:
+            for section, key in ( ( 'Scan', 'PixelWidth' ), ( 'Image', 'ResolutionY' ) ):
+                position = s.find( key.encode() + b'=' )
+                if ( position != -1 ):
+                    end = s.find( b'\n', position )
+                    line = s[position:end if end != -1 else len( s )].decode( 'latin-1' )
+                    sections.setdefault( section, {} )[key] = line.split( '=', 1 )[1].strip()
+    return sections
+
+def readHeader( path ):
+    header = readTiffHeader( path )
+    if ( header is None ):
+        from PIL import Image
+        im = Image.open( path )
+        width, height = im.size
+        im.close()
+        header = { 'width': width, 'height': height, 'metadata': {} }
+    if ( not header['metadata'] ):
+        header['metadata'] = scanMetaData( path )
+    return header
+
+def getValue( header, key, preferredSection = None ):
+    sections = header['metadata']
+    if ( preferredSection in sections and key in sections[preferredSection] ):
+        return sections[preferredSection][key]
+    for section in sections.values():
+        if ( key in section ):
+            return section[key]
+    return None
+
+def getPixelSize( header ):
+    # in nm / px, 0 if unknown
+    value = getValue( header, 'PixelWidth', 'Scan' )
+    try:
+        return float( value )*1000000000 if value is not None else 0
+    except ValueError:
+        return 0
+
+def getContentHeight( header ):
+    # image height without the info bar, 0 if unknown
+    value = getValue( header, 'ResolutionY', 'Image' )
+    try:
+        return float( value ) if value is not None else 0
+    except ValueError:
+        return 0
+
+class MetaDataCache:
+    def __init__( self, directory ):
+        self.directory = directory
+        self.path = os.path.join( directory, 'pores', cacheFileName )
+        self.entries = {}
+        self.changed = False
+        self.lock = threading.Lock() # several threads may analyse images of the same folder
+        try:
+            with open( self.path, 'r' ) as cacheFile:
+                content = json.load( cacheFile )
+            if ( content.get( 'version' ) == cacheVersion ):
+                self.entries = content['files']
+        except ( OSError, ValueError, KeyError ):
+            pass
+
+    def getHeader( self, filename ):
+        stat = os.stat( os.path.join( self.directory, filename ) )
+        entry = self.entries.get( filename )
+        if ( entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns ):
+            entry = { 'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'header': readHeader( os.path.join( self.directory, filename ) ) }
+            with self.lock:
+                self.entries[filename] = entry
+                self.changed = True
+        return entry['header']
+
+    def save( self ):
+        with self.lock:
+            self.saveEntries()
+
+    def saveEntries( self ):
+        # the image directory itself is never written, the cache is kept until pores/ exists
+        if ( not self.changed or not os.path.isdir( os.path.dirname( self.path ) ) ):
+            return
+        try:
+            temporaryPath = self.path + '.tmp'
+            with open( temporaryPath, 'w' ) as cacheFile:
+                json.dump( { 'version': cacheVersion, 'files': self.entries }, cacheFile )
+            os.replace( temporaryPath, self.path )
+            self.changed = False
+        except OSError:
+            print( " unable to write the metadata cache '" + self.path + "'" )
+
+metaDataCaches = {}
+metaDataCachesLock = threading.Lock()
+
+def getMetaDataCache( directory ):
+    directory = os.path.normpath( directory )
+    with metaDataCachesLock:
+        if ( directory not in metaDataCaches ):
+            metaDataCaches[directory] = MetaDataCache( directory )
+        return metaDataCaches[directory]
+
+def getImageHeader( directory, filename ):
+    return getMetaDataCache( directory ).getHeader( filename )
+
+def saveMetaDataCaches():
+    # other threads may add caches meanwhile
+    with metaDataCachesLock:
+        caches = list( metaDataCaches.values() )
+    for cache in caches:
+        cache.save()
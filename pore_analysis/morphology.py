@@ -0,0 +1,206 @@
+#########################################################
+# Morphology descriptors of all pores of an image
+#
+# Measures every particle of a label image at once using
+# bincount / reduceat reductions over its pixels and the convex
+# hulls of all particles built in common passes, there is no loop
+# over the particles, so the time grows with the pore pixels and
+# 10^6 pores per image take seconds.
+#
+# area:               pixel count
+# equivalentDiameter: diameter of a circle of the same area
+# perimeter:          length of the pixel outline, convex corners are
+#                     cut like the diagonal steps of ImageJ's traced
+#                     perimeter
+# feretMax/feretMin:  largest / smallest caliper width of the
+#                     pixel squares, exactly on their convex hull
+# aspectRatio:        major / minor axis of the ellipse with the
+#                     same second moments (AR of ImageJ)
+# centroidX/Y:        center of mass from the upper left corner
+#
+# all lengths are scaled to nm (areas to nm²) if a scale is given
+#
+#########################################################
+
+import math
+import numpy as np
+
+descriptorNames = ( 'area', 'equivalentDiameter', 'perimeter', 'feretMax', 'feretMin', 'aspectRatio', 'centroidX', 'centroidY' )
+descriptorUnits = ( 'nm²', 'nm', 'nm', 'nm', 'nm', '', 'nm', 'nm' )
+feretBatchPairs = 1 << 22 # hull vertex pairs measured at once, limits the memory of the Feret diameters
+
+def getDescriptorIndex( name ):
+    return descriptorNames.index( name )
+
+def getNeighbourDifferences( labels ):
+    # flat positions of the particle pixels in the padded label image, their labels and, for the
+    # 8 neighbours N, S, W, E, NW, NE, SW, SE, whether the neighbour belongs to another particle
+    padded = np.pad( labels, 1 )
+    width = padded.shape[1]
+    flatLabels = padded.ravel()
+    positions = np.flatnonzero( flatLabels )
+    pixelLabels = flatLabels[positions]
+    offsets = ( -width, width, -1, 1, -width-1, -width+1, width-1, width+1 )
+    differences = [ flatLabels[positions + offset] != pixelLabels for offset in offsets ]
+    return positions, width, pixelLabels, differences
+
+def getGroupStarts( groups ):
+    # first index of every run of equal values in the sorted array groups
+    return np.flatnonzero( np.concatenate( ( [ True ], groups[1:] != groups[:-1] ) ) )
+
+def getNeighbourIndices( starts, count ):
+    # previous and following element of every element of the cyclic groups starting at starts
+    ends = np.concatenate( ( starts[1:], [ count ] ) )
+    previous = np.arange( -1, count-1 )
+    previous[starts] = ends - 1
+    following = np.arange( 1, count+1 )
+    following[ends - 1] = starts
+    return previous, following
+
+def getHullVertices( x, y, pixelLabels, west, east ):
+    # vertices of the convex hulls of the pixel squares of all particles in doubled coordinates (pixel corners are odd)
+    # returns x, y and the label of every vertex, sorted by label, every hull in the same turning direction
+    # the hull of a particle is made of the pixel corners of the leftmost and the rightmost pixel of every row:
+    # the outline down the left and up the right side is y-monotone, removing its reflex vertices until none
+    # are left gives the convex hull, all particles are processed at once in every pass
+    # x, y, pixelLabels: pixels in row-major order, west, east: the neighbour belongs to another particle
+    firstPixels = np.flatnonzero( west )
+    firstPixels = firstPixels[np.argsort( pixelLabels[firstPixels], kind='stable' )]
+    lastPixels = np.flatnonzero( east )
+    lastPixels = lastPixels[np.argsort( pixelLabels[lastPixels], kind='stable' )]
+    # rows of every particle sorted by label and y, every row holds runs starting at west and ending at east borders
+    rowKeys = pixelLabels[firstPixels].astype( np.int64 ) * ( int( y.max() ) + 2 ) + y[firstPixels]
+    rowStarts = getGroupStarts( rowKeys )
+    rowEnds = np.concatenate( ( getGroupStarts( pixelLabels[lastPixels].astype( np.int64 ) * ( int( y.max() ) + 2 ) + y[lastPixels] )[1:], [ len( lastPixels ) ] ) ) - 1
+    leftX = 2 * x[firstPixels[rowStarts]].astype( np.int64 ) - 1
+    rightX = 2 * x[lastPixels[rowEnds]].astype( np.int64 ) + 1
+    rowY = 2 * y[firstPixels[rowStarts]].astype( np.int64 )
+    rowLabels = pixelLabels[firstPixels[rowStarts]]
+    # corners down the left and up the right side of every particle, corners between two rows starting
+    # (ending) at the same x are no vertices
+    particleStarts = getGroupStarts( rowLabels )
+    rowCounts = np.diff( np.concatenate( ( particleStarts, [ len( rowLabels ) ] ) ) )
+    firstRows = np.repeat( particleStarts, rowCounts )
+    lastRows = firstRows + np.repeat( rowCounts, rowCounts ) - 1
+    rows = np.arange( len( rowLabels ) )
+    isFirst = rows == firstRows
+    isLast = rows == lastRows
+    leftBase = 4 * firstRows + 2 * ( rows - firstRows )
+    rightBase = 2 * firstRows + 2 * lastRows + 2 * ( lastRows - rows ) + 2
+    vertexX = np.empty( 4 * len( rowLabels ), dtype=np.int64 )
+    vertexY = np.empty( 4 * len( rowLabels ), dtype=np.int64 )
+    isVertex = np.empty( 4 * len( rowLabels ), dtype=bool )
+    for base, offset, cornerX, cornerY, keep in (
+            ( leftBase, 0, leftX, rowY - 1, isFirst | ( leftX != np.roll( leftX, 1 ) ) ),
+            ( leftBase, 1, leftX, rowY + 1, isLast | ( leftX != np.roll( leftX, -1 ) ) ),
+            ( rightBase, 0, rightX, rowY + 1, isLast | ( rightX != np.roll( rightX, -1 ) ) ),
+            ( rightBase, 1, rightX, rowY - 1, isFirst | ( rightX != np.roll( rightX, 1 ) ) ) ):
+        vertexX[base + offset] = cornerX
+        vertexY[base + offset] = cornerY
+        isVertex[base + offset] = keep
+    vertexX = vertexX[isVertex]
+    vertexY = vertexY[isVertex]
+    vertexLabels = np.repeat( rowLabels, 4 )[isVertex]
+    # only particles which lost vertices in a pass are checked again
+    hullParts = []
+    while ( len( vertexLabels ) > 0 ):
+        starts = getGroupStarts( vertexLabels )
+        counts = np.diff( np.concatenate( ( starts, [ len( vertexLabels ) ] ) ) )
+        previous, following = getNeighbourIndices( starts, len( vertexLabels ) )
+        turn = ( vertexX - vertexX[previous] ) * ( vertexY[following] - vertexY ) - ( vertexY - vertexY[previous] ) * ( vertexX[following] - vertexX )
+        # convex vertices turn negative, collinear and repeated corners are no vertices
+        convex = turn < 0
+        changed = np.repeat( np.logical_and.reduceat( convex, starts ) == False, counts )
+        finished = ~changed
+        hullParts.append( ( vertexX[finished], vertexY[finished], vertexLabels[finished] ) )
+        active = changed & convex
+        vertexX = vertexX[active]
+        vertexY = vertexY[active]
+        vertexLabels = vertexLabels[active]
+    vertexX, vertexY, vertexLabels = [ np.concatenate( part ) for part in zip( *hullParts ) ]
+    order = np.argsort( vertexLabels, kind='stable' )
+    return vertexX[order], vertexY[order], vertexLabels[order]
+
+def getPairs( counts ):
+    # all ordered pairs of elements within the groups of the given sizes: first and second element index
+    starts = np.concatenate( ( [ 0 ], np.cumsum( counts[:-1] ) ) )
+    elementGroups = np.repeat( np.arange( len( counts ) ), counts )
+    first = np.repeat( np.arange( counts.sum() ), counts[elementGroups] )
+    pairStarts = np.repeat( np.concatenate( ( [ 0 ], np.cumsum( counts[elementGroups][:-1] ) ) ), counts[elementGroups] )
+    second = starts[elementGroups[first]] + np.arange( len( first ) ) - pairStarts
+    return first, second
+
+def measureFeretBatch( vertexX, vertexY, counts ):
+    # largest and smallest width of consecutive convex hulls with counts vertices
+    # feretMax: largest vertex distance, feretMin: smallest width across a hull edge (the smallest width of a convex
+    # polygon is always found along one of its edges), widths over all vertex pairs of a hull
+    starts = np.concatenate( ( [ 0 ], np.cumsum( counts[:-1] ) ) )
+    elementGroups = np.repeat( np.arange( len( counts ) ), counts )
+    following = getNeighbourIndices( starts, len( vertexX ) )[1]
+    edgeX = vertexX[following] - vertexX
+    edgeY = vertexY[following] - vertexY
+    first, second = getPairs( counts )
+    dx = vertexX[second] - vertexX[first]
+    dy = vertexY[second] - vertexY[first]
+    pairStarts = np.concatenate( ( [ 0 ], np.cumsum( counts[elementGroups][:-1] ) ) )
+    distances = np.maximum.reduceat( dx*dx + dy*dy, pairStarts )
+    edgeDistances = np.maximum.reduceat( np.abs( edgeX[first] * dy - edgeY[first] * dx ), pairStarts ) / np.hypot( edgeX, edgeY )
+    # doubled coordinates
+    return np.sqrt( np.maximum.reduceat( distances, starts ) ) / 2, np.minimum.reduceat( edgeDistances, starts ) / 2
+
+def measureFeretDiameters( x, y, pixelLabels, west, east, particleCount ):
+    # largest and smallest caliper width of the pixel squares of every particle
+    # the hulls are measured in batches of up to feretBatchPairs vertex pairs to limit the memory
+    if ( particleCount == 0 ):
+        return np.zeros( 0 ), np.zeros( 0 )
+    vertexX, vertexY, vertexLabels = getHullVertices( x, y, pixelLabels, west, east )
+    counts = np.bincount( vertexLabels, minlength=particleCount+1 )[1:]
+    vertexEnds = np.cumsum( counts )
+    pairEnds = np.cumsum( counts.astype( np.int64 ) ** 2 )
+    feretMax = np.zeros( particleCount )
+    feretMin = np.zeros( particleCount )
+    first = 0
+    while ( first < particleCount ):
+        pairStart = pairEnds[first] - counts[first] ** 2
+        last = max( first+1, int( np.searchsorted( pairEnds, pairStart + feretBatchPairs, side='right' ) ) )
+        vertexStart = vertexEnds[first] - counts[first]
+        feretMax[first:last], feretMin[first:last] = measureFeretBatch( vertexX[vertexStart:vertexEnds[last-1]], vertexY[vertexStart:vertexEnds[last-1]], counts[first:last] )
+        first = last
+    return feretMax, feretMin
+
+def measureDescriptors( labels, particleCount, scale = 0 ):
+    # particles x descriptorNames array of the particles 1 to particleCount of the label image
+    # only the particle pixels and their neighbours are visited, not the whole image
+    positions, width, pixelLabels, ( north, south, west, east, northWest, northEast, southWest, southEast ) = getNeighbourDifferences( np.asarray( labels ) )
+    pixelY = positions // width - 1
+    pixelX = positions % width - 1
+    y = pixelY.astype( np.float64 )
+    x = pixelX.astype( np.float64 )
+    binCount = particleCount+1
+    area = np.bincount( pixelLabels, minlength=binCount )[1:].astype( np.float64 )
+    pixelCount = np.maximum( area, 1 )
+    centroidX = np.bincount( pixelLabels, weights=x, minlength=binCount )[1:] / pixelCount
+    centroidY = np.bincount( pixelLabels, weights=y, minlength=binCount )[1:] / pixelCount
+    # central second moments, every pixel is a square with the moment 1/12
+    xx = np.bincount( pixelLabels, weights=x*x, minlength=binCount )[1:] / pixelCount - centroidX*centroidX + 1/12
+    yy = np.bincount( pixelLabels, weights=y*y, minlength=binCount )[1:] / pixelCount - centroidY*centroidY + 1/12
+    xy = np.bincount( pixelLabels, weights=x*y, minlength=binCount )[1:] / pixelCount - centroidX*centroidY
+    spread = np.sqrt( ( ( xx - yy )/2 )**2 + xy*xy )
+    majorMoment = ( xx + yy )/2 + spread
+    minorMoment = np.maximum( ( xx + yy )/2 - spread, 1e-12 )
+    # outline: pixel edges to other particles, a convex corner cuts 2-sqrt(2) like a diagonal step of ImageJ's traced perimeter
+    edges = north.astype( np.int8 ) + south + west + east
+    corners = ( north & west & northWest ).astype( np.int8 ) + ( north & east & northEast ) + ( south & west & southWest ) + ( south & east & southEast )
+    perimeter = np.bincount( pixelLabels, weights=edges - corners*( 2 - math.sqrt( 2 ) ), minlength=binCount )[1:]
+    feretMax, feretMin = measureFeretDiameters( pixelX, pixelY, pixelLabels, west, east, particleCount )
+    descriptors = np.column_stack( ( area, 2*np.sqrt( area/math.pi ), perimeter, feretMax, feretMin, np.sqrt( majorMoment/minorMoment ), centroidX + 0.5, centroidY + 0.5 ) )
+    if ( scale > 0 ):
+        descriptors[:, 0] *= scale * scale
+        descriptors[:, [ 1, 2, 3, 4, 6, 7 ]] *= scale
+    return descriptors
+
+def measureMask( mask, scale = 0 ):
+    # descriptors of the particles of a pore mask in the order of segmentation.analyseParticles()
+    from pore_analysis import segmentation
+    labels, particleCount = segmentation.labelParticles( mask )
+    return measureDescriptors( labels, particleCount, scale )
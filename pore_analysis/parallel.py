@@ -0,0 +1,296 @@
+#########################################################
+# Parallel image analysis
+#
+# Every image is described by a task dictionary and measured by
+# measureImageTask(), which only depends on the task itself.
+# runTasks() returns the results in task order, no matter how
+# many worker processes were used. analyseTasks() keeps the
+# measurements in the particle store of every folder and bins
+# them there.
+#
+#########################################################
+
+import os
+import subprocess
+import numpy as np
+
+from pore_analysis import results, trace
+
+def runImageJMacro( command, showDebuggingOutput = False ):
+    # returns True if ImageJ finished without an error
+    print( "starting ImageJ Macro..." )
+    if ( showDebuggingOutput ) : print( command )
+    with trace.stage( 'imagej' ) as stage:
+        try:
+            subprocess.check_output(command, shell=True, stderr=subprocess.STDOUT)
+        except subprocess.CalledProcessError as e:
+            output = [ line for line in e.output.decode( errors='replace' ).splitlines() if line.strip() != '' ] if e.output else []
+            print( "Error: ImageJ returned " + str( e.returncode ) + ( ": " + ' / '.join( output[-5:] ) if output else "" ) )
+            if ( showDebuggingOutput ) : print( command )
+            stage['returnCode'] = e.returncode
+            return False
+    return True
+
+def createImageTask( directory, filename, pixelSize, options, command = None, upToDate = False, imageSize = None ):
+    # options: thresholdLimit, infoBarHeight, doSpeckleCleaning, doRemoveBorderPercent, useNumpyEngine,
+    #          outputType, calculatePoreDiameter, poreSizeRangeArray, binningVariable, showDebuggingOutput,
+    #          minLineLength, ignoreBorderLines, processHorizontalLines, processVerticalLines, memoryLimit,
+    #          backgroundShrink, maskStorage, previewFactor, pipeline, trace
+    task = dict( options )
+    task['directory'] = directory
+    task['filename'] = filename
+    task['baseName'] = os.path.splitext( filename )[0]
+    task['pixelSize'] = pixelSize
+    task['command'] = command
+    task['upToDate'] = upToDate # outputs of a previous run can be used (in-process engine)
+    task['imageSize'] = imageSize
+    task['poreAreaFile'] = directory + results.outputDir_Pores + task['baseName'] + results.suffix_PoreAreas
+    task['lineFile'] = directory + results.outputDir_Pores + task['baseName'] + results.suffix_Lines
+    task['morphologyFile'] = directory + results.outputDir_Pores + task['baseName'] + results.suffix_Morphology
+    task['granulometryFile'] = directory + results.outputDir_Pores + task['baseName'] + results.suffix_Granulometry
+    return task
+
+def getEngine( task ):
+    return 'numpy' if task['useNumpyEngine'] else 'imagej'
+
+def needsGranulometry( task ):
+    # True if the pore pixels are binned by their inscribed radius (pore_analysis.granulometry) instead of the pore areas
+    from pore_analysis import granulometry
+    return ( task['binningVariable'] == granulometry.binningVariable )
+
+def needsMorphology( task ):
+    # True if the pores are binned by a descriptor of pore_analysis.morphology instead of their area
+    return ( task['binningVariable'] != 'area' and not needsGranulometry( task ) )
+
+def getSourceFiles( task ):
+    # files the particle measurements of the image are read from
+    if ( not task['useNumpyEngine'] ):
+        return [ task['directory'] + results.outputDir_Pores + task['baseName'] + results.suffix_Pores ]
+    if ( task['outputType'] == 3 ):
+        return [ task['poreAreaFile'], task['lineFile'] ]
+    if ( needsMorphology( task ) ):
+        return [ task['poreAreaFile'], task['morphologyFile'] ]
+    if ( needsGranulometry( task ) ):
+        return [ task['poreAreaFile'], task['granulometryFile'] ]
+    return [ task['poreAreaFile'] ]
+
+def getBinningValues( task, descriptors ):
+    # the binning variable of every particle, None to bin the pore areas
+    if ( not needsMorphology( task ) ):
+        return None
+    from pore_analysis import morphology
+    return descriptors[:, morphology.getDescriptorIndex( task['binningVariable'] )]
+
+def measureImageTask( task ):
+    # returns the particle measurements of the image or None if no ImageJ results were found for the image
+    # measurement: filename, engine, imageSize, areas, lines (None for ImageJ), morphology (None if the pores are binned by their area),
+    #              granulometry (None unless the pore pixels are binned by their inscribed radius) and the stats of the source files
+    trace.attach( task['trace'] )
+    if ( task['command'] is not None ):
+        runImageJMacro( task['command'], task['showDebuggingOutput'] )
+    if ( task['useNumpyEngine'] ):
+        with trace.stage( 'image', image=task['filename'] ) as stage:
+            measurements = measureImageInProcess( task )
+            if ( measurements is None ):
+                return None
+            poreAreas, imageSize, imageLines, descriptors, distribution = measurements
+            stage['particles'] = len( poreAreas )
+    elif os.path.exists( task['directory'] + results.outputDir_Pores + task['baseName'] + results.suffix_Pores ):
+        with trace.stage( 'read results', image=task['filename'] ) as stage:
+            poreAreas, imageSize = results.readPoreAreas( task['directory'], task['baseName'], task['imageSize'] )
+            stage['particles'] = len( poreAreas )
+        imageLines = None
+        descriptors = None
+        distribution = None
+    else:
+        return None
+    from pore_analysis import particles
+    return { 'filename': task['filename'], 'engine': getEngine( task ), 'imageSize': tuple( imageSize ), 'areas': poreAreas, 'lines': imageLines, 'morphology': descriptors, 'granulometry': distribution, 'sources': particles.getSourceStats( getSourceFiles( task ) ) }
+
+def binMeasurement( task, measurement ):
+    # returns an ImageResult or None if the image was not measured
+    if ( measurement is None ):
+        return None
+    if ( needsGranulometry( task ) ):
+        return results.binPoreSizeDistribution( task['baseName'], task['pixelSize'], measurement['granulometry'], measurement['imageSize'], task['poreSizeRangeArray'], task['showDebuggingOutput'] )
+    if ( task['outputType'] < 3 ):
+        return results.binPoreAreas( task['baseName'], task['pixelSize'], measurement['areas'], measurement['imageSize'], task['poreSizeRangeArray'], task['calculatePoreDiameter'], task['showDebuggingOutput'], getBinningValues( task, measurement['morphology'] ) )
+    if ( measurement['lines'] is None ):
+        # the ImageJ line plugin stores the line lengths in the area column
+        return results.binLineLengths( task['baseName'], task['pixelSize'], measurement['areas'], measurement['imageSize'], task['poreSizeRangeArray'], task['showDebuggingOutput'] )
+    from pore_analysis import lines
+    lineLengths = lines.selectLineLengths( measurement['lines'], task['pixelSize'], task['minLineLength'], task['ignoreBorderLines'], task['processHorizontalLines'], task['processVerticalLines'] )
+    return results.binLineLengths( task['baseName'], task['pixelSize'], lineLengths, measurement['imageSize'], task['poreSizeRangeArray'], task['showDebuggingOutput'] )
+
+def analyseImageTask( task ):
+    # returns an ImageResult or None if no ImageJ results were found for the image
+    return binMeasurement( task, measureImageTask( task ) )
+
+def isTooLarge( task ):
+    # True if the image has to be segmented in tiles to stay below the memory limit
+    # raises a ValueError if even the tiles exceed the memory limit, the halo of the tiles depends on the radii of the pipeline
+    if ( task['memoryLimit'] <= 0 ):
+        return False
+    from pore_analysis import metadata, segmentation, tiles
+    header = metadata.readHeader( task['directory'] + '/' + task['filename'] )
+    if ( not tiles.isTooLarge( header['width'], header['height'], task['memoryLimit'] ) ):
+        return False
+    minimumMemoryLimit = tiles.getMinimumMemoryLimit( task['backgroundShrink'], segmentation.getPipelineRadii( header['width'], task['pipeline'] ) )
+    if ( task['memoryLimit'] < minimumMemoryLimit ):
+        raise ValueError( "the tiles of this image need a memory limit of at least " + str( minimumMemoryLimit ) + " MB" )
+    return True
+
+def measureImageInProcess( task ):
+    # the particle areas (and line lengths / descriptors / inscribed radii) are stored in the pores folder to be reused by the next run
+    # returns None if the image can not be segmented within the memory limit
+    measureLines = ( task['outputType'] == 3 )
+    measureMorphology = needsMorphology( task )
+    measureGranulometry = needsGranulometry( task )
+    imageLines = None
+    descriptors = None
+    distribution = None
+    isReused = ( task['upToDate'] and ( not measureLines or os.path.exists( task['lineFile'] ) ) and ( not measureMorphology or os.path.exists( task['morphologyFile'] ) ) and ( not measureGranulometry or os.path.exists( task['granulometryFile'] ) ) )
+    try:
+        # line lengths, descriptors and inscribed radii are always measured on the whole image
+        isTiled = ( not isReused and not measureLines and not measureMorphology and not measureGranulometry and isTooLarge( task ) )
+    except ValueError as error:
+        print( "Error: " + task['filename'] + " is not analysed, " + str( error ) + "!" )
+        return None
+    if ( isReused ):
+        with trace.stage( 'read results', image=task['filename'] ):
+            poreAreas = np.load( task['poreAreaFile'] )
+            imageSize = tuple( task['imageSize'] )
+            imageLines = np.load( task['lineFile'] ) if measureLines else None
+            descriptors = np.load( task['morphologyFile'] ) if measureMorphology else None
+            distribution = np.load( task['granulometryFile'] ) if measureGranulometry else None
+    elif ( isTooLarge( task ) and not measureLines and not measureMorphology and not measureGranulometry ):
+        from pore_analysis import tiles
+        with trace.stage( 'tiled segmentation', image=task['filename'] ):
+            poreAreas, imageSize = tiles.segmentImageTiled( task['directory'] + '/' + task['filename'], task['thresholdLimit'], task['infoBarHeight'], task['pixelSize'], task['doSpeckleCleaning'], task['doRemoveBorderPercent'], task['memoryLimit'], task['directory'] + results.outputDir_Pores, task['backgroundShrink'], task['pipeline'] )
+        np.save( task['poreAreaFile'], poreAreas )
+    else:
+        from pore_analysis import segmentation
+        poreAreas, mask = segmentation.segmentImage( task['directory'] + '/' + task['filename'], task['thresholdLimit'], task['infoBarHeight'], task['pixelSize'], task['doSpeckleCleaning'], task['doRemoveBorderPercent'], task['backgroundShrink'], 1, task['pipeline'] )
+        height, width = mask.shape
+        imageSize = ( width, height )
+        np.save( task['poreAreaFile'], poreAreas )
+        storeMask( task, mask )
+        if ( measureLines ):
+            from pore_analysis import lines
+            with trace.stage( 'lines', image=task['filename'] ):
+                imageLines = lines.measureLines( mask )
+            np.save( task['lineFile'], imageLines )
+        if ( measureMorphology ):
+            from pore_analysis import morphology
+            with trace.stage( 'morphology', image=task['filename'] ):
+                descriptors = morphology.measureMask( mask, task['pixelSize'] )
+            np.save( task['morphologyFile'], descriptors )
+        if ( measureGranulometry ):
+            from pore_analysis import granulometry
+            with trace.stage( 'granulometry', image=task['filename'] ):
+                distribution = granulometry.measureMask( mask )
+            np.save( task['granulometryFile'], distribution )
+    return poreAreas, imageSize, imageLines, descriptors, distribution
+
+def storeMask( task, mask ):
+    # the pore mask of the in-process engine, bit-packed or as an 8-bit TIFF like the one of the ImageJ macro
+    if ( task['maskStorage'] == 'none' ):
+        return
+    with trace.stage( 'store mask', image=task['filename'] ):
+        if ( task['maskStorage'] == 'compact' ):
+            from pore_analysis import masks
+            masks.writeMask( task['directory'] + results.outputDir_Pores + task['baseName'] + masks.suffix_Mask, mask )
+        else:
+            from PIL import Image
+            Image.fromarray( mask.astype( np.uint8 ) * 255 ).save( task['directory'] + results.outputDir_Pores + task['baseName'] + "-masked.tif" )
+
+def isStored( store, task ):
+    # True if the measurements of the particle store can be used instead of measuring the image again
+    if ( task['command'] is not None or ( task['useNumpyEngine'] and not task['upToDate'] ) ):
+        return False
+    if ( task['useNumpyEngine'] and task['outputType'] == 3 and not store.hasLines( task['filename'] ) ):
+        return False
+    if ( needsMorphology( task ) and not store.hasMorphology( task['filename'] ) ):
+        return False
+    if ( needsGranulometry( task ) and not store.hasGranulometry( task['filename'] ) ):
+        return False
+    from pore_analysis import particles
+    try:
+        sourceStats = particles.getSourceStats( getSourceFiles( task ) )
+    except OSError:
+        return False
+    return store.isValid( task['filename'], getEngine( task ), sourceStats )
+
+def analyseTasks( tasks, jobs = 1 ):
+    # returns the ImageResults of all tasks in task order (None for images without results)
+    # only images missing in the particle store of their folder are measured, all images are binned from the store
+    from pore_analysis import particles
+    imageResults = [ None ] * len( tasks )
+    directories = []
+    for task in tasks:
+        if ( task['directory'] not in directories ):
+            directories.append( task['directory'] )
+    for directory in directories:
+        indices = [ i for i, task in enumerate( tasks ) if task['directory'] == directory ]
+        with trace.stage( 'particle store', directory=directory ):
+            store = particles.ParticleStore( directory )
+            missing = [ i for i in indices if not isStored( store, tasks[i] ) ]
+        if ( len( missing ) > 0 and tasks[indices[0]]['showDebuggingOutput'] ):
+            print( " measuring " + str( len( missing ) ) + " of " + str( len( indices ) ) + " image(s), the other ones are read from the particle store" )
+        newMeasurements = dict( zip( [ tasks[i]['filename'] for i in missing ], runTasks( measureImageTask, [ tasks[i] for i in missing ], jobs ) ) )
+        filenames = [ tasks[i]['filename'] for i in indices ]
+        # the store is only rewritten if images were measured or removed
+        changedImages = [ filename for filename, measurement in newMeasurements.items() if measurement is not None or filename in store.images ]
+        removedImages = set( store.images ) - set( filenames )
+        if ( len( changedImages ) > 0 or len( removedImages ) > 0 ):
+            with trace.stage( 'particle store', directory=directory, images=len( filenames ) ):
+                store.update( filenames, newMeasurements )
+        storedIndices = [ i for i in indices if tasks[i]['filename'] in store.images ]
+        with trace.stage( 'binning', directory=directory, images=len( storedIndices ) ):
+            for i, imageResult in zip( storedIndices, store.binImages( [ tasks[i] for i in storedIndices ] ) ):
+                imageResults[i] = imageResult
+    return imageResults
+
+def analyseThresholdSweepTask( task ):
+    # returns one ImageResult per threshold in task['thresholds'], the preprocessed image is only calculated once
+    trace.attach( task['trace'] )
+    from pore_analysis import segmentation
+    directory = task['directory']
+    baseName = task['baseName']
+    processedPath = directory + "/processed/" + baseName + "-processed.tif"
+    with trace.stage( 'preprocessing', image=task['filename'] ):
+        processed = segmentation.getProcessedImage( directory + '/' + task['filename'], task['infoBarHeight'], task['doRemoveBorderPercent'], processedPath, task['backgroundShrink'], task['pipeline'] )
+    height, width = processed.shape
+    imageResults = []
+    for thresholdLimit in task['thresholds']:
+        mask = segmentation.createPoreMask( processed, thresholdLimit, task['doSpeckleCleaning'] )
+        if ( needsGranulometry( task ) ):
+            from pore_analysis import granulometry
+            imageResults.append( results.binPoreSizeDistribution( baseName, task['pixelSize'], granulometry.measureMask( mask ), ( width, height ), task['poreSizeRangeArray'], task['showDebuggingOutput'] ) )
+            continue
+        poreAreas = segmentation.analyseParticles( mask, task['pixelSize'] )
+        binningValues = None
+        if ( needsMorphology( task ) ):
+            from pore_analysis import morphology
+            binningValues = getBinningValues( task, morphology.measureMask( mask, task['pixelSize'] ) )
+        imageResults.append( results.binPoreAreas( baseName, task['pixelSize'], poreAreas, ( width, height ), task['poreSizeRangeArray'], task['calculatePoreDiameter'], task['showDebuggingOutput'], binningValues ) )
+    return imageResults
+
+def analysePreviewTask( task ):
+    # returns the ImageResult of the image downsampled by task['previewFactor'], nothing is stored for later runs
+    trace.attach( task['trace'] )
+    from pore_analysis import segmentation
+    previewPixelSize = task['pixelSize'] * task['previewFactor']
+    with trace.stage( 'preview', image=task['filename'] ) as stage:
+        poreAreas, mask = segmentation.segmentImage( task['directory'] + '/' + task['filename'], task['thresholdLimit'], task['infoBarHeight'], previewPixelSize, task['doSpeckleCleaning'], task['doRemoveBorderPercent'], task['backgroundShrink'], task['previewFactor'], task['pipeline'] )
+        stage['particles'] = len( poreAreas )
+    height, width = mask.shape
+    return results.binPoreAreas( task['baseName'], previewPixelSize, poreAreas, ( width, height ), task['poreSizeRangeArray'], task['calculatePoreDiameter'], task['showDebuggingOutput'] )
+
+def runTasks( function, tasks, jobs = 1 ):
+    # results are returned in the same order as the tasks
+    if ( jobs <= 1 or len( tasks ) < 2 ):
+        return [ function( task ) for task in tasks ]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor( max_workers=min( jobs, len( tasks ) ) ) as executor:
+        return list( executor.map( function, tasks ) )
@@ -0,0 +1,115 @@
+#########################################################
+# Parity check of the in-process segmentation
+#
+# compares the particle areas found by pore_analysis.segmentation
+# with the "_pores_sqpx.csv" files written by the ImageJ macro
+# for the same images
+#
+# usage: python -m pore_analysis.parity <directory> [-t <thresholdLimit>] [-i <infoBarHeight>] [-s <scale nm/px>] [-b <removeBorderInPercent>] [-c] [-f <backgroundShrink>] [-p <single|folder>] [-m <maxDeviation>]
+#
+# -p folder compares with the results of pore_analysis.ijm (scale
+# folders), the default with pore_analysis_single_file.ijm
+#
+# exits with 1 if a per bucket deviation exceeds maxDeviation [Area-%]
+#
+#########################################################
+
+import csv
+import os, sys, getopt
+import numpy as np
+
+from pore_analysis import defaultPoreSizeRangeArray
+from pore_analysis import segmentation
+
+outputDir_Pores = "/pores/"
+suffix_Pores = "_pores_sqpx.csv"
+
+def readMacroPoreAreas( csvPath ):
+    areas = []
+    with open( csvPath, 'r' ) as csv_file:
+        csv_reader = csv.reader( csv_file )
+        next( csv_reader, None ) # ignore headline
+        for line in csv_reader:
+            if ( len( line ) > 1 ):
+                areas.append( float( line[1] ) )
+    return np.asarray( areas, dtype=np.float64 )
+
+def getAreaPercentPerBucket( areas, imageArea, poreSizeRangeArray ):
+    # area-% per bucket using the (exclusive) bucket limits of processData()
+    result = []
+    for i in range(len(poreSizeRangeArray)):
+        if ( i == 0 ):
+            result.append( 0.0 )
+        elif ( i == len(poreSizeRangeArray)-1 ):
+            result.append( areas[areas > poreSizeRangeArray[i]].sum()/imageArea*100 )
+        else:
+            inBucket = ( areas > poreSizeRangeArray[i-1] ) & ( areas < poreSizeRangeArray[i] )
+            result.append( areas[inBucket].sum()/imageArea*100 )
+    return np.asarray( result )
+
+def compareImage( directory, filename, thresholdLimit, infoBarHeight, scale, doSpeckleCleaning, doRemoveBorderPercent, poreSizeRangeArray, backgroundShrink = 1, pipeline = 'single' ):
+    baseName = os.path.splitext( filename )[0]
+    macroAreas = readMacroPoreAreas( directory + outputDir_Pores + baseName + suffix_Pores )
+    engineAreas, mask = segmentation.segmentImage( directory + '/' + filename, thresholdLimit, infoBarHeight, scale, doSpeckleCleaning, doRemoveBorderPercent, backgroundShrink, 1, pipeline )
+    height, width = mask.shape
+    pixelArea = scale * scale if scale > 0 else 1
+    imageArea = width * height * pixelArea
+    macroPercent = getAreaPercentPerBucket( macroAreas, imageArea, poreSizeRangeArray )
+    enginePercent = getAreaPercentPerBucket( engineAreas, imageArea, poreSizeRangeArray )
+    print( "------" )
+    print( filename )
+    print( " particles: " + str( len( macroAreas ) ) + " (ImageJ) | " + str( len( engineAreas ) ) + " (NumPy)" )
+    print( " pore area: " + str( round( macroAreas.sum()/imageArea*100, 3 ) ) + " Area-% (ImageJ) | " + str( round( engineAreas.sum()/imageArea*100, 3 ) ) + " Area-% (NumPy)" )
+    for i in range(1, len(poreSizeRangeArray)):
+        print( '  - ' + str( poreSizeRangeArray[i] ) + ' nm: ' + str( round( macroPercent[i], 3 ) ) + ' | ' + str( round( enginePercent[i], 3 ) ) + ' Area-% (deviation ' + str( round( enginePercent[i] - macroPercent[i], 3 ) ) + ')' )
+    return np.abs( enginePercent - macroPercent ).max()
+
+def comparePoreAnalysis( directory, thresholdLimit = 140, infoBarHeight = 63, scale = 0, doSpeckleCleaning = 1, doRemoveBorderPercent = 0, poreSizeRangeArray = None, backgroundShrink = 1, pipeline = 'single' ):
+    # returns the largest per bucket area-% deviation of all compared images
+    # pipeline: macro which wrote the results, 'single' (pore_analysis_single_file.ijm) or 'folder' (pore_analysis.ijm)
+    poreSizeRangeArray = poreSizeRangeArray or defaultPoreSizeRangeArray
+    if ( pipeline == 'folder' ):
+        # pore_analysis.ijm keeps the border
+        doRemoveBorderPercent = 0
+    maxDeviation = 0
+    for filename in sorted( os.listdir( directory ) ):
+        if ( filename.endswith(".jpg") or filename.endswith(".JPG") or filename.endswith(".tif") or filename.endswith(".TIF")):
+            baseName = os.path.splitext( filename )[0]
+            if os.path.exists( directory + outputDir_Pores + baseName + suffix_Pores ):
+                deviation = compareImage( directory, filename, thresholdLimit, infoBarHeight, scale, doSpeckleCleaning, doRemoveBorderPercent, poreSizeRangeArray, backgroundShrink, pipeline )
+                maxDeviation = max( maxDeviation, deviation )
+            else:
+                print( baseName + suffix_Pores + " not found! Run ImageJ Macro first!" )
+    print( "------" )
+    print( "maximum deviation: " + str( round( maxDeviation, 3 ) ) + " Area-%" )
+    return maxDeviation
+
+if __name__ == '__main__':
+    usage = "python -m pore_analysis.parity <directory> [-t <thresholdLimit>] [-i <infoBarHeight>] [-s <scale nm/px>] [-b <removeBorderInPercent>] [-c] [-f <backgroundShrink>] [-p <single|folder>] [-m <maxDeviation>]"
+    try:
+        opts, args = getopt.gnu_getopt( sys.argv[1:], "t:i:s:b:cf:p:m:" )
+    except getopt.GetoptError:
+        print( usage )
+        sys.exit( 2 )
+    if ( len( args ) != 1 ):
+        print( usage )
+        sys.exit( 2 )
+    allowedDeviation = None
+    options = { 'thresholdLimit': 140, 'infoBarHeight': 63, 'scale': 0, 'doSpeckleCleaning': 1, 'doRemoveBorderPercent': 0, 'backgroundShrink': 1, 'pipeline': 'single' }
+    for opt, arg in opts:
+        if opt == '-t': options['thresholdLimit'] = int( arg )
+        elif opt == '-i': options['infoBarHeight'] = int( arg )
+        elif opt == '-s': options['scale'] = float( arg )
+        elif opt == '-b': options['doRemoveBorderPercent'] = int( arg )
+        elif opt == '-c': options['doSpeckleCleaning'] = 0
+        elif opt == '-f': options['backgroundShrink'] = int( arg )
+        elif opt == '-p':
+            if ( arg not in segmentation.pipelines ):
+                print( usage )
+                sys.exit( 2 )
+            options['pipeline'] = arg
+        elif opt == '-m': allowedDeviation = float( arg )
+    maxDeviation = comparePoreAnalysis( args[0], **options )
+    if ( allowedDeviation is not None and maxDeviation > allowedDeviation ):
+        print( "deviation exceeds " + str( allowedDeviation ) + " Area-%!" )
+        sys.exit( 1 )
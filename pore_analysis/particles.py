@@ -0,0 +1,222 @@
+#########################################################
+# Columnar particle store of a folder
+#
+# pores/particles.bin keeps the particle measurements of all
+# images of a folder in one column per measurement (areas, lines,
+# morphology descriptors, inscribed radius distribution)
+# behind a small JSON index. The columns are memory-mapped, so
+# changing the size ranges or the output type re-bins all images
+# in one vectorized pass without parsing a CSV file again.
+#
+# file layout: magic, header length (uint64), JSON header,
+#              columns aligned to columnAlignment bytes
+#
+#########################################################
+
+import json
+import os
+import struct
+import numpy as np
+
+from pore_analysis import lines, results
+
+storeFileName = "particles.bin"
+storeMagic = b'POREPART'
+storeVersion = 1
+columnAlignment = 64
+# dtype and shape of a single row of every column
+columnTypes = { 'areas': ( '<f8', () ), 'lines': ( '<i4', ( 3, ) ), 'morphology': ( '<f8', ( 8, ) ), 'granulometry': ( '<i8', ( 2, ) ) } # morphology: see morphology.descriptorNames, granulometry: squared radius and pixel count
+# stores written before a column was added lack it, its images have no values for it
+
+def getSourceStats( paths ):
+    # size and modification time of the files the measurements were read from
+    stats = {}
+    for path in paths:
+        stat = os.stat( path )
+        stats[os.path.basename( path )] = [ stat.st_size, stat.st_mtime_ns ]
+    return stats
+
+def alignOffset( offset ):
+    return -( -offset // columnAlignment ) * columnAlignment
+
+def getColumnRanges( entries, column ):
+    # first row and row count of every entry in the column
+    starts = np.array( [ entry[column][0] for entry in entries ], dtype=np.int64 )
+    counts = np.array( [ entry[column][1] for entry in entries ], dtype=np.int64 )
+    return starts, counts
+
+class ParticleStore:
+    def __init__( self, directory ):
+        self.directory = directory
+        self.path = directory + results.outputDir_Pores + storeFileName
+        self.images = {}
+        self.columns = {}
+        self.load()
+
+    def load( self ):
+        self.images = {}
+        self.columns = {}
+        try:
+            with open( self.path, 'rb' ) as storeFile:
+                magic, headerLength = struct.unpack( '<8sQ', storeFile.read( 16 ) )
+                if ( magic != storeMagic ):
+                    return
+                header = json.loads( storeFile.read( headerLength ).decode( 'utf-8' ) )
+            if ( header.get( 'version' ) != storeVersion ):
+                return
+            dataOffset = alignOffset( 16 + headerLength )
+            for name, column in header['columns'].items():
+                dtype, shape = columnTypes[name]
+                if ( column['count'] > 0 ):
+                    self.columns[name] = np.memmap( self.path, dtype=dtype, mode='r', offset=dataOffset + column['offset'], shape=( column['count'], ) + shape )
+                else:
+                    self.columns[name] = np.empty( ( 0, ) + shape, dtype=dtype )
+            self.images = { entry['filename']: entry for entry in header['images'] }
+        except ( OSError, ValueError, KeyError, struct.error ):
+            self.images = {}
+            self.columns = {}
+
+    def release( self ):
+        # the memory maps have to be closed before the file is replaced
+        self.columns = {}
+
+    def isValid( self, filename, engine, sourceStats ):
+        # True if the stored measurements were read from the current source files (the lines are stored along with the areas)
+        entry = self.images.get( filename )
+        if ( entry is None or entry['engine'] != engine ):
+            return False
+        return all( entry['sources'].get( name ) == stat for name, stat in sourceStats.items() )
+
+    def hasLines( self, filename ):
+        entry = self.images.get( filename )
+        return ( entry is not None and entry['lines'] is not None )
+
+    def hasMorphology( self, filename ):
+        entry = self.images.get( filename )
+        return ( entry is not None and entry.get( 'morphology' ) is not None )
+
+    def hasGranulometry( self, filename ):
+        entry = self.images.get( filename )
+        return ( entry is not None and entry.get( 'granulometry' ) is not None )
+
+    def getMeasurement( self, filename ):
+        # measurement dictionary of a stored image, the columns are views into the memory map
+        entry = self.images[filename]
+        measurement = { 'filename': filename, 'engine': entry['engine'], 'imageSize': tuple( entry['imageSize'] ), 'sources': entry['sources'] }
+        for name in columnTypes:
+            if ( entry.get( name ) is None ):
+                measurement[name] = None
+            else:
+                start, count = entry[name]
+                measurement[name] = self.columns[name][start:start+count]
+        return measurement
+
+    def update( self, filenames, newMeasurements ):
+        # rewrites the store with the images in filenames, taken from newMeasurements (filename: measurement) or the current store
+        measurements = []
+        for filename in filenames:
+            if ( filename in newMeasurements ):
+                if ( newMeasurements[filename] is not None ):
+                    measurements.append( newMeasurements[filename] )
+            elif ( filename in self.images ):
+                measurements.append( self.getMeasurement( filename ) )
+        self.write( measurements )
+
+    def write( self, measurements ):
+        # replaces the store by the given measurements (dictionaries as returned by getMeasurement)
+        header = { 'version': storeVersion, 'images': [], 'columns': {} }
+        rowCounts = { name: 0 for name in columnTypes }
+        for measurement in measurements:
+            entry = { 'filename': measurement['filename'], 'engine': measurement['engine'], 'imageSize': list( measurement['imageSize'] ), 'sources': measurement['sources'] }
+            for name in columnTypes:
+                if ( measurement.get( name ) is None ):
+                    entry[name] = None
+                else:
+                    entry[name] = [ rowCounts[name], len( measurement[name] ) ]
+                    rowCounts[name] += len( measurement[name] )
+            header['images'].append( entry )
+        offset = 0
+        for name, ( dtype, shape ) in columnTypes.items():
+            header['columns'][name] = { 'offset': offset, 'count': rowCounts[name] }
+            offset = alignOffset( offset + rowCounts[name] * np.dtype( dtype ).itemsize * int( np.prod( shape, dtype=np.int64 ) ) )
+        headerBytes = json.dumps( header ).encode( 'utf-8' )
+        dataOffset = alignOffset( 16 + len( headerBytes ) )
+        temporaryPath = self.path + '.tmp'
+        with open( temporaryPath, 'wb' ) as storeFile:
+            storeFile.write( struct.pack( '<8sQ', storeMagic, len( headerBytes ) ) )
+            storeFile.write( headerBytes )
+            for name, ( dtype, shape ) in columnTypes.items():
+                storeFile.write( b'\0' * ( dataOffset + header['columns'][name]['offset'] - storeFile.tell() ) )
+                for measurement in measurements:
+                    if ( measurement.get( name ) is not None and len( measurement[name] ) > 0 ):
+                        np.ascontiguousarray( measurement[name], dtype=dtype ).reshape( ( -1, ) + shape ).tofile( storeFile )
+        # views into the old memory maps would keep the file open
+        measurements.clear()
+        self.release()
+        os.replace( temporaryPath, self.path )
+        self.load()
+
+    def getColumn( self, filenames, name ):
+        # rows of the given images in the order of filenames and the image index of every row
+        entries = [ self.images[filename] for filename in filenames ]
+        starts, counts = getColumnRanges( entries, name )
+        imageIndex = np.repeat( np.arange( len( entries ), dtype=np.intp ), counts )
+        column = self.columns[name]
+        if ( len( entries ) == 0 ):
+            return column[0:0], imageIndex
+        if ( np.all( starts[1:] == starts[:-1] + counts[:-1] ) ):
+            # the usual case, all images of the folder in stored order
+            return column[starts[0]:starts[0] + counts.sum()], imageIndex
+        return np.concatenate( [ column[start:start+count] for start, count in zip( starts, counts ) ] ), imageIndex
+
+    def binImages( self, tasks ):
+        # ImageResults of all tasks in one vectorized pass, every task has to be stored
+        # (options: outputType, calculatePoreDiameter, poreSizeRangeArray, binningVariable and the line options are taken from the first task)
+        if ( len( tasks ) == 0 ):
+            return []
+        options = tasks[0]
+        poreSizeRangeArray = options['poreSizeRangeArray']
+        binningVariable = options.get( 'binningVariable', 'area' ) # tasks of older callers have no binning variable
+        filenames = [ task['filename'] for task in tasks ]
+        entries = [ self.images[filename] for filename in filenames ]
+        pixelSizes = np.array( [ task['pixelSize'] for task in tasks ], dtype=np.float64 )
+        imageSizes = [ tuple( entry['imageSize'] ) for entry in entries ]
+        from pore_analysis import granulometry
+        countWeights = None
+        sizeWeights = None
+        if ( binningVariable == granulometry.binningVariable ):
+            # the pore pixels are binned by their inscribed radius, counted and summed up as area
+            distribution, imageIndex = self.getColumn( filenames, 'granulometry' )
+            values = granulometry.getRadii( distribution, pixelSizes[imageIndex] )
+            countWeights = np.asarray( distribution[:, 1], dtype=np.float64 )
+            sizeWeights = countWeights * pixelSizes[imageIndex]**2
+            imageAreas = np.array( [ width * pixelSize * height * pixelSize for ( width, height ), pixelSize in zip( imageSizes, pixelSizes.tolist() ) ], dtype=np.float64 )
+            percentWeights = sizeWeights/imageAreas[imageIndex]*100
+            processedElements = np.bincount( imageIndex, weights=countWeights, minlength=len( tasks ) ).astype( np.int64 )
+        elif ( options['outputType'] == 3 and entries[0]['engine'] == 'numpy' ):
+            imageLines, imageIndex = self.getColumn( filenames, 'lines' )
+            selected = lines.getLineSelection( imageLines, options['minLineLength'], options['ignoreBorderLines'], options['processHorizontalLines'], options['processVerticalLines'] )
+            processedElements = np.bincount( imageIndex[selected], minlength=len( tasks ) )
+            imageIndex = imageIndex[selected]
+            values = imageLines[selected, 0] * pixelSizes[imageIndex]
+            percentWeights = None
+        else:
+            areas, imageIndex = self.getColumn( filenames, 'areas' )
+            areas = np.asarray( areas, dtype=np.float64 )
+            processedElements = np.bincount( imageIndex, minlength=len( tasks ) )
+            if ( options['outputType'] == 3 ):
+                # the ImageJ line plugin stores the line lengths in the area column
+                values = areas
+                percentWeights = None
+            else:
+                imageAreas = np.array( [ width * pixelSize * height * pixelSize for ( width, height ), pixelSize in zip( imageSizes, pixelSizes.tolist() ) ], dtype=np.float64 )
+                if ( binningVariable != 'area' ):
+                    from pore_analysis import morphology
+                    descriptors = self.getColumn( filenames, 'morphology' )[0]
+                    values = np.asarray( descriptors[:, morphology.getDescriptorIndex( binningVariable )], dtype=np.float64 )
+                else:
+                    values = np.sqrt( areas ) if ( options['calculatePoreDiameter'] ) else areas
+                percentWeights = areas/imageAreas[imageIndex]*100
+        counts, sizes, percents, countedElements = results.binParticles( values, imageIndex, len( tasks ), poreSizeRangeArray, percentWeights, countWeights, sizeWeights )
+        if ( options['showDebuggingOutput'] ) : print( ' ' + str( len( values ) - countedElements ) + ' elements outside of the size ranges or on a range limit' )
+        return [ results.createImageResult( os.path.splitext( filenames[i] )[0], tasks[i]['pixelSize'], imageSizes[i], poreSizeRangeArray, counts[i], sizes[i], percents[i], int( processedElements[i] ) ) for i in range( len( tasks ) ) ]
@@ -0,0 +1,69 @@
+#########################################################
+# Error estimate of the quick-look preview
+#
+# The preview segments copies of the images downsampled by the
+# preview factor, so every pixel covers previewFactor² pixels of
+# the original image. Along the outline of a pore the mask is off
+# by up to half a pixel, which changes the area of a pore with the
+# equivalent diameter d by up to 2·pixelSize/d. A size range is
+# resolved if its smallest pores are at least
+# minimumPreviewDiameter pixels wide (an error of up to 25 %),
+# smaller pores are lost or merged by the preprocessing. The
+# estimated error of a resolved size range is this relative error
+# times its area-%.
+#
+#########################################################
+
+import math
+import numpy as np
+
+minimumPreviewDiameter = 8 # px
+
+def getEquivalentDiameters( poreSizeRangeArray, calculatePoreDiameter = False ):
+    # diameter of a circle with the area of every size range limit (in nm)
+    limits = np.asarray( poreSizeRangeArray, dtype=np.float64 )
+    if ( calculatePoreDiameter ):
+        # the pore diameter of the results is the square root of the area
+        return limits * 2 / math.sqrt( math.pi )
+    return 2 * np.sqrt( limits / math.pi )
+
+def getRelativeErrors( poreSizeRangeArray, previewPixelSize, calculatePoreDiameter = False ):
+    # relative area error of every size range, inf if the size range is not resolved
+    # size range i holds the values between limit i-1 and i, the first one is always empty
+    diameters = getEquivalentDiameters( poreSizeRangeArray, calculatePoreDiameter )
+    lowerDiameters = np.concatenate( ( [ 0.0 ], diameters[:-1] ) )
+    relativeErrors = np.full( len( poreSizeRangeArray ), np.inf )
+    resolved = ( lowerDiameters > 0 ) & ( lowerDiameters >= minimumPreviewDiameter * previewPixelSize )
+    relativeErrors[resolved] = 2 * previewPixelSize / lowerDiameters[resolved]
+    return relativeErrors
+
+def getSmallestResolvedSize( poreSizeRangeArray, previewPixelSize, calculatePoreDiameter = False ):
+    # lower limit of the first resolved size range, None if none is resolved
+    resolved = np.isfinite( getRelativeErrors( poreSizeRangeArray, previewPixelSize, calculatePoreDiameter ) )
+    if ( not resolved.any() ):
+        return None
+    return poreSizeRangeArray[int( np.argmax( resolved ) ) - 1]
+
+def getBucketErrors( imageResult, relativeErrors ):
+    # estimated error of every size range in Area-%, inf if the size range is not resolved
+    percents = np.asarray( imageResult.poreSizePercentArray, dtype=np.float64 )
+    return np.where( np.isfinite( relativeErrors ), percents * np.where( np.isfinite( relativeErrors ), relativeErrors, 0 ), np.inf )
+
+def needsFullResolution( bucketErrors, maximumError ):
+    # True if the estimated error of a resolved size range exceeds maximumError [Area-%]
+    resolvedErrors = bucketErrors[np.isfinite( bucketErrors )]
+    return ( len( resolvedErrors ) > 0 and resolvedErrors.max() > maximumError )
+
+def formatError( value ):
+    return str( round( float( value ), 3 ) ) if np.isfinite( value ) else "-"
+
+def writeErrorTable( imageFiles, imageErrors, poreSizeRangeArray, outputDirectory ):
+    # preview_error.csv: estimated error [Area-%] of every image and size range like results.csv ("-": not resolved)
+    # the last line holds the error of the folder mean, images analysed at full resolution have an error of 0
+    meanErrors = np.mean( imageErrors, axis=0 ) if len( imageErrors ) > 0 else np.zeros( len( poreSizeRangeArray ) )
+    with open( outputDirectory + '/preview_error.csv', 'w' ) as csvFile:
+        csvFile.write( "name" + "".join( ", " + str( val ) for val in poreSizeRangeArray ) + "\n" )
+        for imageFile, bucketErrors in zip( imageFiles, imageErrors ):
+            csvFile.write( imageFile + "".join( "," + formatError( value ) for value in bucketErrors ) + "\n" )
+        csvFile.write( "Summe" + "".join( "," + formatError( value ) for value in meanErrors ) + "\n" )
+    return meanErrors
@@ -0,0 +1,306 @@
+#########################################################
+# Per-image and per-folder pore analysis results
+#
+# An ImageResult holds the bucket arrays of a single image and
+# is created without touching any global state, so it can be
+# computed in a worker process. A FolderResult stacks the image
+# results of one folder in a fixed order into one images x
+# buckets x metrics array, which the result tables are written
+# from in bulk.
+#
+#########################################################
+
+import os
+import warnings
+import numpy as np
+
+outputDir_Pores = "/pores/"
+suffix_Pores = "_pores_sqpx.csv"
+suffix_PoreAreas = "_pores.npy" # particle areas of the in-process engine
+suffix_Lines = "_lines.npy" # line lengths of the in-process engine
+suffix_Morphology = "_morphology.npy" # pore descriptors of the in-process engine (pore_analysis.morphology)
+suffix_Granulometry = "_granulometry.npy" # inscribed radii of the pore pixels of the in-process engine (pore_analysis.granulometry)
+suffix_ImageSize = "_size.txt" # width,height of the masked image, written by the ImageJ macros
+
+class ImageResult:
+    def __init__( self, filename, pixelSize, imageSize, poreSizeRangeArray ):
+        self.filename = filename # without file extension
+        self.pixelSize = pixelSize
+        self.width, self.height = imageSize
+        self.imageArea = self.width * pixelSize * self.height * pixelSize
+        self.processedElements = 0
+        self.poreSizeArray = [ float( 0 ) for val in poreSizeRangeArray ]
+        self.poreSizePercentArray = [ float( 0 ) for val in poreSizeRangeArray ]
+        self.poreCountArray = [ 0 for val in poreSizeRangeArray ]
+
+# metrics of the FolderResult array
+countMetric = 0 # particle count
+sizeMetric = 1 # summed pore size (area or diameter) or line length
+percentMetric = 2 # area-%
+metricNames = ( 'count', 'size', 'percent' )
+
+class FolderResult:
+    # dense images x buckets x metrics array of the image results of one folder in a fixed order
+    def __init__( self, directory, poreSizeRangeArray, imageResults = () ):
+        imageResults = list( imageResults )
+        bucketCount = len( poreSizeRangeArray )
+        self.directory = directory
+        self.poreSizeRangeArray = poreSizeRangeArray
+        self.filenames = [ imageResult.filename for imageResult in imageResults ]
+        self.pixelSizes = [ imageResult.pixelSize for imageResult in imageResults ]
+        self.imageSizes = np.array( [ ( imageResult.width, imageResult.height ) for imageResult in imageResults ], dtype=np.int64 ).reshape( -1, 2 )
+        self.processedElements = np.array( [ imageResult.processedElements for imageResult in imageResults ], dtype=np.int64 )
+        self.values = np.zeros( ( len( imageResults ), bucketCount, len( metricNames ) ) )
+        if ( len( imageResults ) > 0 ):
+            self.values[:, :, countMetric] = [ imageResult.poreCountArray for imageResult in imageResults ]
+            self.values[:, :, sizeMetric] = [ imageResult.poreSizeArray for imageResult in imageResults ]
+            self.values[:, :, percentMetric] = [ imageResult.poreSizePercentArray for imageResult in imageResults ]
+        self.analysedImages = len( imageResults ) # images with results, the folder average is based on them
+
+    def getCounts( self ):
+        return self.values[:, :, countMetric].astype( np.int64 )
+
+    def getSizes( self ):
+        return self.values[:, :, sizeMetric]
+
+    def getPercents( self ):
+        return self.values[:, :, percentMetric]
+
+    def getCountSums( self ):
+        # particle count per bucket of all images
+        return self.getCounts().sum( axis=0 )
+
+    def getPercentSums( self ):
+        # summed area-% per bucket of all images, accumulated in image order
+        return self.getPercents().sum( axis=0 )
+
+    def getMeanPercents( self ):
+        # mean area-% per bucket of the analysed images
+        if ( self.analysedImages == 0 ):
+            return np.zeros( len( self.poreSizeRangeArray ) )
+        return self.getPercentSums()/self.analysedImages
+
+    def getImageResult( self, index ):
+        imageResult = ImageResult( self.filenames[index], self.pixelSizes[index], tuple( self.imageSizes[index].tolist() ), self.poreSizeRangeArray )
+        imageResult.poreCountArray = self.getCounts()[index].tolist()
+        imageResult.poreSizeArray = self.getSizes()[index].tolist()
+        imageResult.poreSizePercentArray = self.getPercents()[index].tolist()
+        imageResult.processedElements = int( self.processedElements[index] )
+        return imageResult
+
+def getFolderMeans( folderResults, metric = percentMetric ):
+    # folders x buckets array of the mean metric per image, e.g. to compare specimens
+    if ( len( folderResults ) == 0 ):
+        return np.zeros( ( 0, 0 ) )
+    values = np.concatenate( [ folderResult.values[:, :, metric] for folderResult in folderResults ] )
+    imageCounts = np.array( [ folderResult.analysedImages for folderResult in folderResults ] )
+    folderIndex = np.repeat( np.arange( len( folderResults ) ), imageCounts )
+    sums = np.zeros( ( len( folderResults ), values.shape[1] ) )
+    np.add.at( sums, folderIndex, values )
+    return sums / np.maximum( imageCounts, 1 )[:, None]
+
+def getDigitBytes( numbers, width ):
+    # ASCII digits of non-negative integers right-aligned in width columns, leading zeros are 0 bytes (padding)
+    if ( width < 10 ):
+        numbers = numbers.astype( np.int32 ) # faster division
+    digitBytes = np.zeros( ( len( numbers ), width ), dtype=np.uint8 )
+    for i in range( width ):
+        power = 10**( width-1-i )
+        digitBytes[:, i] = ( numbers // power ) % 10 + ord( '0' )
+        if ( power > 1 ):
+            digitBytes[numbers < power, i] = 0
+    return digitBytes
+
+def formatCells( values, digits = None ):
+    # byte matrix of ",value" per value, 0 bytes are padding. The values are formatted like str( round( value, digits ) )
+    # (str( value ) if digits is None), as the result tables always contained: "1.5", "12.05", "0.0"
+    values = np.asarray( values ).ravel()
+    if ( digits is None ):
+        numbers = values.astype( np.int64 )
+        exact = ( numbers == values ) & ( numbers >= 0 )
+        scale = 1
+    else:
+        values = values.astype( np.float64 )
+        scale = 10**digits
+        with np.errstate( invalid='ignore' ):
+            scaled = values * scale
+            # rint( value*scale ) rounds like round() apart from values next to a midpoint, which are left to Python
+            exact = np.isfinite( scaled ) & ~np.signbit( scaled ) & ( scaled < 2**52 ) & ( np.abs( scaled - np.floor( scaled ) - 0.5 ) > 4*np.spacing( scaled ) )
+        numbers = np.where( exact, np.rint( scaled ), 0 ).astype( np.int64 )
+        # str() writes values below 1e-4 in scientific notation
+        exact &= ( numbers == 0 ) | ( numbers >= scale // 10000 )
+    numbers = np.where( exact, numbers, 0 )
+    integers = numbers // scale
+    columns = [ np.full( ( len( values ), 1 ), ord( ',' ), dtype=np.uint8 ), getDigitBytes( integers, len( str( int( integers.max( initial=0 ) ) ) ) ) ]
+    if ( digits is not None ):
+        # trailing zeros of the fraction are dropped, the first digit is kept
+        fractions = numbers % scale
+        fractionBytes = getDigitBytes( fractions, digits )
+        fractionBytes[fractionBytes == 0] = ord( '0' )
+        fractionBytes[:, 1:][fractions[:, None] % 10**np.arange( digits-1, 0, -1, dtype=np.int64 ) == 0] = 0
+        columns += [ np.full( ( len( values ), 1 ), ord( '.' ), dtype=np.uint8 ), fractionBytes ]
+    cells = np.concatenate( columns, axis=1 )
+    inexact = np.flatnonzero( ~exact )
+    if ( len( inexact ) > 0 ):
+        strings = [ ( ',' + str( value if digits is None else round( value, digits ) ) ).encode() for value in values[inexact].tolist() ]
+        width = max( cells.shape[1], max( len( string ) for string in strings ) )
+        cells = np.pad( cells, ( ( 0, 0 ), ( 0, width - cells.shape[1] ) ) )
+        cells[inexact] = np.frombuffer( np.array( strings, dtype='S' + str( width ) ).tobytes(), dtype=np.uint8 ).reshape( -1, width )
+    return cells
+
+def getTextBytes( texts ):
+    # byte matrix of UTF-8 texts, 0 bytes are padding
+    encoded = np.array( [ text.encode() for text in texts ], dtype=bytes )
+    return np.frombuffer( encoded.tobytes(), dtype=np.uint8 ).reshape( len( texts ), encoded.itemsize )
+
+def formatLines( prefixes, cells, suffixes = None ):
+    # the lines prefix,value,...,value suffix of a rows x columns x bytes array of formatCells()
+    if ( len( prefixes ) == 0 ):
+        return []
+    parts = [ getTextBytes( prefixes ), cells.reshape( len( prefixes ), cells.shape[1] * cells.shape[2] ) ]
+    if ( suffixes is not None ):
+        parts.append( getTextBytes( suffixes ) )
+    parts.append( np.full( ( len( prefixes ), 1 ), ord( '\n' ), dtype=np.uint8 ) )
+    text = np.concatenate( parts, axis=1 ).ravel()
+    return text[text != 0].tobytes().decode().split( '\n' )[:-1]
+
+def getImageTableValues( folderResult, outputType ):
+    # images x buckets values of the requested output type (0: area-%, 1: size, 2: count, 3: line length) and their digits
+    if ( outputType == 0 ):
+        return folderResult.getPercents(), 2
+    elif ( outputType == 1 or outputType == 3 ):
+        return folderResult.getSizes(), 2
+    return folderResult.getCounts(), None
+
+def writeResultTables( folderResult, imageFiles, outputDirectory, outputType = 0, calculatePoreDiameter = False ):
+    # writes results.csv (one line per image and the folder sum) and mr_result.csv / mr_line_result.csv (one line per bucket)
+    poreSizeRangeArray = folderResult.poreSizeRangeArray
+    imageValues, digits = getImageTableValues( folderResult, outputType )
+    countSums = folderResult.getCountSums().tolist()
+    meanPercents = folderResult.getMeanPercents().tolist()
+    cumulatedPercents = np.cumsum( meanPercents ).tolist()
+
+    # every value is formatted once for both tables
+    bucketCount = len( poreSizeRangeArray )
+    cells = formatCells( imageValues, digits )
+    cells = cells.reshape( len( imageFiles ), bucketCount, cells.shape[1] )
+    imageLines = formatLines( imageFiles, cells )
+    resultLines = [ "name" + "".join( ", " + str( val ) for val in poreSizeRangeArray ) ] + imageLines
+    if ( outputType < 3 ):
+        # the sum line continues the values of the last image, as it always did
+        lastValues = imageLines[-1][len( imageFiles[-1] ):] if ( len( imageLines ) > 0 ) else ""
+        if ( calculatePoreDiameter ):
+            sumValues = [ str( countSums[i] ) for i in range( len( poreSizeRangeArray ) ) ]
+        else:
+            sumValues = [ str( countSums[i] ) + "," + str( round( meanPercents[i], 5 ) ) for i in range( len( poreSizeRangeArray ) ) ]
+        resultLines.append( 'Summe' + lastValues + "".join( "," + value for value in sumValues ) )
+    with open( outputDirectory + '/results.csv', 'w' ) as csvFile:
+        csvFile.write( "\n".join( resultLines ) + "\n" )
+
+    tableLines = [ ",".join( [ "#bucket" ] + folderResult.filenames ), ",".join( [ "#scale [nm/px]" ] + [ str( round( value, 3 ) ) for value in folderResult.pixelSizes ] ) ]
+    suffixes = None
+    if ( outputType < 3 ):
+        tableLines[0] += ",fullSum"
+        tableLines[1] += ",-"
+        if ( calculatePoreDiameter ):
+            suffixes = [ "," + str( countSums[i] ) for i in range( len( poreSizeRangeArray ) ) ]
+        else:
+            suffixes = [ "," + str( round( meanPercents[i], 5 ) ) + "," + str( round( cumulatedPercents[i], 5 ) ) for i in range( len( poreSizeRangeArray ) ) ]
+    tableLines += formatLines( [ str( val ) for val in poreSizeRangeArray ], cells.transpose( 1, 0, 2 ), suffixes )
+    with open( outputDirectory + ( '/mr_result.csv' if outputType < 3 else '/mr_line_result.csv' ), 'w' ) as csvFile:
+        csvFile.write( "\n".join( tableLines ) + "\n" )
+
+def readImageSize( directory, filename ):
+    # size of the masked image of the ImageJ macro, only results of former macro versions require opening the mask
+    sizePath = directory + outputDir_Pores + filename + suffix_ImageSize
+    if ( os.path.exists( sizePath ) ):
+        with open( sizePath, 'r' ) as sizeFile:
+            width, height = sizeFile.read().strip().split( ',' )
+        return int( width ), int( height )
+    from PIL import Image
+    im = Image.open( directory + outputDir_Pores + filename + "-masked.tif")
+    imageSize = im.size
+    im.close()
+    return imageSize
+
+def readPoreAreas( directory, filename, imageSize = None ):
+    # read the particle areas (2nd column) and the masked image size written by the ImageJ macro
+    # deactivated pixel size multiplication since the new script automatically does it
+    with warnings.catch_warnings():
+        warnings.simplefilter( "ignore" ) # empty result tables
+        poreAreas = np.loadtxt( directory + outputDir_Pores + filename + suffix_Pores, delimiter=',', skiprows=1, usecols=1, ndmin=1, dtype=np.float64 )
+    if ( imageSize is None ):
+        imageSize = readImageSize( directory, filename )
+    return poreAreas, tuple( imageSize )
+
+def getBucketIndices( values, poreSizeRangeArray ):
+    # returns the bucket index of every value and a mask of the values which are counted at all.
+    # Bucket i > 0 contains all values between poreSizeRangeArray[i-1] and poreSizeRangeArray[i],
+    # the last bucket additionally all values above the last limit. Values matching a limit exactly
+    # and values not above the first limit are dropped, as the original comparison loop did.
+    limits = np.asarray( poreSizeRangeArray, dtype=np.float64 )
+    bucketCount = len( limits )
+    index = np.searchsorted( limits, values, side='left' )
+    bucketIndex = np.minimum( index, bucketCount-1 )
+    # values above the last limit can not match it
+    onLimit = values == limits[bucketIndex]
+    valid = ( index > 0 ) & ~onLimit & ~np.isnan( values )
+    return bucketIndex, valid
+
+def binParticles( values, imageIndex, imageCount, poreSizeRangeArray, percentWeights = None, countWeights = None, sizeWeights = None ):
+    # bins the particles of many images at once, imageIndex is the image of every particle
+    # returns the count, size sum and area-% sum per image and bucket ( imageCount x bucketCount ) and the number of counted particles
+    # countWeights / sizeWeights are counted and summed instead of 1 and the values per particle (e.g. pixel counts and areas)
+    bucketCount = len( poreSizeRangeArray )
+    index, valid = getBucketIndices( values, poreSizeRangeArray )
+    flatIndex = imageIndex[valid] * bucketCount + index[valid]
+    binCount = imageCount * bucketCount
+    if ( countWeights is not None ):
+        counts = np.bincount( flatIndex, weights=countWeights[valid], minlength=binCount ).astype( np.int64 ).reshape( imageCount, bucketCount )
+    else:
+        counts = np.bincount( flatIndex, minlength=binCount ).reshape( imageCount, bucketCount )
+    sizes = np.bincount( flatIndex, weights=( values if sizeWeights is None else sizeWeights )[valid], minlength=binCount ).reshape( imageCount, bucketCount )
+    if ( percentWeights is not None ):
+        percents = np.bincount( flatIndex, weights=percentWeights[valid], minlength=binCount ).reshape( imageCount, bucketCount )
+    else:
+        percents = np.zeros( ( imageCount, bucketCount ) )
+    return counts, sizes, percents, len( flatIndex )
+
+def createImageResult( filename, pixelSize, imageSize, poreSizeRangeArray, counts, sizes, percents, processedElements ):
+    result = ImageResult( filename, pixelSize, imageSize, poreSizeRangeArray )
+    result.poreCountArray = counts.tolist()
+    result.poreSizeArray = sizes.tolist()
+    result.poreSizePercentArray = percents.tolist()
+    result.processedElements = processedElements
+    return result
+
+def binPoreAreas( filename, pixelSize, poreAreas, imageSize, poreSizeRangeArray, calculatePoreDiameter = False, showDebuggingOutput = False, binningValues = None ):
+    # binningValues: value of every pore binned instead of its area (e.g. a descriptor of pore_analysis.morphology), the area-% stay based on the areas
+    areas = np.asarray( poreAreas, dtype=np.float64 ).ravel()
+    imageArea = imageSize[0] * pixelSize * imageSize[1] * pixelSize
+    if ( binningValues is not None ):
+        poreSizes = np.asarray( binningValues, dtype=np.float64 ).ravel()
+    else:
+        poreSizes = np.sqrt( areas ) if ( calculatePoreDiameter ) else areas
+    counts, sizes, percents, countedElements = binParticles( poreSizes, np.zeros( len( areas ), dtype=np.intp ), 1, poreSizeRangeArray, areas/imageArea*100 )
+    if ( showDebuggingOutput ) : print( ' ' + str( len( areas ) - countedElements ) + ' elements outside of the size ranges or on a range limit' )
+    return createImageResult( filename, pixelSize, imageSize, poreSizeRangeArray, counts[0], sizes[0], percents[0], len( areas ) )
+
+def binPoreSizeDistribution( filename, pixelSize, distribution, imageSize, poreSizeRangeArray, showDebuggingOutput = False ):
+    # distribution: squared inscribed radius (px²) and pixel count of the pore pixels (pore_analysis.granulometry)
+    # the pixels are binned by their inscribed radius in nm, the count holds the pixels, the size their area in nm²
+    distribution = np.asarray( distribution, dtype=np.int64 ).reshape( -1, 2 )
+    radii = np.sqrt( distribution[:, 0].astype( np.float64 ) ) * pixelSize
+    pixelCounts = distribution[:, 1].astype( np.float64 )
+    areas = pixelCounts * pixelSize * pixelSize
+    imageArea = imageSize[0] * pixelSize * imageSize[1] * pixelSize
+    counts, sizes, percents, countedElements = binParticles( radii, np.zeros( len( radii ), dtype=np.intp ), 1, poreSizeRangeArray, areas/imageArea*100, pixelCounts, areas )
+    if ( showDebuggingOutput ) : print( ' ' + str( len( radii ) - countedElements ) + ' inscribed radii outside of the size ranges or on a range limit' )
+    return createImageResult( filename, pixelSize, imageSize, poreSizeRangeArray, counts[0], sizes[0], percents[0], int( pixelCounts.sum() ) )
+
+def binLineLengths( filename, pixelSize, lineLengths, imageSize, poreSizeRangeArray, showDebuggingOutput = False ):
+    # line lengths are stored in poreSizeArray / poreCountArray
+    lineLengths = np.asarray( lineLengths, dtype=np.float64 ).ravel()
+    counts, sizes, percents, countedElements = binParticles( lineLengths, np.zeros( len( lineLengths ), dtype=np.intp ), 1, poreSizeRangeArray )
+    if ( showDebuggingOutput ) : print( ' ' + str( len( lineLengths ) - countedElements ) + ' elements outside of the size ranges or on a range limit' )
+    return createImageResult( filename, pixelSize, imageSize, poreSizeRangeArray, counts[0], sizes[0], percents[0], len( lineLengths ) )
@@ -0,0 +1,296 @@
+#########################################################
+# In-process pore segmentation
+#
+# Reproduces the processing steps of pore_analysis.ijm and
+# pore_analysis_single_file.ijm on NumPy arrays, so no
+# ImageJ process has to be started for every image.
+#
+# requires numpy, scipy and PIL
+#
+#########################################################
+
+import math
+import os
+import numpy as np
+from PIL import Image
+from scipy import ndimage
+
+from pore_analysis import trace
+
+# "Analyze Particles" traces 8-connected particles
+particleStructure = np.ones( (3, 3), dtype=bool )
+# ImageJ "Erode" / "Dilate" with iterations=1 and count=1
+cleaningStructure = np.ones( (3, 3), dtype=bool )
+
+imageDescriptionTag = 270
+
+# parameters of the image enhancements in pore_analysis_single_file.ijm
+backgroundRadius = 100
+blurSigma = 2.5
+contrastSaturation = 0.3
+artifactRadius = 30
+# pipelines of the macros: 'single' (pore_analysis_single_file.ijm) and 'folder' (pore_analysis.ijm, used for scale folders)
+pipelines = ( 'single', 'folder' )
+# shrink factors of ImageJ's rolling ball, used by backgroundShrink = 0
+shrinkFactorLimits = ( ( 10, 1 ), ( 30, 2 ), ( 100, 4 ) )
+maximumShrinkFactor = 8
+
+def loadImage( path ):
+    im = Image.open( path )
+    try:
+        image = np.asarray( im )
+    finally:
+        im.close()
+    return image
+
+def convertTo8Bit( image, valueRange = None ):
+    # same as run("8-bit"): RGB is averaged, 16/32-bit is scaled from min to max (of the whole image if valueRange is given)
+    if ( image.ndim == 3 ):
+        image = image[..., :3].mean( axis=2 )
+        return np.clip( np.round( image ), 0, 255 ).astype( np.uint8 )
+    if ( image.dtype == np.uint8 ):
+        return image
+    image = image.astype( np.float64 )
+    minValue, maxValue = valueRange if valueRange is not None else ( image.min(), image.max() )
+    if ( maxValue <= minValue ):
+        return np.zeros( image.shape, dtype=np.uint8 )
+    image = ( image - minValue ) / ( maxValue - minValue ) * 256
+    return np.clip( image, 0, 255 ).astype( np.uint8 )
+
+def getBorderWidth( width, height, infoBarHeight, doRemoveBorderPercent ):
+    if ( doRemoveBorderPercent > 0 ):
+        removeBorderWidth = math.floor( width/100*doRemoveBorderPercent )
+        removeBorderHeight = math.floor( ( height-infoBarHeight )/100*doRemoveBorderPercent )
+    else:
+        removeBorderWidth = 0
+        removeBorderHeight = 0
+    return removeBorderWidth, removeBorderHeight
+
+def cropImage( image, infoBarHeight, doRemoveBorderPercent = 0 ):
+    # removes the info bar and (optionally) the right and top image border
+    height, width = image.shape[:2]
+    removeBorderWidth, removeBorderHeight = getBorderWidth( width, height, infoBarHeight, doRemoveBorderPercent )
+    return image[removeBorderHeight:height-infoBarHeight, 0:width-removeBorderWidth]
+
+def getParaboloidReach( valueRange, coefficient ):
+    # paraboloids further away than this can not lower a value
+    return int( math.ceil( math.sqrt( valueRange / coefficient ) ) ) if valueRange > 0 else 0
+
+def getShrinkFactor( radius, backgroundShrink = 1 ):
+    # backgroundShrink: 1 exact background, >1 the background is estimated on an image shrunk by this factor, 0 automatic
+    if ( backgroundShrink > 0 ):
+        return int( backgroundShrink )
+    for radiusLimit, shrinkFactor in shrinkFactorLimits:
+        if ( radius <= radiusLimit ):
+            return shrinkFactor
+    return maximumShrinkFactor
+
+def getBackgroundReach( radius, backgroundShrink = 1 ):
+    # pixels of an 8-bit image further away than this do not change the result of subtractBackground()
+    shrinkFactor = getShrinkFactor( radius, backgroundShrink )
+    if ( shrinkFactor == 1 ):
+        return getParaboloidReach( 255, 0.5 / radius ) + 1 # +1: 3x3 mean
+    # +2 blocks: block minimum and interpolation
+    return ( getParaboloidReach( 255, 0.5 / radius * shrinkFactor * shrinkFactor ) + 2 ) * shrinkFactor + 1
+
+def paraboloidErosion( data, coefficient ):
+    # lower envelope of paraboloids c*(dx²+dy²) below the data (separable in x and y)
+    valueRange = float( data.max() - data.min() )
+    for axis in ( 1, 0 ):
+        length = data.shape[axis]
+        reach = min( length-1, getParaboloidReach( valueRange, coefficient ) )
+        result = data.copy()
+        source = np.moveaxis( data, axis, 0 )
+        target = np.moveaxis( result, axis, 0 )
+        for d in range( 1, reach+1 ):
+            offset = coefficient * d * d
+            np.minimum( target[d:], source[:-d] + offset, out=target[d:] )
+            np.minimum( target[:-d], source[d:] + offset, out=target[:-d] )
+        data = result
+    return data
+
+def meanFilter3x3( data ):
+    # 3x3 mean with replicated edges, every pixel is summed in the same order, so tiles give identical results
+    padded = np.pad( data, 1, mode='edge' )
+    rows = padded[:-2] + padded[1:-1] + padded[2:]
+    return ( rows[:, :-2] + rows[:, 1:-1] + rows[:, 2:] ) / np.float32( 9 )
+
+def shrinkImage( data, shrinkFactor ):
+    # minimum of every shrinkFactor x shrinkFactor block, incomplete blocks at the right and bottom border are padded
+    height, width = data.shape
+    padded = np.pad( data, ( ( 0, -height % shrinkFactor ), ( 0, -width % shrinkFactor ) ), mode='edge' )
+    blocks = padded.reshape( padded.shape[0] // shrinkFactor, shrinkFactor, padded.shape[1] // shrinkFactor, shrinkFactor )
+    return blocks.min( axis=( 1, 3 ) )
+
+def enlargeImage( data, shrinkFactor, shape ):
+    # bilinear interpolation between the block centres of a shrunk image
+    for axis in ( 0, 1 ):
+        positions = np.clip( ( np.arange( shape[axis] ) - ( shrinkFactor-1 ) / 2 ) / shrinkFactor, 0, data.shape[axis]-1 )
+        lower = np.floor( positions ).astype( np.intp )
+        upper = np.minimum( lower+1, data.shape[axis]-1 )
+        fraction = ( positions - lower ).astype( np.float32 )
+        if ( axis == 1 ):
+            data = data[:, lower] + ( data[:, upper] - data[:, lower] ) * fraction
+        else:
+            data = data[lower] + ( data[upper] - data[lower] ) * fraction[:, np.newaxis]
+    return data
+
+def estimateBackground( smoothed, radius, shrinkFactor = 1 ):
+    # sliding paraboloid, with shrinkFactor > 1 it is calculated on the shrunk image (faster, but approximated)
+    if ( shrinkFactor == 1 ):
+        return paraboloidErosion( smoothed, 0.5 / radius )
+    # distances in the shrunk image are shrinkFactor times smaller
+    background = paraboloidErosion( shrinkImage( smoothed, shrinkFactor ), 0.5 / radius * shrinkFactor * shrinkFactor )
+    return enlargeImage( background, shrinkFactor, smoothed.shape )
+
+def subtractBackground( image, radius, lightBackground = True, backgroundShrink = 1 ):
+    # run("Subtract Background...", "rolling=<radius> light sliding")
+    data = image.astype( np.float32 )
+    if ( lightBackground ):
+        data = 255 - data
+    smoothed = meanFilter3x3( data )
+    background = np.minimum( estimateBackground( smoothed, radius, getShrinkFactor( radius, backgroundShrink ) ), data )
+    result = data - background
+    if ( lightBackground ):
+        result = 255 - result
+    return np.clip( np.round( result ), 0, 255 ).astype( np.uint8 )
+
+def gaussianBlur( image, sigma ):
+    blurred = ndimage.gaussian_filter( image.astype( np.float32 ), sigma, mode='nearest' )
+    return np.clip( np.round( blurred ), 0, 255 ).astype( np.uint8 )
+
+def getGaussianReach( sigma ):
+    # kernel radius of ndimage.gaussian_filter (truncate=4)
+    return int( 4.0 * sigma + 0.5 )
+
+def getContrastLimits( image, saturated ):
+    return getHistogramLimits( np.bincount( image.ravel(), minlength=256 ), saturated )
+
+def getHistogramLimits( histogram, saturated ):
+    threshold = int( histogram.sum() * saturated / 200.0 )
+    fromBottom = np.cumsum( histogram )
+    fromTop = np.cumsum( histogram[::-1] )
+    hmin = min( int( np.argmax( fromBottom > threshold ) ), 255 )
+    hmax = 255 - min( int( np.argmax( fromTop > threshold ) ), 255 )
+    return hmin, hmax
+
+def enhanceContrast( image, saturated = 0.3 ):
+    # run("Enhance Contrast...", "saturated=<saturated> normalize")
+    hmin, hmax = getContrastLimits( image, saturated )
+    if ( hmax <= hmin ):
+        return image
+    return getContrastLut( hmin, hmax )[image]
+
+def getContrastLut( hmin, hmax ):
+    values = np.arange( 256, dtype=np.float64 )
+    lut = np.floor( ( values - hmin ) / ( hmax - hmin ) * 255 )
+    return np.clip( lut, 0, 255 ).astype( np.uint8 )
+
+def downsampleImage( image, previewFactor ):
+    # mean of every previewFactor x previewFactor block, incomplete blocks at the right and bottom border are dropped
+    height = image.shape[0] // previewFactor
+    width = image.shape[1] // previewFactor
+    blocks = image[:height*previewFactor, :width*previewFactor].reshape( height, previewFactor, width, previewFactor )
+    return np.round( blocks.mean( axis=( 1, 3 ), dtype=np.float32 ) ).astype( np.uint8 )
+
+def getPipelineRadii( width, pipeline = 'single' ):
+    # radius of the first background subtraction, sigma of the blur (0: no blur) and radius of the second background subtraction
+    # width: width of the image before it was cropped (getWidth() of the macro)
+    if ( pipeline == 'folder' ):
+        # rolling=round(width / 10) and rolling=round(width / 30) without a blur
+        return max( 1, math.floor( width/10 + 0.5 ) ), 0, max( 1, math.floor( width/30 + 0.5 ) )
+    return backgroundRadius, blurSigma, artifactRadius
+
+def preprocessImage( image, backgroundShrink = 1, previewFactor = 1, radii = None ):
+    # image enhancements of the macro, result equals processed/*-processed.tif
+    # previewFactor: the image was downsampled by this factor, so the radii are reduced to cover the same area
+    # radii: see getPipelineRadii(), default: pore_analysis_single_file.ijm
+    firstRadius, sigma, secondRadius = radii or ( backgroundRadius, blurSigma, artifactRadius )
+    image = subtractBackground( image, firstRadius/previewFactor, True, backgroundShrink ) # removing shadowing using a rather large ball
+    if ( sigma > 0 ):
+        image = gaussianBlur( image, sigma/previewFactor ) # remove some noise
+    image = enhanceContrast( image, contrastSaturation )
+    image = subtractBackground( image, secondRadius/previewFactor, True, backgroundShrink ) # removing some left over artifacts
+    return image
+
+def getProcessedDescription( backgroundShrink, pipeline = 'single' ):
+    # stored in processed/*-processed.tif if the background was approximated or the folder macro was reproduced
+    if ( backgroundShrink == 1 and pipeline == 'single' ):
+        return None
+    return "pore_analysis backgroundShrink=" + str( backgroundShrink ) + ( " pipeline=" + pipeline if pipeline != 'single' else "" )
+
+def isProcessedWith( description, backgroundShrink, pipeline = 'single' ):
+    # images processed by ImageJ or without a description have an exact background, only the single image pipeline is
+    # trusted, as the macro that wrote them is unknown
+    if ( description is None or not description.startswith( "pore_analysis" ) ):
+        return ( backgroundShrink == 1 and pipeline == 'single' )
+    return ( description == getProcessedDescription( backgroundShrink, pipeline ) )
+
+def getProcessedImage( path, infoBarHeight, doRemoveBorderPercent = 0, processedPath = None, backgroundShrink = 1, pipeline = 'single' ):
+    # returns the preprocessed image, an existing processed/*-processed.tif newer than the image is reused
+    if ( processedPath is not None and os.path.exists( processedPath ) and os.path.getmtime( processedPath ) >= os.path.getmtime( path ) ):
+        im = Image.open( processedPath )
+        try:
+            description = im.tag_v2.get( imageDescriptionTag ) if hasattr( im, 'tag_v2' ) else None
+            processed = np.asarray( im )
+        finally:
+            im.close()
+        image = Image.open( path )
+        width, height = image.size
+        image.close()
+        removeBorderWidth, removeBorderHeight = getBorderWidth( width, height, infoBarHeight, doRemoveBorderPercent )
+        if ( isProcessedWith( description, backgroundShrink, pipeline ) and processed.dtype == np.uint8 and processed.shape == ( height-infoBarHeight-removeBorderHeight, width-removeBorderWidth ) ):
+            return processed
+    image = loadImage( path )
+    radii = getPipelineRadii( image.shape[1], pipeline )
+    processed = preprocessImage( convertTo8Bit( cropImage( image, infoBarHeight, doRemoveBorderPercent ) ), backgroundShrink, 1, radii )
+    if ( processedPath is not None ):
+        os.makedirs( os.path.dirname( processedPath ), exist_ok=True )
+        description = getProcessedDescription( backgroundShrink, pipeline )
+        Image.fromarray( processed ).save( processedPath, tiffinfo={ imageDescriptionTag: description } if description is not None else {} )
+    return processed
+
+def createPoreMask( processed, thresholdLimit, doSpeckleCleaning = 1 ):
+    # setThreshold(0, thresholdLimit) and run("Convert to Mask")
+    mask = processed <= thresholdLimit
+    if ( doSpeckleCleaning ):
+        # remove too small masks using erode / dilate
+        mask = ndimage.binary_opening( mask, structure=cleaningStructure, border_value=0 )
+        # particles are analysed within makeRectangle(1, 1, width-2, height-2)
+        mask[0, :] = False
+        mask[-1, :] = False
+        mask[:, 0] = False
+        mask[:, -1] = False
+    return mask
+
+def labelParticles( mask ):
+    # label image of the 8-connected particles and their count
+    return ndimage.label( mask, structure=particleStructure )
+
+def analyseParticles( mask, scale = 0 ):
+    # run("Analyze Particles...") returning the particle areas (scaled to nm² if a scale is given)
+    labels, particleCount = labelParticles( mask )
+    areas = np.bincount( labels.ravel(), minlength=particleCount+1 )[1:].astype( np.float64 )
+    if ( scale > 0 ):
+        areas *= scale * scale
+    return areas
+
+def segmentImage( path, thresholdLimit, infoBarHeight, scale = 0, doSpeckleCleaning = 1, doRemoveBorderPercent = 0, backgroundShrink = 1, previewFactor = 1, pipeline = 'single' ):
+    # full pipeline for a single image, returns the particle areas and the pore mask
+    # previewFactor > 1: the image is downsampled by this factor before the preprocessing (scale is the downsampled pixel size)
+    # pipeline: image enhancements of pore_analysis_single_file.ijm ('single') or pore_analysis.ijm ('folder')
+    filename = os.path.basename( path )
+    with trace.stage( 'load image', image=filename ):
+        image = loadImage( path )
+        radii = getPipelineRadii( image.shape[1], pipeline )
+        image = convertTo8Bit( cropImage( image, infoBarHeight, doRemoveBorderPercent ) )
+        if ( previewFactor > 1 ):
+            image = downsampleImage( image, previewFactor )
+    with trace.stage( 'preprocessing', image=filename ):
+        processed = preprocessImage( image, backgroundShrink, previewFactor, radii )
+    with trace.stage( 'threshold', image=filename ):
+        mask = createPoreMask( processed, thresholdLimit, doSpeckleCleaning )
+    with trace.stage( 'particle analysis', image=filename ) as stage:
+        poreAreas = analyseParticles( mask, scale )
+        stage['particles'] = len( poreAreas )
+    return poreAreas, mask
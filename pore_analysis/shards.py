@@ -0,0 +1,358 @@
+#########################################################
+# Sharded analysis of large specimen trees
+#
+# plan:  splits the images of one or more specimen folders (scale
+#        metadata or 400nm / 500nm / 2000nm scale folders) into
+#        shards and writes the job manifest (a JSON plan file)
+# work:  analyses unclaimed shards of a plan. A shard is claimed by
+#        creating <plan>.shard<N>.claim exclusively, so any number
+#        of workers on several nodes can share the plan directory.
+#        Every shard writes the bucket arrays of its images to
+#        <plan>.shard<N>.json, nothing else of a folder is changed.
+# merge: combines the partial results of all shards, which is a
+#        union of the image results (associative and independent
+#        of the order), and writes the manifest, results.csv,
+#        mr_result.csv and the plot of every folder like a single
+#        run of start_pore_analysis.py
+# local: starts several local worker processes sharing the plan
+#        directory and merges their results
+#
+# usage: python -m pore_analysis.shards plan <planFile> <shardCount> [options of python -m pore_analysis] <directory> [<directory> ...]
+#        python -m pore_analysis.shards work <planFile> [-s <shard>] [-j <jobs>] [-w <fijiWorkers>]
+#        python -m pore_analysis.shards merge <planFile>
+#        python -m pore_analysis.shards local <planFile> [-n <workerProcesses>] [-j <jobs>]
+#
+#########################################################
+
+import json
+import os
+import platform
+import subprocess
+import sys, getopt
+import time
+
+from pore_analysis import analysis, manifest, metadata, trace
+
+planVersion = 1
+
+def getShardPath( planPath, shardIndex, extension ):
+    return planPath + '.shard' + str( shardIndex ) + extension
+
+def writeJson( path, content ):
+    # the file is replaced at once, so other processes never read a partial file
+    temporaryPath = path + '.' + str( os.getpid() ) + '.tmp'
+    with open( temporaryPath, 'w' ) as jsonFile:
+        json.dump( content, jsonFile )
+    os.replace( temporaryPath, path )
+
+def readJson( path ):
+    with open( path, 'r' ) as jsonFile:
+        return json.load( jsonFile )
+
+def getFolderPath( planPath, folder ):
+    # folders are stored relative to the plan, so the nodes may mount the shared directory elsewhere
+    return os.path.normpath( os.path.join( os.path.dirname( os.path.abspath( planPath ) ), folder['directory'] ) )
+
+def planFolder( plotName, directory, config, forcedScale = None ):
+    # the images of a folder and the ImageJ scale settings of every image, as createImageTasks() finds them
+    forcedScale = forcedScale or 1
+    images = []
+    for file in os.listdir(directory):
+        filename = os.fsdecode(file)
+        if ( analysis.isImageFile( filename ) ):
+            pixelSize = analysis.getPixelSizeFromMetaData( directory, filename, config )
+            if pixelSize == 0:
+                pixelSize = forcedScale
+                if forcedScale == 1:
+                    print( "Skalierung vermutlich fehlerhaft!" )
+            images.append( { 'filename': filename, 'pixelSize': pixelSize, 'metricScale': config['metricScale'], 'pixelScale': config['pixelScale'] } )
+    if ( config['useNumpyEngine'] ):
+        os.makedirs( directory + analysis.outputDir_Pores, exist_ok=True )
+    metadata.saveMetaDataCaches()
+    return { 'plotName': plotName, 'directory': directory, 'infoBarHeight': config['infoBarHeight'], 'images': images }
+
+def planSpecimen( path, config ):
+    # the folders analyseFolder() would analyse
+    config = dict( config )
+    if analysis.scaleInMetaData( path, config ):
+        print( "Tiffs with scale metadata found!" )
+        return [ planFolder( 'Plot', path, config ) ]
+    folders = []
+    for subDir in os.listdir(path):
+        directory = path + "/" + subDir
+        if os.path.isdir( directory ) and analysis.matchSubdirName( subDir, config ):
+            folderScale = config['metricScale']/config['pixelScale'] #nm/px
+            print( "Selected scale:  " + str( config['metricScale'] ) + " nm / " + str( config['pixelScale'] ) + " px = " + str( folderScale ) + " nm / px" )
+            folder = planFolder( subDir, directory, config, folderScale )
+            folder['pipeline'] = 'folder'
+            folders.append( folder )
+    return folders
+
+def planShards( directories, shardCount, planPath, config = None ):
+    # writes the job manifest of all images of the given specimen folders split into shardCount shards
+    settings = { key: value for key, value in ( config or {} ).items() if key in analysis.defaultConfig }
+    config = analysis.createConfig( settings )
+    if ( len( config['thresholdSweep'] ) > 0 or config['previewFactor'] > 1 or config['watchFolder'] ):
+        raise ValueError( "threshold sweeps, the preview and the watch mode can not be sharded" )
+    planDirectory = os.path.dirname( os.path.abspath( planPath ) )
+    folders = []
+    for path in directories:
+        for folder in planSpecimen( path, config ):
+            folder['directory'] = os.path.relpath( os.path.abspath( folder['directory'] ), planDirectory )
+            folders.append( folder )
+    images = [ ( folderIndex, imageIndex ) for folderIndex, folder in enumerate( folders ) for imageIndex in range( len( folder['images'] ) ) ]
+    shardCount = max( 1, min( shardCount, len( images ) ) )
+    # consecutive images of similar count, so a shard mostly covers a single folder
+    shards = []
+    for shardIndex in range( shardCount ):
+        shards.append( [ list( image ) for image in images[len( images )*shardIndex//shardCount:len( images )*( shardIndex+1 )//shardCount] ] )
+    # settings of the nodes are chosen by the workers
+    for key in ( 'jobs', 'fijiWorkers', 'openPlot' ):
+        settings.pop( key, None )
+    plan = { 'version': planVersion, 'created': time.strftime( '%Y-%m-%d %H:%M:%S' ), 'config': settings, 'folders': folders, 'shards': shards }
+    writeJson( planPath, plan )
+    print( "planned " + str( len( images ) ) + " image(s) of " + str( len( folders ) ) + " folder(s) in " + str( len( shards ) ) + " shard(s): " + planPath )
+    return plan
+
+def readPlan( planPath ):
+    plan = readJson( planPath )
+    if ( plan.get( 'version' ) != planVersion ):
+        raise ValueError( "unsupported plan file " + planPath )
+    return plan
+
+def getFolderConfig( config, folder ):
+    # copy of the config with the state of the folder found while planning
+    folderConfig = dict( config )
+    folderConfig['infoBarHeight'] = folder['infoBarHeight']
+    if ( folder.get( 'pipeline', 'single' ) == 'folder' ):
+        folderConfig = analysis.getScaleFolderConfig( folderConfig )
+    return folderConfig
+
+def createShardTasks( planPath, plan, shardIndex, config ):
+    # tasks of the images of a shard, the manifest of a folder is only read
+    from pore_analysis import parallel
+    runImageJPerImage = config['runImageJ'] and not config['useNumpyEngine']
+    engine = 'numpy' if config['useNumpyEngine'] else ( 'imagej' if runImageJPerImage else None )
+    tasks = []
+    manifests = {}
+    for folderIndex, imageIndex in plan['shards'][shardIndex]:
+        folder = plan['folders'][folderIndex]
+        image = folder['images'][imageIndex]
+        directory = getFolderPath( planPath, folder )
+        filename = image['filename']
+        folderConfig = getFolderConfig( config, folder )
+        folderConfig['metricScale'] = image['metricScale']
+        folderConfig['pixelScale'] = image['pixelScale']
+        if ( engine is None and not os.path.exists( directory + analysis.outputDir_Pores + os.path.splitext( filename )[0] + analysis.suffix_Pores ) ):
+            print( os.path.splitext( filename )[0] + analysis.suffix_Pores + " not found!" )
+            continue
+        command = None
+        upToDate = False
+        imageSize = None
+        if ( engine is not None ):
+            if ( directory not in manifests ):
+                manifests[directory] = manifest.Manifest( directory )
+            imageManifest = manifests[directory]
+            upToDate = imageManifest.isUpToDate( filename, analysis.getSegmentationParameters( image['pixelSize'], folderConfig ), engine )
+            if ( upToDate ):
+                print( " " + filename + " is unchanged, using previous results" )
+                imageSize = imageManifest.images[filename]['imageSize']
+            else:
+                # only the outputs of the image are removed, the manifest is written by the merge
+                imageManifest.invalidate( filename, engine )
+                if ( engine == 'imagej' ):
+                    print( " Analysing " + filename + ";" )
+                    command = analysis.getImageJCommand( directory, filename, folderConfig )
+        task = parallel.createImageTask( directory, filename, image['pixelSize'], analysis.getTaskOptions( folderConfig ), command, upToDate, imageSize )
+        task['engine'] = engine
+        task['macroArgument'] = analysis.getImageJArgument( directory, filename, folderConfig ) if command is not None else None
+        task['folderIndex'] = folderIndex
+        tasks.append( task )
+    return tasks
+
+def getImageRecord( task, imageResult ):
+    # partial result of an image, None if it has no results
+    if ( imageResult is None ):
+        return None
+    return {
+        'engine': task['engine'],
+        'segmented': not task['upToDate'],
+        'pixelSize': imageResult.pixelSize,
+        'imageSize': [ imageResult.width, imageResult.height ],
+        'processedElements': imageResult.processedElements,
+        'counts': imageResult.poreCountArray,
+        'sizes': imageResult.poreSizeArray,
+        'percents': imageResult.poreSizePercentArray
+    }
+
+def runShard( planPath, shardIndex, config = None ):
+    # analyses the images of a shard and writes their bucket arrays to <plan>.shard<N>.json
+    from pore_analysis import parallel
+    plan = readPlan( planPath )
+    settings = dict( plan['config'] )
+    settings.update( config or {} )
+    config = analysis.createConfig( settings )
+    startTime = time.perf_counter()
+    with trace.stage( 'shard', shard=shardIndex ):
+        tasks = createShardTasks( planPath, plan, shardIndex, config )
+        analysis.runFijiWorkers( tasks, config )
+        imageResults = parallel.runTasks( parallel.analyseImageTask, tasks, config['jobs'] )
+    partial = { 'images': {} }
+    for task, imageResult in zip( tasks, imageResults ):
+        partial['images'][str( task['folderIndex'] ) + '/' + task['filename']] = getImageRecord( task, imageResult )
+    writeJson( getShardPath( planPath, shardIndex, '.json' ), { 'version': planVersion, 'shard': shardIndex, 'host': platform.node(), 'duration': time.perf_counter() - startTime, 'partial': partial } )
+    print( "shard " + str( shardIndex ) + ": " + str( len( tasks ) ) + " image(s) analysed in " + str( round( time.perf_counter() - startTime, 1 ) ) + " s" )
+    return partial
+
+def claimShard( planPath, shardIndex ):
+    # True if this process may analyse the shard, the claim file is created atomically (also on NFS)
+    if ( os.path.exists( getShardPath( planPath, shardIndex, '.json' ) ) ):
+        return False
+    try:
+        claimFile = os.open( getShardPath( planPath, shardIndex, '.claim' ), os.O_CREAT | os.O_EXCL | os.O_WRONLY )
+    except FileExistsError:
+        return False
+    with os.fdopen( claimFile, 'w' ) as claim:
+        claim.write( platform.node() + ' ' + str( os.getpid() ) + ' ' + time.strftime( '%Y-%m-%d %H:%M:%S' ) + '\n' )
+    return True
+
+def workShards( planPath, shardIndex = None, config = None ):
+    # analyses the given shard or claims unclaimed shards until none is left, returns the analysed shards
+    plan = readPlan( planPath )
+    shardIndices = [ shardIndex ] if shardIndex is not None else range( len( plan['shards'] ) )
+    analysedShards = []
+    for index in shardIndices:
+        if ( claimShard( planPath, index ) or shardIndex is not None ):
+            runShard( planPath, index, config )
+            analysedShards.append( index )
+    return analysedShards
+
+def mergePartials( partials ):
+    # union of the image results of several shards, the same image has to have the same result in all of them
+    merged = { 'images': {} }
+    for partial in partials:
+        for key, record in partial['images'].items():
+            if ( key in merged['images'] and merged['images'][key] != record ):
+                raise ValueError( "different results of " + key + " in two shards" )
+            merged['images'][key] = record
+    return merged
+
+def readPartials( planPath, plan ):
+    # partial results of all shards, exits if a shard is missing
+    partials = []
+    missingShards = []
+    for shardIndex in range( len( plan['shards'] ) ):
+        shardPath = getShardPath( planPath, shardIndex, '.json' )
+        if ( os.path.exists( shardPath ) ):
+            partials.append( readJson( shardPath )['partial'] )
+        else:
+            claimPath = getShardPath( planPath, shardIndex, '.claim' )
+            if ( os.path.exists( claimPath ) ):
+                with open( claimPath, 'r' ) as claim:
+                    print( " shard " + str( shardIndex ) + " is not finished (claimed by " + claim.read().strip() + "), remove " + claimPath + " to analyse it again" )
+            else:
+                print( " shard " + str( shardIndex ) + " was not analysed yet" )
+            missingShards.append( shardIndex )
+    return partials, missingShards
+
+def mergeShards( planPath, config = None ):
+    # writes the results of all folders of the plan, returns { directory: FolderResult } (None if a shard is missing)
+    import numpy as np
+    from pore_analysis import results
+    plan = readPlan( planPath )
+    settings = dict( plan['config'] )
+    settings.update( config or {} )
+    config = analysis.createConfig( settings )
+    partials, missingShards = readPartials( planPath, plan )
+    if ( len( missingShards ) > 0 ):
+        print( str( len( missingShards ) ) + " of " + str( len( plan['shards'] ) ) + " shard(s) missing, nothing merged" )
+        return None
+    merged = mergePartials( partials )
+    engine = 'numpy' if config['useNumpyEngine'] else ( 'imagej' if config['runImageJ'] else None )
+    folderResults = {}
+    for folderIndex, folder in enumerate( plan['folders'] ):
+        directory = getFolderPath( planPath, folder )
+        folderConfig = getFolderConfig( config, folder )
+        tasks = []
+        imageResults = []
+        for image in folder['images']:
+            record = merged['images'].get( str( folderIndex ) + '/' + image['filename'] )
+            baseName = os.path.splitext( image['filename'] )[0]
+            tasks.append( { 'filename': image['filename'], 'baseName': baseName } )
+            if ( record is None ):
+                imageResults.append( None )
+            else:
+                imageResults.append( results.createImageResult( baseName, record['pixelSize'], tuple( record['imageSize'] ), folderConfig['poreSizeRangeArray'], np.array( record['counts'] ), np.array( record['sizes'] ), np.array( record['percents'] ), record['processedElements'] ) )
+        if ( engine is not None ):
+            # the manifest of the folder is only written here, so the next run reuses the segmented images
+            imageManifest = manifest.Manifest( directory )
+            imageManifest.removeMissingImages( [ image['filename'] for image in folder['images'] ] )
+            for image, imageResult in zip( folder['images'], imageResults ):
+                record = merged['images'].get( str( folderIndex ) + '/' + image['filename'] )
+                if ( imageResult is not None and record['segmented'] ):
+                    imageManifest.update( image['filename'], analysis.getSegmentationParameters( image['pixelSize'], folderConfig ), record['engine'], ( imageResult.width, imageResult.height ) )
+            imageManifest.save()
+        folderResult, gnuplotBefehl = analysis.processImageJResults( directory, tasks, imageResults, folderConfig )
+        if ( folderResult is not None ):
+            folderResults[directory] = folderResult
+        if ( config['runGnuPlot'] ):
+            analysis.createGnuplotPlot( directory, folder['plotName'], gnuplotBefehl, config )
+    return folderResults
+
+def runLocal( planPath, workerCount = 2, jobs = 1 ):
+    # several worker processes on this machine stand in for the nodes of a cluster
+    arguments = [ sys.executable, '-m', 'pore_analysis.shards', 'work', planPath, '-j', str( jobs ) ]
+    environment = dict( os.environ )
+    packageParent = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+    environment['PYTHONPATH'] = packageParent + ( os.pathsep + environment['PYTHONPATH'] if environment.get( 'PYTHONPATH' ) else '' )
+    print( "starting " + str( workerCount ) + " local worker process(es)" )
+    workers = [ subprocess.Popen( arguments, env=environment ) for i in range( workerCount ) ]
+    returnCodes = [ worker.wait() for worker in workers ]
+    if ( any( returnCode != 0 for returnCode in returnCodes ) ):
+        print( "worker process(es) failed: " + ', '.join( str( returnCode ) for returnCode in returnCodes ) )
+    return mergeShards( planPath )
+
+if __name__ == '__main__':
+    usage = "python -m pore_analysis.shards plan <planFile> <shardCount> [options of python -m pore_analysis] <directory> [<directory> ...]\n       python -m pore_analysis.shards work <planFile> [-s <shard>] [-j <jobs>] [-w <fijiWorkers>]\n       python -m pore_analysis.shards merge <planFile>\n       python -m pore_analysis.shards local <planFile> [-n <workerProcesses>] [-j <jobs>]"
+    if ( len( sys.argv ) < 3 or sys.argv[1] not in ( 'plan', 'work', 'merge', 'local' ) ):
+        print( usage )
+        sys.exit( 2 )
+    mode = sys.argv[1]
+    planPath = sys.argv[2]
+    if ( mode == 'plan' ):
+        from pore_analysis import cli
+        if ( len( sys.argv ) < 4 ):
+            print( usage )
+            sys.exit( 2 )
+        config, tracePath, profileStages, directories = cli.processArguments( [ "python -m pore_analysis.shards plan <planFile> <shardCount>" ] + sys.argv[4:] )
+        if ( len( directories ) == 0 ):
+            print( usage )
+            sys.exit( 2 )
+        try:
+            planShards( directories, int( sys.argv[3] ), planPath, config )
+        except ValueError as e:
+            print( e )
+            sys.exit( 2 )
+        sys.exit()
+    try:
+        opts, args = getopt.gnu_getopt( sys.argv[3:], "s:j:w:n:" )
+    except getopt.GetoptError:
+        print( usage )
+        sys.exit( 2 )
+    shardIndex = None
+    config = {}
+    workerCount = 2
+    for opt, arg in opts:
+        if opt == '-s': shardIndex = int( arg )
+        elif opt == '-j': config['jobs'] = max( 1, int( arg ) )
+        elif opt == '-w': config['fijiWorkers'] = max( 0, int( arg ) )
+        elif opt == '-n': workerCount = max( 1, int( arg ) )
+    if ( mode == 'work' ):
+        analysedShards = workShards( planPath, shardIndex, config )
+        print( str( len( analysedShards ) ) + " shard(s) analysed" )
+    elif ( mode == 'merge' ):
+        if ( mergeShards( planPath ) is None ):
+            sys.exit( 1 )
+    elif ( mode == 'local' ):
+        if ( runLocal( planPath, workerCount, config.get( 'jobs', 1 ) ) is None ):
+            sys.exit( 1 )
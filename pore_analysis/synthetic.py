@@ -0,0 +1,152 @@
+#########################################################
+# Synthetic SEM pore images with a known ground truth
+#
+# Creates light 8-bit images with dark elliptic pores of a
+# log-normal size distribution, a shading gradient, noise, the
+# info bar of FEI / Thermo Fisher microscopes and the PixelWidth
+# metadata in its TIFF tag. The pores do not touch each other or
+# the image border, so the pixel count of every drawn pore is its
+# true area and the size distribution found by the pipeline can
+# be compared to it (python -m pore_analysis.benchmark pipeline).
+#
+# usage: python -m pore_analysis.synthetic <directory> [-n <imageCount>] [-w <imageWidth>] [-s <scale nm/px>]
+#        writes the images and ground_truth.npz (true pore areas
+#        in nm² per image) into directory
+#
+#########################################################
+
+import os
+import sys, getopt
+import numpy as np
+from PIL import Image, TiffImagePlugin
+
+from pore_analysis import metadata
+
+groundTruthFileName = "ground_truth.npz"
+infoBarHeight = 63 # px, default of start_pore_analysis.py
+backgroundValue = 185
+poreValue = 55
+shadingAmplitude = 35 # grey values from the left to the right border
+noiseSigma = 8
+edgeSigma = 0.8 # px, blur of the electron beam
+poreGap = 6 # px between two pores, they would merge after the blur of the preprocessing otherwise
+borderGap = 4 # px between the pores and the image border
+
+def getMetaDataText( pixelSize, width, contentHeight ):
+    # FEI metadata block, pixelSize in nm / px (stored in m)
+    return ( "[User]\r\nDate=01/01/2019\r\nTime=12:00:00 PM\r\n"
+        + "[Scan]\r\nPixelWidth=" + repr( pixelSize/1000000000 ) + "\r\nPixelHeight=" + repr( pixelSize/1000000000 ) + "\r\n"
+        + "[Image]\r\nResolutionX=" + str( width ) + "\r\nResolutionY=" + str( contentHeight ) + "\r\n" )
+
+def getEllipseMask( semiAxisA, semiAxisB, angle, growth = 0 ):
+    # pixels of a rotated ellipse around the center of its bounding box, growth enlarges both semi-axes
+    a = semiAxisA + growth
+    b = semiAxisB + growth
+    reach = int( np.ceil( max( a, b ) ) )
+    y, x = np.mgrid[-reach:reach+1, -reach:reach+1]
+    u = x*np.cos( angle ) + y*np.sin( angle )
+    v = y*np.cos( angle ) - x*np.sin( angle )
+    return ( u/a )**2 + ( v/b )**2 <= 1
+
+def drawPores( height, width, rng, porosity = 0.15, medianRadius = 4.0, radiusSigma = 0.6, maximumRadius = 40.0, maximumAttempts = 20 ):
+    # returns the pore mask and the pixel count of every pore
+    # equivalent radii are log-normally distributed, pores are placed from large to small until the porosity is reached
+    targetArea = porosity * width * height
+    radii = []
+    while ( np.pi * np.sum( np.square( radii ) ) < targetArea ):
+        radii.extend( np.clip( rng.lognormal( np.log( medianRadius ), radiusSigma, 256 ), 0.8, maximumRadius ).tolist() )
+    radii = np.sort( radii )[::-1]
+    mask = np.zeros( ( height, width ), dtype=bool )
+    occupied = np.zeros( ( height, width ), dtype=bool )
+    poreAreas = []
+    drawnArea = 0
+    for radius in radii:
+        if ( drawnArea >= targetArea ):
+            break
+        aspect = rng.uniform( 1, 2 )
+        semiAxisA = radius*np.sqrt( aspect )
+        semiAxisB = radius/np.sqrt( aspect )
+        angle = rng.uniform( 0, np.pi )
+        pore = getEllipseMask( semiAxisA, semiAxisB, angle )
+        if ( not pore.any() ):
+            continue
+        reach = pore.shape[0]//2
+        keepOut = getEllipseMask( semiAxisA, semiAxisB, angle, poreGap )
+        keepOutReach = keepOut.shape[0]//2
+        margin = keepOutReach + borderGap
+        if ( width <= 2*margin or height <= 2*margin ):
+            continue
+        for attempt in range( maximumAttempts ):
+            y = int( rng.integers( margin, height-margin ) )
+            x = int( rng.integers( margin, width-margin ) )
+            if ( not np.any( occupied[y-keepOutReach:y+keepOutReach+1, x-keepOutReach:x+keepOutReach+1] & keepOut ) ):
+                mask[y-reach:y+reach+1, x-reach:x+reach+1] |= pore
+                occupied[y-reach:y+reach+1, x-reach:x+reach+1] |= pore
+                area = int( pore.sum() )
+                poreAreas.append( area )
+                drawnArea += area
+                break
+    return mask, np.asarray( poreAreas, dtype=np.float64 )
+
+def createImage( width, height, seed = 0, porosity = 0.15, medianRadius = 4.0 ):
+    # returns the 8-bit image (including the info bar) and the pixel count of every pore
+    from scipy import ndimage
+    rng = np.random.default_rng( seed )
+    contentHeight = height - infoBarHeight
+    mask, poreAreas = drawPores( contentHeight, width, rng, porosity, medianRadius )
+    content = np.where( mask, poreValue, backgroundValue ).astype( np.float32 )
+    content = ndimage.gaussian_filter( content, edgeSigma )
+    content += np.linspace( -shadingAmplitude/2, shadingAmplitude/2, width, dtype=np.float32 )[np.newaxis, :]
+    content += rng.normal( 0, noiseSigma, content.shape ).astype( np.float32 )
+    image = np.zeros( ( height, width ), dtype=np.uint8 )
+    image[:contentHeight] = np.clip( np.round( content ), 0, 255 ).astype( np.uint8 )
+    # info bar: black with some white text blocks
+    for i in range( 8 ):
+        x = 10 + i * width//8
+        image[contentHeight+15:contentHeight+30, x:x+width//16] = 255
+    return image, poreAreas
+
+def writeImage( path, image, pixelSize ):
+    # TIFF with the FEI metadata tag, pixelSize in nm / px
+    height, width = image.shape
+    info = TiffImagePlugin.ImageFileDirectory_v2()
+    info[metadata.feiMetaDataTags[0]] = getMetaDataText( pixelSize, width, height - infoBarHeight )
+    info.tagtype[metadata.feiMetaDataTags[0]] = 2 # ASCII
+    Image.fromarray( image ).save( path, tiffinfo=info )
+
+def createImageSet( directory, imageCount = 8, width = 2048, height = None, pixelSize = 2.0, seed = 0 ):
+    # writes imageCount images and returns { filename: true pore areas in nm² }
+    height = height or width*2//3
+    os.makedirs( directory, exist_ok=True )
+    groundTruth = {}
+    for i in range( imageCount ):
+        filename = 'synthetic_' + str( i ).zfill( 3 ) + '.tif'
+        image, poreAreas = createImage( width, height, seed + i )
+        writeImage( directory + '/' + filename, image, pixelSize )
+        groundTruth[filename] = poreAreas * pixelSize * pixelSize
+    np.savez( directory + '/' + groundTruthFileName, **groundTruth )
+    return groundTruth
+
+def readGroundTruth( directory ):
+    with np.load( directory + '/' + groundTruthFileName ) as groundTruthFile:
+        return { filename: groundTruthFile[filename] for filename in groundTruthFile.files }
+
+if __name__ == '__main__':
+    usage = "python -m pore_analysis.synthetic <directory> [-n <imageCount>] [-w <imageWidth>] [-s <scale nm/px>]"
+    try:
+        opts, args = getopt.gnu_getopt( sys.argv[1:], "n:w:s:" )
+    except getopt.GetoptError:
+        print( usage )
+        sys.exit( 2 )
+    if ( len( args ) != 1 ):
+        print( usage )
+        sys.exit( 2 )
+    imageCount = 8
+    width = 2048
+    pixelSize = 2.0
+    for opt, arg in opts:
+        if opt == '-n': imageCount = int( arg )
+        elif opt == '-w': width = int( arg )
+        elif opt == '-s': pixelSize = float( arg )
+    groundTruth = createImageSet( args[0], imageCount, width, pixelSize=pixelSize )
+    print( "wrote " + str( imageCount ) + " image(s) with " + str( sum( len( poreAreas ) for poreAreas in groundTruth.values() ) ) + " pores to " + args[0] )
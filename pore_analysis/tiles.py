@@ -0,0 +1,275 @@
+#########################################################
+# Tiled segmentation of large images
+#
+# Stitched SEM mosaics may not fit into the memory. The image is
+# read region by region from the TIFF file (memory-mapped or strip
+# by strip) and segmented in overlapping tiles, so the peak memory
+# is bounded by the tile size instead of the image size. Pores
+# crossing the tile seams are merged using a union-find, the
+# particle areas are identical to segmentation.segmentImage().
+#
+#########################################################
+
+import math
+import os
+import tempfile
+import numpy as np
+from scipy import ndimage
+
+from pore_analysis import metadata
+from pore_analysis import segmentation
+
+# estimated peak memory of the segmentation per pixel of a tile including its halo [byte]
+bytesPerPixel = 48
+minimumTileSize = 64
+
+# TIFF tags used to read the image data
+bitsPerSampleTag = 258
+compressionTag = 259
+photometricTag = 262
+samplesPerPixelTag = 277
+rowsPerStripTag = 278
+planarConfigurationTag = 284
+sampleFormatTag = 339
+
+class TiffRegionReader:
+    # reads rectangular regions of an uncompressed strip TIFF without loading the whole image
+    def __init__( self, path ):
+        self.path = path
+        self.image = None
+        self.memoryMap = None
+        self.file = open( path, 'rb' )
+        tags, byteOrder = metadata.readTiffTags( self.file )
+        if ( not self.isSupported( tags, byteOrder ) ):
+            print( " " + os.path.basename( path ) + " is no uncompressed strip TIFF, loading the whole image" )
+            self.file.close()
+            self.image = segmentation.loadImage( path )
+            self.height, self.width = self.image.shape[:2]
+            return
+        self.width = metadata.getTagNumber( tags, byteOrder, metadata.imageWidthTag )
+        self.height = metadata.getTagNumber( tags, byteOrder, metadata.imageLengthTag )
+        samples = metadata.getTagNumber( tags, byteOrder, samplesPerPixelTag ) if samplesPerPixelTag in tags else 1
+        bits = metadata.getTagValues( self.file, tags, byteOrder, bitsPerSampleTag )[0] if bitsPerSampleTag in tags else 1
+        self.dtype = np.dtype( np.uint8 if bits == 8 else np.uint16 ).newbyteorder( byteOrder )
+        self.pixelShape = ( samples, ) if samples > 1 else ()
+        self.rowBytes = self.width * samples * self.dtype.itemsize
+        self.rowsPerStrip = min( self.height, metadata.getTagNumber( tags, byteOrder, rowsPerStripTag ) ) if rowsPerStripTag in tags else self.height
+        self.stripOffsets = metadata.getTagValues( self.file, tags, byteOrder, metadata.stripOffsetsTag )
+        stripByteCounts = metadata.getTagValues( self.file, tags, byteOrder, metadata.stripByteCountsTag )
+        contiguous = all( self.stripOffsets[i] + stripByteCounts[i] == self.stripOffsets[i+1] for i in range( len( self.stripOffsets )-1 ) )
+        if ( contiguous ):
+            self.memoryMap = np.memmap( self.file, dtype=self.dtype, mode='r', offset=self.stripOffsets[0], shape=( self.height, self.width ) + self.pixelShape )
+
+    def isSupported( self, tags, byteOrder ):
+        if ( tags is None or metadata.stripOffsetsTag not in tags or bitsPerSampleTag not in tags ):
+            return False
+        def getNumber( tag, default ):
+            return metadata.getTagNumber( tags, byteOrder, tag ) if tag in tags else default
+        bits = set( metadata.getTagValues( self.file, tags, byteOrder, bitsPerSampleTag ) )
+        return ( getNumber( compressionTag, 1 ) == 1 and getNumber( planarConfigurationTag, 1 ) == 1
+            and getNumber( photometricTag, 1 ) in ( 1, 2 ) and getNumber( sampleFormatTag, 1 ) == 1
+            and len( bits ) == 1 and bits.pop() in ( 8, 16 ) )
+
+    def read( self, top, bottom, left, right ):
+        if ( self.image is not None ):
+            return self.image[top:bottom, left:right]
+        if ( self.memoryMap is not None ):
+            return np.array( self.memoryMap[top:bottom, left:right] )
+        # strips are not stored one after another, read the region row by row
+        pixelBytes = self.rowBytes // self.width
+        region = np.empty( ( bottom-top, right-left ) + self.pixelShape, dtype=self.dtype )
+        for y in range( top, bottom ):
+            strip, row = divmod( y, self.rowsPerStrip )
+            self.file.seek( self.stripOffsets[strip] + row * self.rowBytes + left * pixelBytes )
+            region[y-top] = np.frombuffer( self.file.read( ( right-left ) * pixelBytes ), dtype=self.dtype ).reshape( ( right-left, ) + self.pixelShape )
+        return region
+
+    def close( self ):
+        self.memoryMap = None
+        self.image = None
+        if ( not self.file.closed ):
+            self.file.close()
+
+class UnionFind:
+    # labels of pores crossing a seam are joined, labels are indices of the parent array
+    def __init__( self, size ):
+        self.parent = np.arange( size, dtype=np.int64 )
+
+    def find( self, label ):
+        parent = self.parent
+        while ( parent[label] != label ):
+            parent[label] = parent[parent[label]]
+            label = parent[label]
+        return label
+
+    def union( self, first, second ):
+        first = self.find( first )
+        second = self.find( second )
+        if ( first != second ):
+            self.parent[max( first, second )] = min( first, second )
+
+    def getRoots( self ):
+        roots = self.parent
+        while True:
+            nextRoots = roots[roots]
+            if ( np.array_equal( nextRoots, roots ) ):
+                return roots
+            roots = nextRoots
+
+def roundUp( value, multiple ):
+    return -( -value // multiple ) * multiple
+
+def getImageHalo( backgroundShrink = 1, radii = None ):
+    # pixels around a tile needed for an exact result of the background subtraction and the blur
+    # a shrunk background needs tiles starting at a multiple of the shrink factor
+    # radii: see segmentation.getPipelineRadii(), default: pore_analysis_single_file.ijm
+    firstRadius, sigma, secondRadius = radii or ( segmentation.backgroundRadius, segmentation.blurSigma, segmentation.artifactRadius )
+    shrinkFactor = segmentation.getShrinkFactor( firstRadius, backgroundShrink )
+    halo = segmentation.getGaussianReach( sigma ) + segmentation.getBackgroundReach( firstRadius, backgroundShrink )
+    return roundUp( halo, shrinkFactor )
+
+def getProcessedHalo( backgroundShrink = 1, radii = None ):
+    # pixels around a tile of the blurred image needed for the second background subtraction and erode/dilate
+    firstRadius, sigma, secondRadius = radii or ( segmentation.backgroundRadius, segmentation.blurSigma, segmentation.artifactRadius )
+    shrinkFactor = segmentation.getShrinkFactor( secondRadius, backgroundShrink )
+    return roundUp( segmentation.getBackgroundReach( secondRadius, backgroundShrink ) + 2, shrinkFactor )
+
+def getTileSize( memoryLimit, backgroundShrink = 1, radii = None ):
+    # largest tile [px] whose processing (including the halo) fits into memoryLimit [MB]
+    firstRadius, sigma, secondRadius = radii or ( segmentation.backgroundRadius, segmentation.blurSigma, segmentation.artifactRadius )
+    tileSize = int( math.sqrt( memoryLimit * 1024 * 1024 / bytesPerPixel ) ) - 2 * getImageHalo( backgroundShrink, radii )
+    tileSize -= tileSize % math.lcm( segmentation.getShrinkFactor( firstRadius, backgroundShrink ), segmentation.getShrinkFactor( secondRadius, backgroundShrink ) )
+    if ( tileSize < minimumTileSize ):
+        raise ValueError( "a memory limit of " + str( memoryLimit ) + " MB is too small for the tiled segmentation" )
+    return tileSize
+
+def getMinimumMemoryLimit( backgroundShrink = 1, radii = None ):
+    # smallest memory limit [MB] of the tiled segmentation
+    memoryLimit = max( 1, ( minimumTileSize + 2 * getImageHalo( backgroundShrink, radii ) )**2 * bytesPerPixel // ( 1024 * 1024 ) )
+    while True:
+        try:
+            getTileSize( memoryLimit, backgroundShrink, radii )
+            return memoryLimit
+        except ValueError:
+            memoryLimit += 1
+
+def isTooLarge( width, height, memoryLimit ):
+    # True if the segmentation of the whole image would exceed memoryLimit [MB] (0: no limit)
+    return ( memoryLimit > 0 and width * height * bytesPerPixel > memoryLimit * 1024 * 1024 )
+
+def getTiles( length, tileSize ):
+    return [ ( start, min( start+tileSize, length ) ) for start in range( 0, length, tileSize ) ]
+
+def getRegionWithHalo( top, bottom, left, right, halo, height, width ):
+    # the region extended by the halo, clipped at the image border
+    return max( 0, top-halo ), min( height, bottom+halo ), max( 0, left-halo ), min( width, right+halo )
+
+def getValueRange( reader, top, bottom, left, right, rowCount ):
+    # minimum and maximum of the (cropped) image, needed to convert 16-bit images like run("8-bit")
+    minValue = None
+    maxValue = None
+    for y in range( top, bottom, rowCount ):
+        rows = reader.read( y, min( y+rowCount, bottom ), left, right )
+        minValue = rows.min() if minValue is None else min( minValue, rows.min() )
+        maxValue = rows.max() if maxValue is None else max( maxValue, rows.max() )
+    return float( minValue ), float( maxValue )
+
+def getSeamPairs( first, second ):
+    # 8-connected label pairs of two neighbouring pixel lines
+    pairs = []
+    for a, b in ( ( first, second ), ( first[:-1], second[1:] ), ( first[1:], second[:-1] ) ):
+        touching = ( a > 0 ) & ( b > 0 )
+        pairs.append( np.stack( ( a[touching], b[touching] ), axis=1 ) )
+    return np.concatenate( pairs )
+
+def segmentImageTiled( path, thresholdLimit, infoBarHeight, scale = 0, doSpeckleCleaning = 1, doRemoveBorderPercent = 0, memoryLimit = 1024, scratchDirectory = None, backgroundShrink = 1, pipeline = 'single' ):
+    # same as segmentation.segmentImage() without the mask, returns the particle areas and the size of the cropped image
+    reader = TiffRegionReader( path )
+    radii = segmentation.getPipelineRadii( reader.width, pipeline )
+    firstRadius, sigma, secondRadius = radii
+    tileSize = getTileSize( memoryLimit, backgroundShrink, radii )
+    removeBorderWidth, removeBorderHeight = segmentation.getBorderWidth( reader.width, reader.height, infoBarHeight, doRemoveBorderPercent )
+    originY = removeBorderHeight
+    height = reader.height - infoBarHeight - removeBorderHeight
+    width = reader.width - removeBorderWidth
+    rowTiles = getTiles( height, tileSize )
+    columnTiles = getTiles( width, tileSize )
+    valueRange = None
+    sample = reader.read( originY, originY+1, 0, 1 )
+    if ( sample.ndim == 2 and sample.dtype != np.uint8 ):
+        valueRange = getValueRange( reader, originY, originY+height, 0, width, max( 1, tileSize * tileSize // width ) )
+
+    # the blurred image is needed twice (contrast histogram, second background subtraction) and is kept on disk
+    scratchFile = tempfile.TemporaryFile( dir=scratchDirectory if scratchDirectory is not None else os.path.dirname( os.path.abspath( path ) ) )
+    try:
+        scratchFile.truncate( width * height )
+        blurred = np.memmap( scratchFile, dtype=np.uint8, mode='r+', shape=( height, width ) )
+        histogram = np.zeros( 256, dtype=np.int64 )
+        halo = getImageHalo( backgroundShrink, radii )
+        for top, bottom in rowTiles:
+            for left, right in columnTiles:
+                haloTop, haloBottom, haloLeft, haloRight = getRegionWithHalo( top, bottom, left, right, halo, height, width )
+                image = segmentation.convertTo8Bit( reader.read( originY+haloTop, originY+haloBottom, haloLeft, haloRight ), valueRange )
+                image = segmentation.subtractBackground( image, firstRadius, True, backgroundShrink )
+                if ( sigma > 0 ):
+                    image = segmentation.gaussianBlur( image, sigma )
+                core = image[top-haloTop:bottom-haloTop, left-haloLeft:right-haloLeft]
+                blurred[top:bottom, left:right] = core
+                histogram += np.bincount( core.ravel(), minlength=256 )
+            blurred.flush()
+        reader.close()
+        hmin, hmax = segmentation.getHistogramLimits( histogram, segmentation.contrastSaturation )
+        lut = segmentation.getContrastLut( hmin, hmax ) if hmax > hmin else np.arange( 256, dtype=np.uint8 )
+
+        # label the pores of every tile, the labels are numbered consecutively over all tiles
+        halo = getProcessedHalo( backgroundShrink, radii )
+        pixelCounts = [ np.zeros( 1, dtype=np.int64 ) ] # label 0: background
+        firstPixels = [ np.zeros( 1, dtype=np.int64 ) ]
+        labelCount = 1
+        bottomRows = []
+        topRows = []
+        verticalPairs = []
+        for top, bottom in rowTiles:
+            topRow = np.zeros( width, dtype=np.int64 )
+            bottomRow = np.zeros( width, dtype=np.int64 )
+            rightColumn = None
+            for left, right in columnTiles:
+                haloTop, haloBottom, haloLeft, haloRight = getRegionWithHalo( top, bottom, left, right, halo, height, width )
+                processed = segmentation.subtractBackground( lut[blurred[haloTop:haloBottom, haloLeft:haloRight]], secondRadius, True, backgroundShrink )
+                mask = segmentation.createPoreMask( processed, thresholdLimit, doSpeckleCleaning )
+                mask = mask[top-haloTop:bottom-haloTop, left-haloLeft:right-haloLeft]
+                labels, particleCount = ndimage.label( mask, structure=segmentation.particleStructure )
+                pixelCounts.append( np.bincount( labels.ravel(), minlength=particleCount+1 )[1:] )
+                # labels are numbered in the order of their first pixel
+                flatLabels = labels.ravel()
+                firstPositions = np.flatnonzero( np.diff( np.maximum.accumulate( flatLabels ), prepend=0 ) > 0 )
+                firstPixels.append( ( top + firstPositions // ( right-left ) ) * width + left + firstPositions % ( right-left ) )
+                labels = np.where( labels > 0, labels + ( labelCount-1 ), 0 )
+                labelCount += particleCount
+                topRow[left:right] = labels[0]
+                bottomRow[left:right] = labels[-1]
+                if ( rightColumn is not None ):
+                    verticalPairs.append( getSeamPairs( rightColumn, labels[:, 0] ) )
+                rightColumn = labels[:, -1]
+            topRows.append( topRow )
+            bottomRows.append( bottomRow )
+        del blurred
+    finally:
+        scratchFile.close()
+
+    # merge the pores crossing the seams
+    unionFind = UnionFind( labelCount )
+    seamPairs = verticalPairs + [ getSeamPairs( bottomRows[i], topRows[i+1] ) for i in range( len( rowTiles )-1 ) ]
+    if ( seamPairs ):
+        for first, second in np.unique( np.concatenate( seamPairs ), axis=0 ):
+            unionFind.union( first, second )
+    roots, particles = np.unique( unionFind.getRoots()[1:], return_inverse=True )
+    pixelCounts = np.bincount( particles, weights=np.concatenate( pixelCounts )[1:], minlength=len( roots ) ).astype( np.int64 )
+    firstPixels = np.concatenate( firstPixels )[1:]
+    particleFirstPixels = np.full( len( roots ), width * height, dtype=np.int64 )
+    np.minimum.at( particleFirstPixels, particles, firstPixels )
+    # same order as the labels of the whole image
+    areas = pixelCounts[np.argsort( particleFirstPixels, kind='stable' )].astype( np.float64 )
+    if ( scale > 0 ):
+        areas *= scale * scale
+    return areas, ( width, height )
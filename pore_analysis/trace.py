@@ -0,0 +1,330 @@
+#########################################################
+# Run time trace
+#
+# Every stage of a run (metadata scan, ImageJ, segmentation,
+# result tables, gnuplot, ...) can be wrapped in stage(). While a
+# trace is active, wall time, CPU time, bytes read, peak memory and
+# stage specific values like particle counts are appended as one
+# JSON line per stage to the trace file, also by worker processes.
+# Without an active trace stage() does nothing.
+#
+# Stages listed in profileStages are additionally sampled every
+# profileInterval seconds by a thread reading the Python stack of
+# the stage, the stacks are stored in the trace as well.
+#
+# usage: python -m pore_analysis.trace <traceFile>
+#        prints the summary of an existing trace
+#
+#########################################################
+
+import json
+import os
+import sys
+import threading
+import time
+
+profileInterval = 0.005 # s
+maximumStackDepth = 64
+
+activeTrace = None
+activeTraceLock = threading.Lock() # start(), stop() and attach() may be called from several threads
+
+def getPeakMemory():
+    # peak memory (resident set / working set) of this process in bytes or None if unknown
+    try:
+        import resource
+        peak = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import ctypes
+        from ctypes import wintypes
+        class ProcessMemoryCounters( ctypes.Structure ):
+            _fields_ = [ ( 'cb', wintypes.DWORD ), ( 'PageFaultCount', wintypes.DWORD ), ( 'PeakWorkingSetSize', ctypes.c_size_t ),
+                ( 'WorkingSetSize', ctypes.c_size_t ), ( 'QuotaPeakPagedPoolUsage', ctypes.c_size_t ), ( 'QuotaPagedPoolUsage', ctypes.c_size_t ),
+                ( 'QuotaPeakNonPagedPoolUsage', ctypes.c_size_t ), ( 'QuotaNonPagedPoolUsage', ctypes.c_size_t ),
+                ( 'PagefileUsage', ctypes.c_size_t ), ( 'PeakPagefileUsage', ctypes.c_size_t ) ]
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof( counters )
+        if ( ctypes.windll.psapi.GetProcessMemoryInfo( ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref( counters ), counters.cb ) ):
+            return counters.PeakWorkingSetSize
+    except ( ImportError, AttributeError, OSError ):
+        pass
+    return None
+
+def getBytesRead():
+    # bytes read by this process so far or None if unknown
+    try:
+        with open( '/proc/self/io', 'rb' ) as ioFile:
+            for line in ioFile:
+                if ( line.startswith( b'rchar:' ) ):
+                    return int( line.split()[1] )
+    except OSError:
+        pass
+    try:
+        import ctypes
+        class IoCounters( ctypes.Structure ):
+            _fields_ = [ ( name, ctypes.c_ulonglong ) for name in ( 'ReadOperationCount', 'WriteOperationCount', 'OtherOperationCount', 'ReadTransferCount', 'WriteTransferCount', 'OtherTransferCount' ) ]
+        counters = IoCounters()
+        if ( ctypes.windll.kernel32.GetProcessIoCounters( ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref( counters ) ) ):
+            return counters.ReadTransferCount
+    except ( ImportError, AttributeError, OSError ):
+        pass
+    return None
+
+def getStackKey( frame ):
+    # collapsed stack from the outermost to the innermost function, e.g. "start_pore_analysis.py:<module>;parallel.py:analyseTasks;..."
+    names = []
+    while ( frame is not None and len( names ) < maximumStackDepth ):
+        names.append( os.path.basename( frame.f_code.co_filename ) + ':' + frame.f_code.co_name )
+        frame = frame.f_back
+    return ';'.join( reversed( names ) )
+
+class Sampler:
+    # samples the stacks of the threads currently running a profiled stage
+    def __init__( self, interval ):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.stacks = {} # threadId: { stackKey: samples }
+        self.thread = threading.Thread( target=self.run, daemon=True )
+        self.thread.start()
+
+    def run( self ):
+        ownId = threading.get_ident()
+        while True:
+            time.sleep( self.interval )
+            with self.lock:
+                if ( len( self.stacks ) == 0 ):
+                    continue
+                frames = sys._current_frames()
+                for threadId, stacks in self.stacks.items():
+                    frame = frames.get( threadId )
+                    if ( frame is not None and threadId != ownId ):
+                        stackKey = getStackKey( frame )
+                        stacks[stackKey] = stacks.get( stackKey, 0 ) + 1
+
+    def begin( self, threadId ):
+        # returns False if the thread is already profiled by an outer stage
+        with self.lock:
+            if ( threadId in self.stacks ):
+                return False
+            self.stacks[threadId] = {}
+            return True
+
+    def end( self, threadId ):
+        with self.lock:
+            return self.stacks.pop( threadId, {} )
+
+class Trace:
+    def __init__( self, path, profileStages = (), append = False ):
+        self.path = path
+        self.profileStages = set( profileStages )
+        self.pid = os.getpid()
+        self.sampler = None
+        self.lock = threading.Lock()
+        # every event is written by a single append, so several processes can share the file
+        self.file = os.open( path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | ( 0 if append else os.O_TRUNC ) | getattr( os, 'O_BINARY', 0 ) )
+
+    def write( self, event ):
+        event['pid'] = self.pid
+        line = ( json.dumps( event ) + '\n' ).encode( 'utf-8' )
+        with self.lock:
+            # stages still running when the trace was stopped are dropped
+            if ( self.file is not None ):
+                os.write( self.file, line )
+
+    def isProfiled( self, name ):
+        return ( name in self.profileStages or 'all' in self.profileStages )
+
+    def getSampler( self ):
+        with self.lock:
+            if ( self.sampler is None ):
+                self.sampler = Sampler( profileInterval )
+            return self.sampler
+
+    def close( self ):
+        with self.lock:
+            if ( self.file is not None ):
+                os.close( self.file )
+                self.file = None
+
+class Stage:
+    # context manager measuring one stage, values assigned like stage['particles'] = 10 are added to the event
+    def __init__( self, trace, name, fields ):
+        self.trace = trace
+        self.event = { 'event': 'stage', 'stage': name }
+        self.event.update( fields )
+        self.sampler = None
+
+    def __setitem__( self, key, value ):
+        self.event[key] = value
+
+    def __enter__( self ):
+        if ( self.trace.isProfiled( self.event['stage'] ) ):
+            sampler = self.trace.getSampler()
+            if ( sampler.begin( threading.get_ident() ) ):
+                self.sampler = sampler
+        self.bytesRead = getBytesRead()
+        self.startTime = time.time()
+        self.startCounter = time.perf_counter()
+        self.startCpu = time.process_time()
+        return self
+
+    def __exit__( self, exceptionType, exception, traceback ):
+        self.event['start'] = self.startTime
+        self.event['duration'] = time.perf_counter() - self.startCounter
+        self.event['cpu'] = time.process_time() - self.startCpu
+        bytesRead = getBytesRead()
+        if ( bytesRead is not None and self.bytesRead is not None ):
+            self.event['bytesRead'] = bytesRead - self.bytesRead
+        self.event['peakMemory'] = getPeakMemory()
+        if ( exceptionType is not None ):
+            self.event['error'] = exceptionType.__name__
+        if ( self.sampler is not None ):
+            stacks = self.sampler.end( threading.get_ident() )
+            self.trace.write( { 'event': 'profile', 'stage': self.event['stage'], 'image': self.event.get( 'image' ), 'stacks': stacks } )
+        self.trace.write( self.event )
+        return False
+
+class NoStage:
+    # used while no trace is active
+    def __setitem__( self, key, value ):
+        pass
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, exceptionType, exception, traceback ):
+        return False
+
+noStage = NoStage()
+
+def start( path, profileStages = (), append = False ):
+    # starts a trace in this process, a new trace file is created unless append is set
+    with activeTraceLock:
+        return startTrace( path, profileStages, append )
+
+def startTrace( path, profileStages, append ):
+    global activeTrace
+    stopTrace()
+    activeTrace = Trace( path, profileStages, append )
+    return activeTrace
+
+def stop():
+    with activeTraceLock:
+        stopTrace()
+
+def stopTrace():
+    global activeTrace
+    if ( activeTrace is not None ):
+        activeTrace.close()
+        activeTrace = None
+
+def getSettings():
+    # passed to worker processes with the task, None if no trace is active
+    currentTrace = activeTrace # read once, another thread may stop it
+    if ( currentTrace is None ):
+        return None
+    return ( currentTrace.path, sorted( currentTrace.profileStages ) )
+
+def attach( settings ):
+    # continues the trace of the main process in a worker process
+    with activeTraceLock:
+        if ( settings is None or ( activeTrace is not None and activeTrace.pid == os.getpid() ) ):
+            return
+        startTrace( settings[0], settings[1], True )
+
+def stage( name, **fields ):
+    currentTrace = activeTrace
+    if ( currentTrace is None ):
+        return noStage
+    return Stage( currentTrace, name, fields )
+
+def readEvents( path ):
+    events = []
+    with open( path, 'r', encoding='utf-8' ) as traceFile:
+        for line in traceFile:
+            try:
+                events.append( json.loads( line ) )
+            except ValueError:
+                pass # incomplete line of an aborted run
+    return events
+
+def formatBytes( value ):
+    if ( value is None ):
+        return '-'
+    for unit in ( 'B', 'kB', 'MB', 'GB' ):
+        if ( value < 1024 or unit == 'GB' ):
+            return str( round( value, 1 ) ) + ' ' + unit
+        value /= 1024
+
+def getSummary( events ):
+    # { stage: count, duration sum / max, cpu sum, bytes read sum, peak memory, particle sum } in order of the first occurrence
+    summary = {}
+    for event in events:
+        if ( event.get( 'event' ) != 'stage' ):
+            continue
+        entry = summary.setdefault( event['stage'], { 'count': 0, 'duration': 0.0, 'maximum': 0.0, 'cpu': 0.0, 'bytesRead': None, 'peakMemory': None, 'particles': None, 'errors': 0 } )
+        entry['count'] += 1
+        entry['duration'] += event['duration']
+        entry['maximum'] = max( entry['maximum'], event['duration'] )
+        entry['cpu'] += event['cpu']
+        if ( event.get( 'bytesRead' ) is not None ):
+            entry['bytesRead'] = ( entry['bytesRead'] or 0 ) + event['bytesRead']
+        if ( event.get( 'peakMemory' ) is not None ):
+            entry['peakMemory'] = max( entry['peakMemory'] or 0, event['peakMemory'] )
+        if ( event.get( 'particles' ) is not None ):
+            entry['particles'] = ( entry['particles'] or 0 ) + event['particles']
+        if ( 'error' in event ):
+            entry['errors'] += 1
+    return summary
+
+def getProfile( events ):
+    # { stage: { stackKey: samples } } of all processes
+    profile = {}
+    for event in events:
+        if ( event.get( 'event' ) == 'profile' ):
+            stacks = profile.setdefault( event['stage'], {} )
+            for stackKey, samples in event['stacks'].items():
+                stacks[stackKey] = stacks.get( stackKey, 0 ) + samples
+    return profile
+
+def writeFoldedStacks( profile, path ):
+    # one line "stage;stack samples" per stack, the input format of flame graph tools
+    with open( path, 'w' ) as foldedFile:
+        for name, stacks in profile.items():
+            for stackKey, samples in sorted( stacks.items() ):
+                foldedFile.write( name + ';' + stackKey + ' ' + str( samples ) + '\n' )
+
+def printSummary( path, topFunctions = 10 ):
+    events = readEvents( path )
+    summary = getSummary( events )
+    print( "------" )
+    print( "trace summary (" + path + ")" )
+    print( '{:<22} {:>6} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}'.format( 'stage', 'count', 'total [s]', 'mean [ms]', 'max [ms]', 'cpu [s]', 'read', 'peak mem' ) )
+    for name, entry in summary.items():
+        print( '{:<22} {:>6} {:>10.3f} {:>10.1f} {:>10.1f} {:>10.3f} {:>10} {:>10}'.format( name[:22], entry['count'], entry['duration'], entry['duration']/entry['count']*1000, entry['maximum']*1000, entry['cpu'], formatBytes( entry['bytesRead'] ), formatBytes( entry['peakMemory'] ) ) + ( '  ' + str( entry['particles'] ) + ' particles' if entry['particles'] is not None else '' ) + ( '  ' + str( entry['errors'] ) + ' failed' if entry['errors'] > 0 else '' ) )
+    profile = getProfile( events )
+    if ( len( profile ) > 0 ):
+        foldedPath = os.path.splitext( path )[0] + '.folded'
+        writeFoldedStacks( profile, foldedPath )
+        for name, stacks in profile.items():
+            sampleCount = sum( stacks.values() )
+            if ( sampleCount == 0 ):
+                continue # shorter than the sampling interval
+            functions = {}
+            for stackKey, samples in stacks.items():
+                function = stackKey.rsplit( ';', 1 )[-1]
+                functions[function] = functions.get( function, 0 ) + samples
+            print( "profile of " + name + " (" + str( sampleCount ) + " samples, innermost functions):" )
+            for function, samples in sorted( functions.items(), key=lambda item: -item[1] )[:topFunctions]:
+                print( '  {:>5.1f} %  {}'.format( samples/sampleCount*100, function ) )
+        print( "stacks written to " + foldedPath )
+    return summary
+
+if __name__ == '__main__':
+    if ( len( sys.argv ) != 2 ):
+        print( "usage: python -m pore_analysis.trace <traceFile>" )
+        sys.exit( 2 )
+    printSummary( sys.argv[1] )
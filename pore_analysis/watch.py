@@ -0,0 +1,94 @@
+#########################################################
+# Watch folder
+#
+# Polls a folder while the microscope writes new images into it.
+# An image is reported as soon as its size and modification time
+# stopped changing for settleTime seconds and its TIFF directory
+# and strips are completely within the file. Polling works on
+# every file system, including network shares of the microscope
+# PC which do not send change notifications.
+#
+# usage: python -m pore_analysis.watch <sourceDirectory> <targetDirectory> [-i <interval>] [-c <chunks>]
+#        writes the images of sourceDirectory one after the other in
+#        chunks into targetDirectory, like the microscope does, to
+#        test the watch mode (start_pore_analysis.py --watch)
+#
+#########################################################
+
+import os
+import sys, getopt
+import time
+
+from pore_analysis import metadata
+
+imageExtensions = ( '.jpg', '.JPG', '.tif', '.TIF' )
+
+class FolderWatcher:
+    def __init__( self, directory, settleTime = 2.0 ):
+        self.directory = directory
+        self.settleTime = settleTime
+        self.files = {} # filename: ( ( size, mtime ), time the change was noticed )
+        self.readyFiles = set()
+
+    def poll( self ):
+        # returns the images which became ready since the last poll (in directory order) and whether images were removed
+        now = time.monotonic()
+        presentFiles = set()
+        newFiles = []
+        for file in os.listdir( self.directory ):
+            filename = os.fsdecode( file )
+            if ( not filename.endswith( imageExtensions ) ):
+                continue
+            try:
+                stat = os.stat( self.directory + '/' + filename )
+            except OSError:
+                continue # removed in between
+            presentFiles.add( filename )
+            signature = ( stat.st_size, stat.st_mtime_ns )
+            known = self.files.get( filename )
+            if ( known is None or known[0] != signature ):
+                # new or rewritten image
+                self.files[filename] = ( signature, now )
+                self.readyFiles.discard( filename )
+            elif ( filename not in self.readyFiles and now - known[1] >= self.settleTime and metadata.isImageComplete( self.directory + '/' + filename ) ):
+                self.readyFiles.add( filename )
+                newFiles.append( filename )
+        removedFiles = set( self.files ) - presentFiles
+        for filename in removedFiles:
+            del self.files[filename]
+            self.readyFiles.discard( filename )
+        return newFiles, len( removedFiles ) > 0
+
+def simulateAcquisition( sourceDirectory, targetDirectory, interval = 5.0, chunkCount = 4 ):
+    # copies every image in chunkCount parts, waiting interval seconds between the images
+    os.makedirs( targetDirectory, exist_ok=True )
+    filenames = sorted( filename for filename in os.listdir( sourceDirectory ) if filename.endswith( imageExtensions ) )
+    for filename in filenames:
+        with open( sourceDirectory + '/' + filename, 'rb' ) as sourceFile:
+            content = sourceFile.read()
+        chunkSize = -( -len( content ) // chunkCount )
+        print( "writing " + filename + "..." )
+        with open( targetDirectory + '/' + filename, 'wb' ) as targetFile:
+            for i in range( 0, len( content ), chunkSize ):
+                targetFile.write( content[i:i+chunkSize] )
+                targetFile.flush()
+                time.sleep( interval/chunkCount/2 )
+        time.sleep( interval/2 )
+    print( "wrote " + str( len( filenames ) ) + " image(s)" )
+
+if __name__ == '__main__':
+    usage = "python -m pore_analysis.watch <sourceDirectory> <targetDirectory> [-i <interval>] [-c <chunks>]"
+    try:
+        opts, args = getopt.gnu_getopt( sys.argv[1:], "i:c:" )
+    except getopt.GetoptError:
+        print( usage )
+        sys.exit( 2 )
+    if ( len( args ) != 2 ):
+        print( usage )
+        sys.exit( 2 )
+    interval = 5.0
+    chunkCount = 4
+    for opt, arg in opts:
+        if opt == '-i': interval = float( arg )
+        elif opt == '-c': chunkCount = max( 1, int( arg ) )
+    simulateAcquisition( args[0], args[1], interval, chunkCount )
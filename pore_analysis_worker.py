@@ -0,0 +1,46 @@
+#@ String macroPath
+# Fiji (Jython) worker for ImageJ 1.52d
+# keeps one headless Fiji running and analyses one image after the other using pore_analysis_single_file.ijm
+# started by start_pore_analysis.py -w as follows
+# ImageJ-win64.exe --headless --console --run "C:\path\to\pore_analysis_worker.py" "macroPath='C:\path\to\pore_analysis_single_file.ijm'"
+#
+# every line on stdin is one job: <jobId><TAB><macro argument>
+# every job is answered on stdout by: PORE_ANALYSIS_JOB<TAB><jobId><TAB>OK|ERROR<TAB><message>
+# the worker exits when stdin is closed
+
+from java.io import BufferedReader, InputStreamReader
+from java.lang import System, Throwable
+from ij import IJ
+from ij.macro import Interpreter
+
+jobMarker = "PORE_ANALYSIS_JOB"
+
+def reply( jobId, status, message ):
+    System.out.println( jobMarker + "\t" + jobId + "\t" + status + "\t" + message.replace( "\n", " " ).replace( "\t", " " ) )
+    System.out.flush()
+
+def closeAll():
+    # images and tables left open by a failed job must not disturb the next one
+    IJ.run( "Close All" )
+    IJ.run( "Clear Results" )
+
+# no image windows, like setBatchMode(true)
+Interpreter.batchMode = True
+reader = BufferedReader( InputStreamReader( System.in ) )
+line = reader.readLine()
+while ( line is not None ):
+    if ( line.strip() != "" ):
+        jobId, argument = line.split( "\t", 1 )
+        try:
+            # the last argument (keepAlive) prevents the macro from quitting Fiji
+            result = IJ.runMacroFile( macroPath, argument + "|1" )
+            if ( result == "[aborted]" ):
+                reply( jobId, "ERROR", "macro aborted" )
+            else:
+                reply( jobId, "OK", "" )
+        except Throwable, e:
+            reply( jobId, "ERROR", str( e ) )
+        except Exception, e:
+            reply( jobId, "ERROR", str( e ) )
+        closeAll()
+    line = reader.readLine()
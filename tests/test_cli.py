@@ -0,0 +1,18 @@
+#########################################################
+# Command line options
+#
+# run from the repository folder: python -m pytest -q
+#
+#########################################################
+
+import pytest
+
+from pore_analysis import cli
+
+@pytest.mark.parametrize( 'longOptions, shortOptions', [ ( [ '--numpyEngine', '--noImageJ', '--noGnuPlot', '--printSumPlot', '--calcPoreDia' ], [ '-n', '-i', '-g', '-s', '-p' ] ), ( [ '--setOutputType', '1' ], [ '-o', '1' ] ) ] )
+def testLongOptionsEqualShortOptions( longOptions, shortOptions ):
+    longConfig, tracePath, profileStages, directories = cli.processArguments( [ 'pore_analysis' ] + longOptions + [ 'folder' ] )
+    shortConfig = cli.processArguments( [ 'pore_analysis' ] + shortOptions + [ 'folder' ] )[0]
+    assert longConfig == shortConfig
+    assert len( longConfig ) > 0
+    assert directories == [ 'folder' ]
@@ -0,0 +1,30 @@
+#########################################################
+# Metadata cache of the image directories
+#
+# run from the repository folder: python -m pytest -q
+#
+#########################################################
+
+import os
+
+from PIL import Image
+
+from pore_analysis import metadata, synthetic
+
+def writeImage( directory ):
+    image, poreAreas = synthetic.createImage( 200, 150 + synthetic.infoBarHeight )
+    Image.fromarray( image ).save( str( directory / 'image.tif' ) )
+
+def testCacheIsStoredInThePoresFolder( tmp_path ):
+    writeImage( tmp_path )
+    cache = metadata.MetaDataCache( str( tmp_path ) )
+    header = cache.getHeader( 'image.tif' )
+    assert ( header['width'], header['height'] ) == ( 200, 150 + synthetic.infoBarHeight )
+    cache.save()
+    # the image directory is not written before pores/ exists
+    assert sorted( os.listdir( tmp_path ) ) == [ 'image.tif' ]
+    ( tmp_path / 'pores' ).mkdir()
+    cache.save()
+    assert sorted( os.listdir( tmp_path ) ) == [ 'image.tif', 'pores' ]
+    assert os.listdir( tmp_path / 'pores' ) == [ metadata.cacheFileName ]
+    assert metadata.MetaDataCache( str( tmp_path ) ).entries.keys() == { 'image.tif' }
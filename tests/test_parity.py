@@ -0,0 +1,30 @@
+#########################################################
+# Parity of the in-process engine with stored reference results
+#
+# tests/parity/<pipeline>/ holds a synthetic image and its particle
+# areas in pores/*_pores_sqpx.csv, in the format of the ImageJ
+# macros (single: pore_analysis_single_file.ijm, folder:
+# pore_analysis.ijm), so results of the macros can replace them
+#
+# run from the repository folder: python -m pytest -q
+#
+#########################################################
+
+import os
+
+import pytest
+
+from pore_analysis import parity, synthetic
+
+referenceDirectory = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), 'parity' )
+allowedDeviation = 0.01 # Area-% per size range
+
+@pytest.mark.parametrize( 'pipeline', [ 'single', 'folder' ] )
+def testParityWithTheReference( pipeline ):
+    maxDeviation = parity.comparePoreAnalysis( os.path.join( referenceDirectory, pipeline ), 140, synthetic.infoBarHeight, pipeline=pipeline )
+    assert maxDeviation <= allowedDeviation
+
+def testParityDetectsADeviation():
+    # another threshold changes the pore areas by more than the allowed deviation
+    assert parity.comparePoreAnalysis( os.path.join( referenceDirectory, 'single' ), 100, synthetic.infoBarHeight ) > allowedDeviation
+
@@ -0,0 +1,96 @@
+#########################################################
+# Particle store round-trip and re-binning
+#
+# run from the repository folder: python -m pytest -q
+#
+#########################################################
+
+import numpy as np
+import pytest
+
+from pore_analysis import benchmark, defaultPoreSizeRangeArray, particles, results
+
+def createMeasurement( filename, seed, particleCount ):
+    rng = np.random.default_rng( seed )
+    areas = np.round( rng.lognormal( 4, 1.5, particleCount ) )
+    return {
+        'filename': filename,
+        'engine': 'numpy',
+        'imageSize': ( 640, 480 ),
+        'sources': { filename: [ seed, seed ] },
+        'areas': areas,
+        'lines': None,
+        'morphology': None,
+        'granulometry': np.array( [ [ 1, 40 ], [ 2, 25 ], [ 5, 12 ], [ 50 + seed, 7 ] ], dtype=np.int64 )
+    }
+
+def createTask( filename, pixelSize, poreSizeRangeArray, binningVariable = 'area' ):
+    return { 'filename': filename, 'pixelSize': pixelSize, 'poreSizeRangeArray': poreSizeRangeArray, 'binningVariable': binningVariable, 'outputType': 0, 'calculatePoreDiameter': False, 'showDebuggingOutput': False }
+
+@pytest.fixture
+def store( tmp_path ):
+    ( tmp_path / 'pores' ).mkdir()
+    particleStore = particles.ParticleStore( str( tmp_path ) )
+    particleStore.write( [ createMeasurement( 'a.tif', 1, 300 ), createMeasurement( 'b.tif', 2, 0 ), createMeasurement( 'c.tif', 3, 150 ) ] )
+    yield particleStore
+    particleStore.release()
+
+def testRoundTrip( store ):
+    reloaded = particles.ParticleStore( store.directory )
+    for filename, seed, particleCount in ( ( 'a.tif', 1, 300 ), ( 'b.tif', 2, 0 ), ( 'c.tif', 3, 150 ) ):
+        expected = createMeasurement( filename, seed, particleCount )
+        measurement = reloaded.getMeasurement( filename )
+        assert measurement['imageSize'] == expected['imageSize']
+        assert np.array_equal( measurement['areas'], expected['areas'] )
+        assert np.array_equal( measurement['granulometry'], expected['granulometry'] )
+        assert measurement['lines'] is None
+        assert reloaded.isValid( filename, 'numpy', expected['sources'] )
+        assert not reloaded.isValid( filename, 'imagej', expected['sources'] )
+    reloaded.release()
+
+def testUpdateKeepsStoredImages( store ):
+    store.update( [ 'c.tif', 'd.tif' ], { 'd.tif': createMeasurement( 'd.tif', 4, 20 ) } )
+    assert sorted( store.images ) == [ 'c.tif', 'd.tif' ]
+    assert np.array_equal( store.getMeasurement( 'c.tif' )['areas'], createMeasurement( 'c.tif', 3, 150 )['areas'] )
+    assert np.array_equal( store.getMeasurement( 'd.tif' )['areas'], createMeasurement( 'd.tif', 4, 20 )['areas'] )
+
+@pytest.mark.parametrize( 'poreSizeRangeArray', [ defaultPoreSizeRangeArray, [ 0, 10, 100, 1000 ], [ 0, 50.5, 5000 ] ] )
+def testRebinningEqualsBinningOfEveryImage( store, poreSizeRangeArray ):
+    filenames = [ 'c.tif', 'a.tif', 'b.tif' ]
+    pixelSizes = [ 2.0, 1.5, 3.0 ]
+    imageResults = store.binImages( [ createTask( filename, pixelSize, poreSizeRangeArray ) for filename, pixelSize in zip( filenames, pixelSizes ) ] )
+    for filename, pixelSize, imageResult in zip( filenames, pixelSizes, imageResults ):
+        measurement = store.getMeasurement( filename )
+        expected = results.binPoreAreas( filename[:-4], pixelSize, np.asarray( measurement['areas'] ), measurement['imageSize'], poreSizeRangeArray )
+        assert imageResult.filename == expected.filename
+        assert imageResult.poreCountArray == expected.poreCountArray
+        assert np.allclose( imageResult.poreSizeArray, expected.poreSizeArray )
+        assert np.allclose( imageResult.poreSizePercentArray, expected.poreSizePercentArray )
+        assert imageResult.processedElements == expected.processedElements
+
+def testRebinningOfTheInscribedRadii( store ):
+    filenames = [ 'a.tif', 'c.tif' ]
+    imageResults = store.binImages( [ createTask( filename, 2.0, defaultPoreSizeRangeArray, 'inscribedRadius' ) for filename in filenames ] )
+    for filename, imageResult in zip( filenames, imageResults ):
+        measurement = store.getMeasurement( filename )
+        expected = results.binPoreSizeDistribution( filename[:-4], 2.0, np.asarray( measurement['granulometry'] ), measurement['imageSize'], defaultPoreSizeRangeArray )
+        assert imageResult.poreCountArray == expected.poreCountArray
+        assert np.allclose( imageResult.poreSizeArray, expected.poreSizeArray )
+        assert np.allclose( imageResult.poreSizePercentArray, expected.poreSizePercentArray )
+        assert imageResult.processedElements == expected.processedElements
+
+def testRebinningTasksWithoutBinningVariable( store ):
+    # tasks built before the binning variable existed bin the pore areas
+    legacyTasks = []
+    for filename in ( 'a.tif', 'c.tif' ):
+        task = createTask( filename, 2.0, defaultPoreSizeRangeArray )
+        del task['binningVariable']
+        legacyTasks.append( task )
+    expectedResults = store.binImages( [ createTask( filename, 2.0, defaultPoreSizeRangeArray ) for filename in ( 'a.tif', 'c.tif' ) ] )
+    for imageResult, expected in zip( store.binImages( legacyTasks ), expectedResults ):
+        assert imageResult.poreCountArray == expected.poreCountArray
+        assert imageResult.poreSizePercentArray == expected.poreSizePercentArray
+
+def testStoreBenchmark():
+    csvTime, storeTime, identical = benchmark.benchmarkStore( particleCount = 5000, imageCount = 5 )
+    assert identical
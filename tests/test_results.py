@@ -0,0 +1,88 @@
+#########################################################
+# Binning of the particle values into the size ranges and the
+# result tables
+#
+# run from the repository folder: python -m pytest -q
+#
+#########################################################
+
+import numpy as np
+import pytest
+
+from pore_analysis import benchmark, defaultPoreSizeRangeArray, results
+
+poreSizeRangeArray = [ 0, 10, 100, 1000 ]
+
+def testBucketIndicesOfValuesOnALimit():
+    # values matching a limit exactly are dropped, like the original comparison loop did
+    index, valid = results.getBucketIndices( np.array( [ 10.0, 100.0, 1000.0 ] ), poreSizeRangeArray )
+    assert not valid.any()
+
+def testBucketIndicesBelowTheFirstLimit():
+    index, valid = results.getBucketIndices( np.array( [ -5.0, 0.0 ] ), poreSizeRangeArray )
+    assert not valid.any()
+
+def testBucketIndicesAboveTheLastLimit():
+    # the last bucket additionally holds all values above the last limit
+    index, valid = results.getBucketIndices( np.array( [ 1000.5, 1e9 ] ), poreSizeRangeArray )
+    assert valid.all()
+    assert index.tolist() == [ 3, 3 ]
+
+def testBucketIndicesBetweenTheLimits():
+    index, valid = results.getBucketIndices( np.array( [ 0.5, 9.99, 10.01, 999.0, np.nan ] ), poreSizeRangeArray )
+    assert valid.tolist() == [ True, True, True, True, False ]
+    assert index[:4].tolist() == [ 1, 1, 2, 3 ]
+
+def testBinParticles():
+    values = np.array( [ 5.0, 10.0, 50.0, 500.0, 5000.0, -1.0, 50.0 ] )
+    imageIndex = np.array( [ 0, 0, 0, 1, 1, 1, 1 ] )
+    percentWeights = np.arange( len( values ), dtype=np.float64 )
+    counts, sizes, percents, countedElements = results.binParticles( values, imageIndex, 2, poreSizeRangeArray, percentWeights )
+    assert countedElements == 5
+    assert counts.tolist() == [ [ 0, 1, 1, 0 ], [ 0, 0, 1, 2 ] ]
+    assert sizes.tolist() == [ [ 0, 5, 50, 0 ], [ 0, 0, 50, 5500 ] ]
+    assert percents.tolist() == [ [ 0, 0, 2, 0 ], [ 0, 0, 6, 7 ] ]
+
+def testBinPoreAreasMatchesTheBuckets():
+    areas = np.array( [ 10.0, 20.0, 200.0, 2000.0 ] )
+    imageResult = results.binPoreAreas( 'image', 1.0, areas, ( 100, 100 ), poreSizeRangeArray )
+    assert imageResult.poreCountArray == [ 0, 0, 1, 2 ]
+    assert imageResult.poreSizeArray == [ 0, 0, 20, 2200 ]
+    assert np.allclose( imageResult.poreSizePercentArray, [ 0, 0, 0.2, 22 ] )
+    assert imageResult.processedElements == 4
+
+def getCellTexts( values, digits = None ):
+    cells = results.formatCells( values, digits )
+    return [ bytes( cell[cell != 0] ).decode() for cell in cells ]
+
+def testFormatCellsLikeRound():
+    rng = np.random.default_rng( 0 )
+    # midpoints like 2.675 and 1.005 are not exact in binary, large values, zero and not finite values
+    values = np.concatenate( ( rng.random( 20000 ) * 100, rng.lognormal( 10, 5, 2000 ), np.round( rng.random( 2000 ) * 100, 3 ), [ 2.675, 1.005, 0.285, 0.125, 1e-5, 0.0, 99.995, 9e13, 1e20, np.nan, np.inf ] ) )
+    for digits in ( 2, 3, 5 ):
+        assert getCellTexts( values, digits ) == [ ',' + str( round( value, digits ) ) for value in values.tolist() ]
+    counts = np.array( [ 0, 7, 10, 12345678901 ], dtype=np.int64 )
+    assert getCellTexts( counts ) == [ ',' + str( value ) for value in counts.tolist() ]
+
+@pytest.mark.parametrize( 'calculatePoreDiameter', [ False, True ] )
+def testResultTablesEqualTheStringConcatenation( tmp_path, calculatePoreDiameter ):
+    rng = np.random.default_rng( 1 )
+    imageResults = [ results.binPoreAreas( 'image_' + str( i ), 2.0, np.round( rng.lognormal( 4, 1.5, 300 ) ), ( 640, 480 ), defaultPoreSizeRangeArray, calculatePoreDiameter ) for i in range( 7 ) ]
+    imageFiles = [ imageResult.filename + '.tif' for imageResult in imageResults ]
+    ( tmp_path / 'reference' ).mkdir()
+    ( tmp_path / 'tables' ).mkdir()
+    benchmark.writeResultTablesReference( imageResults, imageFiles, str( tmp_path / 'reference' ), defaultPoreSizeRangeArray, calculatePoreDiameter )
+    results.writeResultTables( results.FolderResult( str( tmp_path ), defaultPoreSizeRangeArray, imageResults ), imageFiles, str( tmp_path / 'tables' ), 0, calculatePoreDiameter )
+    for tableName in ( 'results.csv', 'mr_result.csv' ):
+        assert ( tmp_path / 'tables' / tableName ).read_text() == ( tmp_path / 'reference' / tableName ).read_text()
+
+@pytest.mark.parametrize( 'outputType', [ 1, 2, 3 ] )
+def testResultTablesOfEveryOutputType( tmp_path, outputType ):
+    rng = np.random.default_rng( 2 )
+    imageResults = [ results.binPoreAreas( 'image_' + str( i ), 2.0, np.round( rng.lognormal( 4, 1.5, 300 ) ), ( 640, 480 ), defaultPoreSizeRangeArray ) for i in range( 3 ) ]
+    folderResult = results.FolderResult( str( tmp_path ), defaultPoreSizeRangeArray, imageResults )
+    results.writeResultTables( folderResult, [ imageResult.filename + '.tif' for imageResult in imageResults ], str( tmp_path ), outputType )
+    imageValues = folderResult.getCounts() if outputType == 2 else folderResult.getSizes()
+    lines = ( tmp_path / 'results.csv' ).read_text().splitlines()
+    for imageResult, line, values in zip( imageResults, lines[1:], imageValues.tolist() ):
+        assert line == imageResult.filename + '.tif' + ''.join( ',' + str( value if outputType == 2 else round( value, 2 ) ) for value in values )
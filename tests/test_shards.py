@@ -0,0 +1,38 @@
+#########################################################
+# Merging the partial results of shards
+#
+# run from the repository folder: python -m pytest -q
+#
+#########################################################
+
+import itertools
+
+import pytest
+
+from pore_analysis import shards
+
+def createRecord( processedElements ):
+    return { 'engine': 'numpy', 'segmented': True, 'pixelSize': 2.0, 'imageSize': [ 640, 480 ], 'processedElements': processedElements, 'counts': [ 0, processedElements ], 'sizes': [ 0.0, 1.5 * processedElements ], 'percents': [ 0.0, 0.1 ] }
+
+def createPartials():
+    # image 0/b.tif was analysed by two shards (e.g. a shard analysed again after its claim was removed)
+    return [
+        { 'images': { '0/a.tif': createRecord( 1 ), '0/b.tif': createRecord( 2 ) } },
+        { 'images': { '0/b.tif': createRecord( 2 ), '1/c.tif': createRecord( 3 ) } },
+        { 'images': { '1/d.tif': None } },
+        { 'images': {} }
+    ]
+
+def testMergeIsIndependentOfTheShardOrder():
+    partials = createPartials()
+    expected = shards.mergePartials( partials )
+    assert sorted( expected['images'] ) == [ '0/a.tif', '0/b.tif', '1/c.tif', '1/d.tif' ]
+    for order in itertools.permutations( partials ):
+        assert shards.mergePartials( list( order ) ) == expected
+
+def testDifferentResultsOfAnImageAreRejected():
+    partials = createPartials()
+    partials[2]['images']['0/a.tif'] = createRecord( 5 )
+    for order in itertools.permutations( partials ):
+        with pytest.raises( ValueError ):
+            shards.mergePartials( list( order ) )
@@ -0,0 +1,53 @@
+#########################################################
+# Tiled segmentation of synthetic images
+#
+# run from the repository folder: python -m pytest -q
+#
+#########################################################
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from pore_analysis import analysis, parallel, segmentation, synthetic, tiles
+
+def writeImage( directory, width, height, seed = 0 ):
+    image, poreAreas = synthetic.createImage( width, height + synthetic.infoBarHeight, seed )
+    path = str( directory / 'image.tif' )
+    Image.fromarray( image ).save( path )
+    return path
+
+# memory limits [MB] giving several tiles per row and column of the 400 x 300 px image
+@pytest.mark.parametrize( 'pipeline, backgroundShrink, memoryLimit', [ ( 'single', 1, 16 ), ( 'single', 2, 16 ), ( 'folder', 1, 8 ) ] )
+def testTiledSegmentationEqualsWholeImage( tmp_path, pipeline, backgroundShrink, memoryLimit ):
+    path = writeImage( tmp_path, 400, 300 )
+    radii = segmentation.getPipelineRadii( 400, pipeline )
+    assert tiles.getTileSize( memoryLimit, backgroundShrink, radii ) < 300
+    areas, mask = segmentation.segmentImage( path, 140, synthetic.infoBarHeight, 2.0, 1, 0, backgroundShrink, 1, pipeline )
+    tiledAreas, imageSize = tiles.segmentImageTiled( path, 140, synthetic.infoBarHeight, 2.0, 1, 0, memoryLimit, str( tmp_path ), backgroundShrink, pipeline )
+    assert imageSize == ( mask.shape[1], mask.shape[0] )
+    assert len( areas ) > 0
+    assert np.array_equal( tiledAreas, areas )
+
+@pytest.mark.parametrize( 'backgroundShrink, pipeline', [ ( 1, 'single' ), ( 0, 'single' ), ( 8, 'single' ), ( 1, 'folder' ) ] )
+def testMinimumMemoryLimit( backgroundShrink, pipeline ):
+    radii = segmentation.getPipelineRadii( 1200, pipeline )
+    minimumMemoryLimit = tiles.getMinimumMemoryLimit( backgroundShrink, radii )
+    assert tiles.getTileSize( minimumMemoryLimit, backgroundShrink, radii ) >= tiles.minimumTileSize
+    with pytest.raises( ValueError ):
+        tiles.getTileSize( minimumMemoryLimit - 1, backgroundShrink, radii )
+
+def testMemoryLimitOfTheFolderPipeline( tmp_path ):
+    # the wide radii of a scale folder image need more than the minimum of the single image pipeline
+    writeImage( tmp_path, 2000, 400 )
+    task = { 'directory': str( tmp_path ), 'filename': 'image.tif', 'memoryLimit': 20, 'backgroundShrink': 1, 'pipeline': 'single' }
+    assert tiles.getMinimumMemoryLimit() <= task['memoryLimit']
+    assert parallel.isTooLarge( task )
+    task['pipeline'] = 'folder'
+    with pytest.raises( ValueError ):
+        parallel.isTooLarge( task )
+
+def testMemoryLimitStoresNoMasks():
+    assert analysis.createConfig( { 'useNumpyEngine': True, 'memoryLimit': 100 } )['maskStorage'] == 'none'
+    assert analysis.createConfig( { 'useNumpyEngine': True, 'memoryLimit': 100, 'maskStorage': 'tiff' } )['maskStorage'] == 'none'
+    assert analysis.createConfig( { 'useNumpyEngine': True } )['maskStorage'] == 'compact'